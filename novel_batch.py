@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""批量章节生成
+
+从项目大纲中解析章节，把一段章节范围分发给多个提供商并行生成。
+每个提供商按自己的并发上限开若干工作线程，从同一个队列中取章节，
+速度快的提供商自然会分到更多章节。每章完成后立即回调写入项目。
+"""
+import queue
+import re
+import threading
+import time
+
+from novel_engine import JobCancelled
+
+CHINESE_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+                  "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+CHINESE_UNITS = {"十": 10, "百": 100, "千": 1000}
+
+CHAPTER_HEADING = re.compile(r"^\s*第\s*([0-9零〇一二两三四五六七八九十百千]+)\s*[章回节]\s*[:：、.\s]*(.*)$")
+FINAL_HEADING = re.compile(r"^\s*(?:最终章|终章|尾声)\s*[:：、.\s]*(.*)$")
+
+
+def chinese_to_int(text):
+    """把“十二”“一百零五”之类的中文数字（或阿拉伯数字）转换为整数"""
+    if text.isdigit():
+        return int(text)
+    total = 0
+    current = 0
+    for ch in text:
+        if ch in CHINESE_DIGITS:
+            current = CHINESE_DIGITS[ch]
+        elif ch in CHINESE_UNITS:
+            total += (current or 1) * CHINESE_UNITS[ch]
+            current = 0
+    return total + current
+
+
+def parse_outline_chapters(outline):
+    """从大纲中解析章节，返回 [{"number", "title", "outline"}]
+
+    识别“第N章 标题”形式的标题行，标题下直到下一个标题的内容作为该章的大纲；
+    “最终章/终章/尾声”编号为前一章加一。
+    """
+    chapters = []
+    current = None
+    for line in outline.splitlines():
+        match = CHAPTER_HEADING.match(line)
+        final = None if match else FINAL_HEADING.match(line)
+        if match or final:
+            if match:
+                number = chinese_to_int(match.group(1))
+                title = match.group(2).strip()
+            else:
+                number = (chapters[-1]["number"] + 1) if chapters else 1
+                title = final.group(1).strip()
+            current = {"number": number, "title": title, "lines": []}
+            chapters.append(current)
+        elif current is not None and line.strip():
+            current["lines"].append(line.strip())
+    return [{"number": c["number"], "title": c["title"], "outline": "\n".join(c["lines"])}
+            for c in chapters]
+
+
+class BatchRunner:
+    """按提供商并发上限分发章节生成任务
+
+    providers: {提供商: 并发数}
+    generate(job, provider, chapter) -> 正文，在工作线程中调用
+    on_chapter(job, chapter, provider, text) 每章完成后在工作线程中调用
+    on_start(job) 开始生成之前、on_end(job, report) 所有工作线程退出之后（包括
+    取消时）在任务线程中调用，用于创建和清理断点
+    """
+
+    def __init__(self, chapters, providers, generate, on_chapter, max_attempts=2, on_start=None, on_end=None):
+        self.chapters = list(chapters)
+        self.providers = dict(providers)
+        self.generate = generate
+        self.on_chapter = on_chapter
+        self.on_start = on_start
+        self.on_end = on_end
+        self.max_attempts = max_attempts
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.started = None
+        # 尚未完成（成功或最终失败）的章节数
+        self.remaining = len(self.chapters)
+        self.report = {
+            "total": len(self.chapters),
+            "done": 0,
+            "failed": [],
+            "chars": 0,
+            "by_provider": {name: 0 for name in self.providers},
+        }
+
+    def snapshot(self):
+        """当前进度和吞吐量"""
+        with self._lock:
+            report = dict(self.report)
+            report["failed"] = list(self.report["failed"])
+            report["by_provider"] = dict(self.report["by_provider"])
+        elapsed = time.monotonic() - self.started if self.started else 0
+        report["elapsed"] = elapsed
+        report["chapters_per_min"] = report["done"] / elapsed * 60 if elapsed else 0
+        report["chars_per_sec"] = report["chars"] / elapsed if elapsed else 0
+        return report
+
+    def run(self, job):
+        """在引擎任务中执行，全部完成后返回报告"""
+        self.started = time.monotonic()
+        if self.on_start is not None:
+            self.on_start(job)
+        for chapter in self.chapters:
+            self.queue.put((chapter, 1))
+
+        threads = []
+        for provider, concurrency in self.providers.items():
+            for i in range(max(1, concurrency)):
+                thread = threading.Thread(target=self._worker, args=(job, provider),
+                                          name=f"novel-batch-{provider}-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if self.on_end is not None:
+            self.on_end(job, self.snapshot())
+
+        job.check_cancelled()
+        return self.snapshot()
+
+    def _worker(self, job, provider):
+        while not job.cancelled:
+            with self._lock:
+                if self.remaining == 0:
+                    return
+            try:
+                # 其他线程失败的章节可能会被放回队列，队列暂时为空时继续等待
+                chapter, attempt = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                text = self.generate(job, provider, chapter)
+                job.check_cancelled()
+                self.on_chapter(job, chapter, provider, text)
+            except JobCancelled:
+                return
+            except Exception as e:
+                if attempt < self.max_attempts:
+                    # 放回队列，可能由其他提供商重试
+                    self.queue.put((chapter, attempt + 1))
+                else:
+                    with self._lock:
+                        self.remaining -= 1
+                        self.report["failed"].append((chapter["number"], str(e)))
+                    job.emit("batch_progress", self.snapshot())
+                continue
+            with self._lock:
+                self.remaining -= 1
+                self.report["done"] += 1
+                self.report["chars"] += len(text)
+                self.report["by_provider"][provider] += 1
+            job.emit("batch_progress", self.snapshot())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""基准测试
+
+在本地模拟提供商服务器（novel_mock_server）上测量：
+
+- generation：单次生成的总耗时（p50/p95）；
+- streaming：流式生成的首字延迟和总耗时；
+- batch：多提供商批量生成的章节吞吐量；
+- store：项目变大时 save_config、保存项目字段和追加章节的耗时；
+- dedup：近似重复索引每章的构建和检查耗时，以及复制段落与原文窗口边界
+  错开时的检出率（有漏检时直接失败）；
+- cold_start：命令行冷启动（list-projects）减去解释器本身启动的时间。
+
+结果以 JSON 写出，--compare 与之前的结果比较，超过容差的退步使退出码为 1：
+
+    python novel_bench.py --output bench.json
+    python novel_bench.py --quick --compare bench.json --tolerance 0.3
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from novel_core import DEFAULT_CONFIG, NovelCore
+from novel_dedup import DuplicateIndex, DuplicateMonitor
+from novel_mock_server import Distribution, MockProviderServer
+from novel_router import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = ("generation", "streaming", "batch", "store", "dedup", "cold_start")
+
+
+def make_core(root, endpoints, providers=("OpenAI",), **provider_options):
+    """在 root 下创建使用模拟服务器的 NovelCore"""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    config["project_dir"] = os.path.join(root, "projects")
+    config["cache"] = {"dir": os.path.join(root, "cache")}
+    config["current_provider"] = providers[0]
+    for provider in providers:
+        config["api_providers"][provider].update(api_key="bench", endpoint=endpoints[provider], **provider_options)
+    config_path = os.path.join(root, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return NovelCore(config_path)
+
+
+def run_job(core, func, *args, **kwargs):
+    """经引擎执行任务并等待结果"""
+    result = {}
+    core.engine.submit("bench", func, *args, on_done=lambda value: result.update(value=value),
+                       on_error=lambda error: result.update(error=error), **kwargs)
+    while core.engine.active_jobs():
+        core.engine.poll(timeout=0.05)
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def make_project(core, chapters=0, chapter_chars=3000):
+    """新建项目并直接写入 chapters 章（不经过后台写入线程）"""
+    outline = "\n".join(f"第{n}章 第{n}章的标题\n- 第{n}章的情节" for n in range(1, 201))
+    project = core.save_project({"title": f"基准项目{len(core.projects)}", "genre": "奇幻", "author": "",
+                                 "outline": outline, "characters": "林风：私家侦探", "setting": "新长安"})
+    core.writer.flush()
+    text = ("夜色渐深，长安城的灯火一盏接一盏地熄灭。" * (chapter_chars // 20 + 1))[:chapter_chars]
+    for n in range(1, chapters + 1):
+        core.store.put_chapter(project["id"], n, f"第{n}章\n{text}", summary=text[:100])
+    project["chapters"], project["summaries"] = core.store.lazy_texts(project["id"])
+    return project
+
+
+def result(name, value, unit, better="lower", **params):
+    return {"name": name, "value": value, "unit": unit, "better": better, "params": params}
+
+
+def bench_generation(server, quick):
+    """单次生成：非流式体验的总耗时（包含组装提示词、引擎调度和网络往返）"""
+    server.latency = Distribution("fixed:0.02")
+    server.tokens_per_second = 0
+    server.output_tokens = 400
+    count = 10 if quick else 50
+    with tempfile.TemporaryDirectory() as root:
+        core = make_core(root, server.endpoints())
+        try:
+            project = make_project(core, chapters=20)
+            totals = []
+            for _ in range(count):
+                started = time.perf_counter()
+                run_job(core, core.generate_content, project, "完整章节", "文学性", "中等", "", use_cache=False)
+                totals.append(time.perf_counter() - started)
+        finally:
+            core.close()
+    params = {"calls": count, "server_latency": 0.02}
+    return [result("generation.total.p50", percentile(totals, 50), "s", **params),
+            result("generation.total.p95", percentile(totals, 95), "s", **params)]
+
+
+def bench_streaming(server, quick):
+    """流式生成：首字延迟和总耗时，服务器以固定速度输出"""
+    server.latency = Distribution("lognormal:0.1,0.3")
+    server.tokens_per_second = 2000
+    server.output_tokens = 400
+    count = 10 if quick else 40
+    with tempfile.TemporaryDirectory() as root:
+        core = make_core(root, server.endpoints())
+        try:
+            project = make_project(core, chapters=20)
+            for _ in range(count):
+                run_job(core, core.generate_content, project, "完整章节", "文学性", "中等", "", use_cache=False)
+            calls = [call for call in core.metrics.records if call.error is None]
+        finally:
+            core.close()
+    first = [call.first_token for call in calls]
+    totals = [call.total for call in calls]
+    params = {"calls": count, "server_latency": "lognormal:0.1,0.3", "tokens_per_second": 2000}
+    return [result("streaming.first_token.p50", percentile(first, 50), "s", **params),
+            result("streaming.first_token.p95", percentile(first, 95), "s", **params),
+            result("streaming.total.p50", percentile(totals, 50), "s", **params)]
+
+
+def bench_batch(server, quick):
+    """批量生成：三个提供商各 4 路并发时的章节吞吐量"""
+    server.latency = Distribution("fixed:0.1")
+    server.tokens_per_second = 4000
+    server.output_tokens = 800
+    chapters = 12 if quick else 48
+    with tempfile.TemporaryDirectory() as root:
+        core = make_core(root, server.endpoints(), ("OpenAI", "Claude", "Gemini"), max_concurrency=4)
+        # 模拟服务器每次返回相同的文本，关闭近似重复检测以免章节被判为重复而重试
+        core.config["dedup"] = {"enabled": False}
+        try:
+            project = make_project(core)
+            runner = core.create_batch(project, 1, chapters, False, "文学性", "中等", "")
+            report = run_job(core, runner.run)
+        finally:
+            core.close()
+    params = {"chapters": chapters, "providers": 3, "concurrency": 4}
+    return [result("batch.chapters_per_min", report["chapters_per_min"], "chapters/min", "higher", **params),
+            result("batch.failed", len(report["failed"]), "chapters", **params)]
+
+
+def bench_store(server, quick):
+    """项目变大时各种保存操作的耗时（每次操作都等待写入磁盘）"""
+    sizes = (10, 100) if quick else (10, 100, 1000)
+    repeat = 10 if quick else 30
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as root:
+            core = make_core(root, server.endpoints())
+            try:
+                project = make_project(core, chapters=size)
+                timings = {"save_config": [], "save_project": [], "add_chapter": []}
+                for i in range(repeat):
+                    started = time.perf_counter()
+                    core.save_config()
+                    timings["save_config"].append(time.perf_counter() - started)
+
+                    data = {key: project[key] for key in ("title", "genre", "author", "outline",
+                                                          "characters", "setting")}
+                    data["characters"] += f"\n角色{i}"
+                    started = time.perf_counter()
+                    core.save_project(data, project)
+                    core.writer.flush()
+                    timings["save_project"].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    core.add_chapter(project, "新的一章\n" + "正文。" * 1000)
+                    core.writer.flush()
+                    timings["add_chapter"].append(time.perf_counter() - started)
+            finally:
+                core.close()
+        for name, values in timings.items():
+            results.append(result(f"store.{name}.{size}", percentile(values, 50), "s", chapters=size))
+    return results
+
+
+def bench_dedup(server, quick):
+    """近似重复检测：每章的索引和检查耗时；在原文前加上 0~475 字的新内容后复制，检查是否都能检出"""
+    rng = random.Random(1)
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+
+    def text(length):
+        return "".join(rng.choice(chars) for _ in range(length))
+
+    count = 50 if quick else 200
+    chapters = [(n, text(3000)) for n in range(1, count + 1)]
+    index = DuplicateIndex()
+    started = time.perf_counter()
+    index.build(chapters)
+    build = (time.perf_counter() - started) / count
+
+    checks = []
+    for _ in range(10 if quick else 40):
+        new = text(3000)
+        started = time.perf_counter()
+        monitor = DuplicateMonitor(index)
+        monitor.feed(new)
+        monitor.finish()
+        checks.append(time.perf_counter() - started)
+
+    detected = []
+    missed = []
+    for length, copied in ((5000, 4000), (3000, 3000)):
+        original = text(length)
+        index.update(0, original)
+        for offset in range(0, 500, 25):
+            monitor = DuplicateMonitor(index)
+            monitor.feed(text(offset) + original[:copied])
+            (detected if monitor.finish()["duplicate"] else missed).append((length, offset))
+    if missed:
+        raise AssertionError(f"复制段落未检出（章节字数, 偏移）: {missed}")
+    params = {"chapters": count, "chapter_chars": 3000}
+    return [result("dedup.build_per_chapter", build, "s", **params),
+            result("dedup.check_per_chapter.p50", percentile(checks, 50), "s", **params),
+            result("dedup.unaligned_recall", len(detected) / (len(detected) + len(missed)), "ratio", "higher")]
+
+
+def bench_cold_start(server, quick):
+    """命令行冷启动：list-projects 的耗时减去空解释器的启动时间"""
+    repeat = 3 if quick else 7
+
+    def measure(args):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            subprocess.run(args, check=True, stdout=subprocess.DEVNULL, cwd=HERE)
+            timings.append(time.perf_counter() - started)
+        return percentile(timings, 50)
+
+    with tempfile.TemporaryDirectory() as root:
+        core = make_core(root, server.endpoints())
+        try:
+            make_project(core, chapters=300)
+        finally:
+            core.close()
+        baseline = measure([sys.executable, "-c", "pass"])
+        total = measure([sys.executable, os.path.join(HERE, "novel_cli.py"), "--config",
+                         os.path.join(root, "config.json"), "list-projects"])
+    return [result("cold_start.list_projects", max(0.0, total - baseline), "s", chapters=300),
+            result("cold_start.interpreter", baseline, "s", better="info")]
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回退步的 [(名称, 基线值, 当前值)]"""
+    previous = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get(r["name"])
+        if old is None or r["better"] not in ("lower", "higher") or not old["value"]:
+            continue
+        change = (r["value"] - old["value"]) / old["value"]
+        if (r["better"] == "lower" and change > tolerance) or (r["better"] == "higher" and change < -tolerance):
+            regressions.append((r["name"], old["value"], r["value"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="novel_bench", description="基准测试（使用本地模拟提供商服务器）")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="只运行指定的基准，可重复")
+    parser.add_argument("--quick", action="store_true", help="缩小规模，快速检查")
+    parser.add_argument("--compare", help="与之前的结果 JSON 比较")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的退步比例")
+    args = parser.parse_args(argv)
+
+    results = []
+    with MockProviderServer(seed=1) as server:
+        for name in args.only or BENCHMARKS:
+            started = time.perf_counter()
+            items = globals()[f"bench_{name}"](server, args.quick)
+            results.extend(items)
+            print(f"{name}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            for item in items:
+                print(f"  {item['name']} = {item['value']:.4g} {item['unit']}", file=sys.stderr)
+
+    report = {"schema": 1, "timestamp": time.time(), "python": platform.python_version(),
+              "platform": platform.platform(), "quick": args.quick, "results": results}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, old, new in regressions:
+            print(f"退步: {name} {old:.4g} -> {new:.4g}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""生成结果缓存
+
+以完整请求（提供商、模型、提示词、参数）的哈希作为键：
+内存中保留最近使用的若干条（LRU），磁盘上每条一个文件，
+按总大小和存放时间淘汰。统计命中次数和节省的 token 数。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from novel_providers import estimate_tokens
+from novel_store import write_text
+
+
+class ResponseCache:
+    """两级响应缓存（内存 LRU + 磁盘）"""
+
+    def __init__(self, root="novel_cache", memory_entries=128, max_disk_mb=200, max_age_days=30):
+        self.root = root
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "saved_tokens": 0}
+        self._lock = threading.Lock()
+        # 磁盘占用在第一次写入时统计，之后增量维护
+        self._disk_bytes = None
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(provider, model, prompt, params):
+        """根据完整请求计算缓存键"""
+        request = {"provider": provider, "model": model, "prompt": prompt, "params": params}
+        data = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key, count_miss=True):
+        """查找缓存，未命中返回 None；count_miss 为 False 时未命中不计入统计"""
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None and time.time() - entry["created"] > self.max_age:
+                # 过期的条目不再使用，磁盘文件在下面删除
+                del self.memory[key]
+                entry = None
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                self.stats["saved_tokens"] += entry["tokens"]
+                return entry["text"]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and time.time() - entry["created"] > self.max_age:
+            removed = self._remove(path)
+            with self._lock:
+                if self._disk_bytes is not None:
+                    self._disk_bytes -= removed
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                if count_miss:
+                    self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self.stats["saved_tokens"] += entry["tokens"]
+            self._remember(key, entry)
+        # 更新修改时间，磁盘淘汰时按最近使用排序
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["text"]
+
+    def put(self, key, text, prompt=""):
+        """写入缓存"""
+        entry = {
+            "text": text,
+            "created": time.time(),
+            # 命中一次省下的 token：提示词 + 生成内容
+            "tokens": estimate_tokens(prompt) + estimate_tokens(text),
+        }
+        data = json.dumps(entry, ensure_ascii=False)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 覆盖同一 key（跳过缓存重新生成）时先减去旧文件的大小
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        write_text(path, data)
+
+        with self._lock:
+            self._remember(key, entry)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan()[1]
+            else:
+                self._disk_bytes += len(data.encode("utf-8")) - old_size
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self.evict()
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _remove(self, path):
+        """删除缓存文件，返回释放的字节数"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def _scan(self):
+        """列出磁盘上的缓存文件，返回 ([(mtime, size, path)], 总大小)"""
+        files = []
+        total = 0
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return files, total
+
+    def evict(self):
+        """删除过期文件，并按最近使用时间淘汰到总大小的 90% 以下"""
+        files, total = self._scan()
+        files.sort()
+        now = time.time()
+        target = self.max_disk_bytes * 0.9
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age and total <= target:
+                break
+            self._remove(path)
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self.memory.clear()
+        for _, _, path in self._scan()[0]:
+            self._remove(path)
+        with self._lock:
+            self._disk_bytes = 0
+
+    def summary(self):
+        """缓存统计的简短描述"""
+        with self._lock:
+            stats = dict(self.stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        total = hits + stats["misses"]
+        rate = hits / total * 100 if total else 0
+        return (f"缓存命中 {hits}/{total}（{rate:.0f}%，内存 {stats['memory_hits']}，"
+                f"磁盘 {stats['disk_hits']}），约节省 {stats['saved_tokens']} tokens")
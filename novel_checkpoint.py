@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""断点续写
+
+交互生成和批量章节边生成边把进度写入项目存储目录下的 checkpoints/，程序崩溃、
+窗口被关闭、网络中断或提供商超时之后，下次启动时从断点继续，而不是从头再来：
+
+- <id>.json 记录任务类型和参数，原子替换写入；
+- <id>.<名称>.part 为流式输出已经收到的部分，追加写入，每 flush_chars 字或
+  flush_interval 秒刷新一次，崩溃时最多丢失这么多内容；
+- 恢复时保留已生成部分中完整的句子，请提供商从断点处接着写（continuation
+  模板），太短的部分直接丢弃重新生成；
+- 批量任务记录开始时各章内容的哈希，当前内容与之不同的章节视为已完成，
+  恢复时不再生成——包括写入日志之后、更新断点之前崩溃的章节。
+
+任务正常结束或被用户放弃时删除断点；因退出而中断（job.suspended）或失败时
+保留。本机生成的断点 id 以 cp- 开头；服务器任务使用 server-<任务编号>，由
+服务器重新执行任务时自己恢复。
+"""
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+
+from novel_store import write_text
+
+FLUSH_CHARS = 200
+FLUSH_INTERVAL = 2.0
+# 已生成部分少于这么多字时不续写，直接重新生成
+RESUME_MIN_CHARS = 200
+# 续写提示词中附上已生成部分末尾的字数
+RESUME_TAIL_CHARS = 1500
+SENTENCE_ENDS = set("。！？!?…”」』\n")
+LOCAL_PREFIX = "cp-"
+
+
+def resume_point(text, min_chars=RESUME_MIN_CHARS):
+    """已生成部分中可以接着写的前缀：截到最后一个完整的句子，太短时返回空串"""
+    for i in range(len(text) - 1, min_chars - 2, -1):
+        if text[i] in SENTENCE_ENDS:
+            return text[:i + 1]
+    return ""
+
+
+class PartialText:
+    """一段流式输出的断点文件，只在一个工作线程中写入"""
+
+    def __init__(self, path, flush_chars=FLUSH_CHARS, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_chars = flush_chars
+        self.flush_interval = flush_interval
+        self.base = ""
+        self._buffer = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def read(self):
+        """上次记录的内容；崩溃时最后一个字可能只写了一半，忽略"""
+        try:
+            with open(self.path, "rb") as f:
+                return f.read().decode("utf-8", "ignore")
+        except FileNotFoundError:
+            return ""
+
+    def begin(self, base=""):
+        """从 base（续写时保留的部分）开始记录"""
+        self.base = base
+        self._buffer = []
+        self._pending = 0
+        write_text(self.path, base)
+        self._last_flush = time.monotonic()
+
+    def write(self, chunk):
+        self._buffer.append(chunk)
+        self._pending += len(chunk)
+        if self._pending >= self.flush_chars or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def restart(self):
+        """换用其他提供商重新生成，之前收到的片段作废"""
+        self.begin(self.base)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(self._buffer))
+        self._buffer = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def discard(self):
+        self._buffer = []
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Checkpoint:
+    """一个可恢复任务的断点，state 为 {"kind", "project", "params", ...}"""
+
+    def __init__(self, store, checkpoint_id, state):
+        self.store = store
+        self.id = checkpoint_id
+        self.state = state
+        self._lock = threading.RLock()
+
+    @property
+    def kind(self):
+        return self.state["kind"]
+
+    @property
+    def project(self):
+        return self.state["project"]
+
+    def update(self, **changes):
+        """修改并原子写入，可以在多个工作线程中调用"""
+        with self._lock:
+            self.state.update(changes)
+            self.state["updated"] = datetime.datetime.now().isoformat(timespec="seconds")
+            write_text(self.store.path(self.id), json.dumps(self.state, ensure_ascii=False, indent=2))
+
+    def mark_done(self, number):
+        """批量任务的一章已写入项目"""
+        with self._lock:
+            self.update(done=sorted(set(self.state.get("done", [])) | {number}))
+
+    def part(self, name="text"):
+        return PartialText(self.store.part_path(self.id, name), self.store.flush_chars, self.store.flush_interval)
+
+    def remove(self):
+        self.store.remove(self.id)
+
+
+class CheckpointStore:
+    """checkpoints 目录，线程安全"""
+
+    def __init__(self, root, flush_chars=FLUSH_CHARS, flush_interval=FLUSH_INTERVAL):
+        self.root = root
+        self.flush_chars = flush_chars
+        self.flush_interval = flush_interval
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, checkpoint_id):
+        return os.path.join(self.root, f"{checkpoint_id}.json")
+
+    def part_path(self, checkpoint_id, name):
+        return os.path.join(self.root, f"{checkpoint_id}.{name}.part")
+
+    def create(self, kind, project_id, params, checkpoint_id=None, **extra):
+        """新建断点并写入磁盘；checkpoint_id 为空时生成本机断点 id"""
+        if checkpoint_id is None:
+            checkpoint_id = f"{LOCAL_PREFIX}{datetime.datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        state = {"kind": kind, "project": project_id, "params": params, "created": now}
+        state.update(extra)
+        checkpoint = Checkpoint(self, checkpoint_id, state)
+        checkpoint.update()
+        return checkpoint
+
+    def get(self, checkpoint_id):
+        """读取断点，不存在或损坏时返回 None"""
+        try:
+            with open(self.path(checkpoint_id), "r", encoding="utf-8") as f:
+                return Checkpoint(self, checkpoint_id, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def pending(self, prefix=LOCAL_PREFIX):
+        """id 以 prefix 开头的断点，按创建时间排列"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        checkpoints = [self.get(name[:-5]) for name in names if name.startswith(prefix) and name.endswith(".json")]
+        return sorted((c for c in checkpoints if c is not None), key=lambda c: c.state.get("created", ""))
+
+    def remove(self, checkpoint_id):
+        """删除断点和它的全部 .part 文件"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name == f"{checkpoint_id}.json" or (name.startswith(f"{checkpoint_id}.") and name.endswith(".part")):
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+
+    def remove_project(self, project_id):
+        """项目删除后丢弃它的断点"""
+        for checkpoint in self.pending(prefix=""):
+            if checkpoint.project == project_id:
+                checkpoint.remove()
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""命令行入口
+
+    python novel_cli.py list-projects
+    python novel_cli.py generate --project 标题 [--type 完整章节] [--insert]
+    python novel_cli.py batch --project 标题 --start 1 --end 10
+    python novel_cli.py export --project 标题 --output 小说.epub   # 也可以是 .txt / .md
+    python novel_cli.py search 莲花印记 [--project 标题]
+    python novel_cli.py history --project 标题 --chapter 3 [--diff 修订 | --show 修订 | --restore 修订]   # 修订为 #序号或哈希前缀
+    python novel_cli.py entities --project 标题 [--conflicts]
+    python novel_cli.py resume [--list | --discard ID | ID ...]   # 继续上次中断的生成和批量任务
+    python novel_cli.py --metrics calls.jsonl batch ...   # 结束时导出本次的调用指标（.prom 为 Prometheus 格式）
+    python novel_cli.py [--token 口令] serve [--host 0.0.0.0] [--port 8765]   # 服务器模式，多人共用
+    python novel_cli.py --remote http://主机:8765 [--token 口令]              # 图形界面连接服务器
+
+不带子命令时启动图形界面。命令行模式不导入 tkinter，可以在没有显示器的服务器上运行。
+"""
+import argparse
+import datetime
+import sys
+
+from novel_core import (CONFIG_PATH, GENERATE_TYPES, LENGTHS, ROUTING_LABELS, SEARCH_FIELDS, STYLES, NovelCore,
+                        format_batch_report, format_conflict)
+
+
+def run_job(core, job):
+    """在前台等待引擎任务结束，Ctrl+C 中断任务（生成和批量任务保留断点）"""
+    try:
+        while core.engine.active_jobs():
+            core.engine.poll(timeout=0.1)
+    except KeyboardInterrupt:
+        job.cancel(suspend=True)
+        # 分发取消通知和已写入磁盘的结果
+        while core.engine.active_jobs():
+            core.engine.poll(timeout=0.1)
+
+
+def get_project(core, title):
+    project = core.find_project(title)
+    if project is None:
+        raise SystemExit(f"项目不存在: {title}")
+    return project
+
+
+def cmd_list_projects(core, args):
+    for project in core.projects:
+        print(f"{project['id']}\t{project['title']}\t{len(project['chapters'])} 章")
+    return 0
+
+
+def cmd_generate(core, args):
+    project = get_project(core, args.project)
+    if args.provider:
+        core.config["current_provider"] = args.provider
+    if args.policy:
+        core.config.setdefault("routing", {})["policy"] = args.policy
+    if args.dry_run:
+        prompt, _ = core.content_prompt(project, args.type, args.style, args.length, args.prompt)
+        print(prompt)
+        return 0
+    return run_generation(core, project, args.insert, args.type, args.style, args.length, args.prompt,
+                          use_cache=not args.no_cache)
+
+
+def run_generation(core, project, insert, *args, **kwargs):
+    """执行 core.generate_content，正文输出到标准输出"""
+    result = {}
+
+    def on_event(name, payload):
+        if name == "chunk":
+            sys.stdout.write(payload)
+            sys.stdout.flush()
+        elif name == "restart":
+            print(f"\n[切换到 {payload} 重新生成]", file=sys.stderr)
+        elif name == "resumed":
+            print(f"[从断点继续，已生成 {payload} 字]", file=sys.stderr)
+        elif name == "duplicate":
+            chapters = "、".join(f"第{n}章" for n in payload["chapters"][:3])
+            print(f"\n[与{chapters}近似重复，重复 {payload['ratio']:.0%}]", file=sys.stderr)
+        elif name == "entity_conflicts":
+            for conflict in payload:
+                print(f"\n[可能与设定矛盾：{format_conflict(conflict)}]", file=sys.stderr)
+
+    def on_error(error):
+        result["error"] = error
+
+    job = core.engine.submit("generate", core.generate_content, project, *args, on_event=on_event,
+                             on_done=lambda text: result.update(text=text), on_error=on_error, **kwargs)
+    run_job(core, job)
+    sys.stdout.write("\n")
+    if "error" in result:
+        print(f"生成失败: {result['error']}（已保存断点，可用 resume 继续）", file=sys.stderr)
+        return 1
+    if "text" not in result:
+        print("生成已中断，已保存断点，可用 resume 继续", file=sys.stderr)
+        return 130
+    if insert:
+        number = core.add_chapter(project, result["text"])
+        print(f"已添加为第 {number} 章", file=sys.stderr)
+    return 0
+
+
+def cmd_batch(core, args):
+    project = get_project(core, args.project)
+    try:
+        runner = core.create_batch(project, args.start, args.end, args.overwrite,
+                                   args.style, args.length, args.prompt)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return run_batch(core, project, runner)
+
+
+def run_batch(core, project, runner):
+    """执行批量任务，进度输出到标准错误"""
+    result = {}
+
+    def on_event(name, payload):
+        if name == "chapter_done":
+            number, text, summary = payload
+            project["chapters"][number] = text
+            project["summaries"][number] = summary
+        elif name == "entity_conflicts":
+            for conflict in payload:
+                print(f"可能与设定矛盾：{format_conflict(conflict)}", file=sys.stderr)
+        elif name == "batch_progress":
+            print(format_batch_report(payload), file=sys.stderr)
+
+    def on_error(error):
+        result["error"] = error
+
+    print(f"批量生成 {len(runner.chapters)} 章，使用 {', '.join(runner.providers)}", file=sys.stderr)
+    job = core.engine.submit("batch", runner.run, on_event=on_event,
+                             on_done=lambda report: result.update(report=report), on_error=on_error)
+    run_job(core, job)
+    if "error" in result:
+        print(f"批量生成失败: {result['error']}", file=sys.stderr)
+        return 1
+    report = result.get("report") or runner.snapshot()
+    for number, error in report["failed"]:
+        print(f"第 {number} 章失败: {error}", file=sys.stderr)
+    print(f"{'完成' if 'report' in result else '已中断'}：{format_batch_report(report)}，"
+          f"用时 {report['elapsed']:.0f}s", file=sys.stderr)
+    if "report" not in result:
+        print("已保存断点，可用 resume 继续，已完成的章节不会重新生成", file=sys.stderr)
+        return 130
+    if report["failed"]:
+        print("失败的章节已保存断点，可用 resume 重试", file=sys.stderr)
+    return 1 if report["failed"] else 0
+
+
+def cmd_export(core, args):
+    project = get_project(core, args.project)
+    result = {}
+
+    def on_event(name, payload):
+        if name == "export_progress":
+            done, total = payload
+            print(f"\r导出 {done}/{total} 章", end="", file=sys.stderr)
+
+    def on_error(error):
+        result["error"] = error
+
+    job = core.engine.submit("export", core.export_project, project, args.output, args.format,
+                             include_settings=not args.chapters_only, incremental=not args.full,
+                             on_event=on_event, on_done=lambda report: result.update(report=report),
+                             on_error=on_error)
+    run_job(core, job)
+    print(file=sys.stderr)
+    if "error" in result:
+        print(f"导出失败: {result['error']}", file=sys.stderr)
+        return 1
+    if "report" not in result:
+        print("导出已取消", file=sys.stderr)
+        return 130
+    report = result["report"]
+    print(f"已导出到: {report['path']}（{report['chapters']} 章，重写 {report['written']} 章，"
+          f"{report['elapsed']:.2f}s）", file=sys.stderr)
+    return 0
+
+
+def cmd_search(core, args):
+    project_id = get_project(core, args.project)["id"] if args.project else None
+    for result in core.search(args.query, args.limit, project_id):
+        print(f"{result['title']}\t{result['location']}\t{result['snippet']}")
+    return 0
+
+
+def cmd_history(core, args):
+    project = get_project(core, args.project)
+    target = args.chapter if args.chapter is not None else args.field
+    try:
+        if args.show:
+            print(core.history_text(project, target, args.show))
+        elif args.diff:
+            print("\n".join(core.history_diff(project, target, args.diff, args.against)))
+        elif args.restore:
+            core.restore_revision(project, target, args.restore)
+            print(f"已恢复为修订 {args.restore}", file=sys.stderr)
+        else:
+            for revision in core.history(project, target):
+                stamp = datetime.datetime.fromtimestamp(revision["time"]).strftime("%Y-%m-%d %H:%M:%S")
+                print(f"#{revision['index']}\t{revision['hash'][:10]}\t{stamp}\t{revision['source']}\t"
+                      f"{revision['size']} 字\t+{revision['added']}/-{revision['removed']}")
+    except KeyError as e:
+        print(f"没有这个修订: {e.args[0]}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_entities(core, args):
+    project = get_project(core, args.project)
+    report = core.entity_report(project)
+    if not args.conflicts:
+        for entity in report["entities"]:
+            chapters = entity["chapters"]
+            appeared = f"{len(chapters)} 章（第{chapters[0]}-{chapters[-1]}章）" if chapters else "未出现"
+            attributes = "，".join(f"{key}：{value}" for key, value in entity["attributes"].items())
+            print(f"{entity['name']}\t{SEARCH_FIELDS[entity['field']]}\t{'、'.join(entity['aliases'])}\t"
+                  f"{attributes}\t{appeared}\t{entity['count']} 次")
+    for conflict in report["conflicts"]:
+        print(f"可能矛盾：{format_conflict(conflict)}", file=sys.stdout if args.conflicts else sys.stderr)
+    return 1 if args.conflicts and report["conflicts"] else 0
+
+
+def cmd_resume(core, args):
+    checkpoints = core.pending_checkpoints()
+    if args.discard:
+        discard = [c for c in checkpoints if args.discard in ("all", c.id)]
+        if not discard:
+            raise SystemExit(f"断点不存在: {args.discard}")
+        for checkpoint in discard:
+            checkpoint.remove()
+            print(f"已放弃 {checkpoint.id}", file=sys.stderr)
+        return 0
+    if args.list or not checkpoints:
+        for checkpoint in checkpoints:
+            print(f"{checkpoint.id}\t{core.describe_checkpoint(checkpoint)}")
+        if not checkpoints:
+            print("没有未完成的任务", file=sys.stderr)
+        return 0
+    if args.ids:
+        unknown = set(args.ids) - {c.id for c in checkpoints}
+        if unknown:
+            raise SystemExit(f"断点不存在: {', '.join(sorted(unknown))}")
+        checkpoints = [c for c in checkpoints if c.id in args.ids]
+    status = 0
+    for checkpoint in checkpoints:
+        print(f"继续 {core.describe_checkpoint(checkpoint)}", file=sys.stderr)
+        project = core.find_project(checkpoint.project)
+        params = checkpoint.state["params"]
+        if checkpoint.kind == "batch":
+            try:
+                runner = core.create_batch(project, checkpoint_id=checkpoint.id, **params)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                continue
+            status = run_batch(core, project, runner) or status
+        else:
+            status = run_generation(core, project, args.insert, checkpoint_id=checkpoint.id, **params) or status
+        if status == 130:
+            break
+    return status
+
+
+def cmd_serve(core, args):
+    import novel_server
+    novel_server.serve(core, args.host, args.port, args.token, args.max_jobs)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="novel_cli", description="AI小说创作工具（命令行）")
+    parser.add_argument("--config", default=CONFIG_PATH, help="配置文件路径")
+    parser.add_argument("--metrics", help="结束时把调用指标导出到此文件（.jsonl 或 .prom）")
+    parser.add_argument("--remote", help="图形界面连接此地址的服务器（serve 启动），不使用本地项目")
+    parser.add_argument("--token", help="服务器口令")
+    parser.add_argument("--user", help="在服务器上显示的用户名（默认为当前登录用户）")
+    commands = parser.add_subparsers(dest="command")
+
+    commands.add_parser("list-projects", help="列出所有项目")
+
+    def add_generation_options(command):
+        command.add_argument("--project", required=True, help="项目标题或 id")
+        command.add_argument("--style", default="文学性", choices=STYLES)
+        command.add_argument("--length", default="中等", choices=LENGTHS)
+        command.add_argument("--prompt", default="", help="额外要求")
+
+    generate = commands.add_parser("generate", help="生成内容并输出到标准输出")
+    add_generation_options(generate)
+    generate.add_argument("--type", default=GENERATE_TYPES[0], choices=GENERATE_TYPES)
+    generate.add_argument("--provider", help="本次使用的提供商（默认为配置中的当前提供商）")
+    generate.add_argument("--policy", choices=list(ROUTING_LABELS), help="本次使用的路由策略")
+    generate.add_argument("--no-cache", action="store_true", help="跳过缓存重新生成")
+    generate.add_argument("--insert", action="store_true", help="生成后追加为项目的新章节")
+    generate.add_argument("--dry-run", action="store_true", help="只输出按模板渲染的提示词，不调用提供商")
+
+    batch = commands.add_parser("batch", help="按大纲批量生成章节")
+    add_generation_options(batch)
+    batch.add_argument("--start", type=int, default=1)
+    batch.add_argument("--end", type=int, default=10)
+    batch.add_argument("--overwrite", action="store_true", help="覆盖已有章节")
+
+    export = commands.add_parser("export", help="导出整部小说（TXT、Markdown 或 EPUB）")
+    export.add_argument("--project", required=True, help="项目标题或 id")
+    export.add_argument("--output", required=True, help="输出文件，按扩展名确定格式")
+    export.add_argument("--format", choices=["txt", "md", "epub"], help="导出格式（默认按扩展名）")
+    export.add_argument("--chapters-only", action="store_true", help="不包含大纲、角色和世界观")
+    export.add_argument("--full", action="store_true", help="完整重新导出，不复用上次的结果")
+
+    search = commands.add_parser("search", help="全文检索所有项目")
+    search.add_argument("query")
+    search.add_argument("--project", help="只检索这个项目")
+    search.add_argument("--limit", type=int, default=20)
+
+    history = commands.add_parser("history", help="字段或章节的版本历史（修订为 #序号、#负数倒数或哈希前缀）")
+    history.add_argument("--project", required=True, help="项目标题或 id")
+    target = history.add_mutually_exclusive_group(required=True)
+    target.add_argument("--chapter", type=int, help="章节编号")
+    target.add_argument("--field", choices=["outline", "characters", "setting"])
+    action = history.add_mutually_exclusive_group()
+    action.add_argument("--show", help="输出修订的全文")
+    action.add_argument("--diff", help="与当前内容（或 --against 指定的修订）比较")
+    action.add_argument("--restore", help="恢复为该修订")
+    history.add_argument("--against", help="与 --diff 一起使用")
+
+    entities = commands.add_parser("entities", help="角色和世界观条目在各章的出现情况，以及与设定矛盾之处")
+    entities.add_argument("--project", required=True, help="项目标题或 id")
+    entities.add_argument("--conflicts", action="store_true", help="只输出矛盾，有矛盾时退出码为 1")
+
+    resume = commands.add_parser("resume", help="继续上次中断的生成和批量任务（默认全部）")
+    resume.add_argument("ids", nargs="*", metavar="ID", help="只继续这些断点")
+    resume.add_argument("--list", action="store_true", help="列出未完成的任务")
+    resume.add_argument("--discard", metavar="ID", help="放弃断点（all 为全部）")
+    resume.add_argument("--insert", action="store_true", help="续写完成的内容追加为项目的新章节")
+
+    serve = commands.add_parser("serve", help="以服务器模式运行，供多个图形界面共用")
+    serve.add_argument("--host", default="127.0.0.1", help="监听地址（0.0.0.0 允许其他机器连接）")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--max-jobs", type=int, default=4, help="同时执行的任务数")
+    return parser
+
+
+COMMANDS = {
+    "list-projects": cmd_list_projects,
+    "generate": cmd_generate,
+    "batch": cmd_batch,
+    "export": cmd_export,
+    "search": cmd_search,
+    "history": cmd_history,
+    "entities": cmd_entities,
+    "resume": cmd_resume,
+    "serve": cmd_serve,
+}
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.remote and args.command is not None:
+        parser.error("--remote 只用于图形界面，命令行子命令在服务器所在的机器上运行")
+    if args.command is None:
+        # 只有图形界面才需要 tkinter
+        import novel_creator
+        if args.remote:
+            from novel_remote import RemoteCore
+            novel_creator.main(RemoteCore(args.remote, args.token, args.user))
+        else:
+            novel_creator.main()
+        return 0
+
+    core = NovelCore(args.config)
+    if core.config_error:
+        backup_path, error = core.config_error
+        print(f"无法读取配置文件，已使用默认配置，原文件已备份为 {backup_path}: {error}", file=sys.stderr)
+    try:
+        return COMMANDS[args.command](core, args)
+    finally:
+        core.close()
+        if args.metrics:
+            core.metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
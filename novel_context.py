@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""生成上下文组装
+
+后面的章节需要大纲、角色、世界观和前文作为上下文，全部发送会让请求随小说
+变长而越来越大。这里按提供商的 token 预算裁剪上下文：
+
+- 每章插入时计算一次摘要（抽取开头和结尾的句子，不调用模型），与章节一起保存；
+- 生成时把本章之前的章节摘要拼成前情提要，越早的章节压缩得越短，超出预算的
+  最早章节从略；
+- 大纲、角色、世界观和上一章结尾各有上限，剩余预算都留给前情提要。
+
+这样提示词大小只取决于预算，不随章节数增长。
+"""
+import re
+
+from novel_batch import CHAPTER_HEADING, FINAL_HEADING
+from novel_providers import CONTEXT_WINDOWS, estimate_tokens
+
+# 默认的提示词预算（token），提供商配置中可用 prompt_tokens 覆盖
+DEFAULT_PROMPT_TOKENS = 6000
+# 每章摘要的上限
+SUMMARY_TOKENS = 120
+
+SENTENCE = re.compile(r"[^。！？!?…\n]+[。！？!?…]*[”’」』\"']*")
+
+
+def prompt_budget(provider, provider_config, max_tokens):
+    """提示词可用的 token 数：不超过 prompt_tokens，也不超过上下文窗口减去输出长度"""
+    window = int(provider_config.get("context_tokens") or CONTEXT_WINDOWS.get(provider, 8192))
+    budget = int(provider_config.get("prompt_tokens", DEFAULT_PROMPT_TOKENS))
+    return max(0, min(budget, window - max_tokens))
+
+
+def split_sentences(text):
+    """按中英文句末标点切分句子"""
+    return [s.strip() for s in SENTENCE.findall(text) if s.strip()]
+
+
+def truncate(text, max_tokens, keep_end=False):
+    """把文本截断到 max_tokens 以内，keep_end 为 True 时保留结尾"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    # 先按比例估算长度，再逐步缩短到预算以内
+    length = int(len(text) * max_tokens / tokens)
+    while length > 0:
+        part = text[-length:] if keep_end else text[:length]
+        if estimate_tokens(part) <= max_tokens:
+            return ("…" + part) if keep_end else (part + "…")
+        length = int(length * 0.9)
+    return ""
+
+
+def summarize_chapter(text, max_tokens=SUMMARY_TOKENS):
+    """抽取式章节摘要：开头两句和结尾两句，按原文顺序，总长不超过 max_tokens"""
+    lines = text.strip().splitlines()
+    # 去掉“第N章 标题”标题行
+    if lines and (CHAPTER_HEADING.match(lines[0]) or FINAL_HEADING.match(lines[0])):
+        lines = lines[1:]
+    sentences = split_sentences("\n".join(lines))
+    if not sentences:
+        return ""
+    picked = sorted(set(range(min(2, len(sentences)))) | set(range(max(0, len(sentences) - 2), len(sentences))))
+    # 每句平分预算，过长的句子截断
+    per_sentence = max(8, max_tokens // len(picked))
+    parts = []
+    for prev, i in zip([None] + picked, picked):
+        if prev is not None and i - prev > 1:
+            parts.append("……")
+        parts.append(truncate(sentences[i], per_sentence))
+    return truncate("".join(parts), max_tokens)
+
+
+def rolling_summary(summaries, before, max_tokens):
+    """把 before 之前各章的摘要拼成前情提要，总长不超过 max_tokens
+
+    从最近的章节往前填：最近的章节使用完整摘要，预算用掉一半后只保留
+    摘要的第一句，放不下的最早章节合并为一行“从略”。
+    """
+    # 摘要按需读取，放不下的章节不会被读取
+    numbers = sorted((n for n in list(summaries) if n < before), reverse=True)
+    lines = []
+    used = 0
+    omitted = []
+    for n in numbers:
+        if omitted:
+            omitted.append(n)
+            continue
+        summary = summaries.get(n, "")
+        if used > max_tokens / 2:
+            sentences = split_sentences(summary)
+            summary = sentences[0] if sentences else summary
+        line = f"第{n}章：{summary}"
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > max_tokens:
+            omitted.append(n)
+            continue
+        lines.append(line)
+        used += tokens
+    lines.reverse()
+    if omitted:
+        lines.insert(0, f"（第{min(omitted)}-{max(omitted)}章从略）")
+    return "\n".join(lines)
+
+
+def build_context(project, target, budget, entities=None, focus=""):
+    """按预算组装上下文，返回 {"outline", "characters", "setting", "recap", "previous"}
+
+    target 为正在生成的章节编号；各部分的上限按预算比例分配，
+    没用完的部分留给前情提要。缺少的部分为空字符串。entities 为项目的
+    EntityIndex 时，角色和世界观只放入与 focus（本章大纲、额外要求）、
+    上一章结尾和最近几章相关的条目，见 novel_entities。
+    """
+    context = {}
+    remaining = budget
+    chapters = project.get("chapters") or {}
+    previous_text = chapters.get(target - 1)
+    context["previous"] = ""
+    if previous_text:
+        # 上一章只附带结尾，保持衔接
+        context["previous"] = truncate(previous_text[-1000:], int(budget * 0.15), keep_end=True)
+        remaining -= estimate_tokens(context["previous"])
+
+    # 设定类内容截断时保留开头
+    for key, share in (("outline", 0.25), ("characters", 0.15), ("setting", 0.1)):
+        selected = None
+        if entities is not None and key != "outline":
+            selected = entities.select(key, f"{focus}\n{context['previous']}", target, int(budget * share))
+        context[key] = selected if selected is not None else truncate(project.get(key) or "", int(budget * share))
+        remaining -= estimate_tokens(context[key])
+
+    context["recap"] = rolling_summary(project.get("summaries") or {}, target, remaining)
+    return context
@@ -0,0 +1,950 @@
+# -*- coding: utf-8 -*-
+"""小说创作核心
+
+项目模型、配置读写、提示词组装、提供商调用和批量生成，不依赖 tkinter。
+图形界面（novel_creator.py）和命令行（novel_cli.py）共用这一层。
+"""
+import datetime
+import functools
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from novel_engine import GenerationEngine, JobCancelled
+from novel_providers import LENGTH_MAX_TOKENS, ProviderPool, estimate_tokens
+from novel_store import ProjectStore, StoreWriter, write_text
+from novel_cache import ResponseCache
+from novel_batch import BatchRunner, parse_outline_chapters
+from novel_context import DEFAULT_PROMPT_TOKENS, build_context, prompt_budget, summarize_chapter
+from novel_search import SearchIndex, make_snippet
+from novel_router import ProviderRouter
+from novel_scheduler import BATCH, INTERACTIVE, RequestScheduler
+from novel_metrics import CallRecord, MetricsRecorder, estimate_cost
+from novel_templates import BUILTIN_TEMPLATES, PromptText, TemplateLibrary
+from novel_export import ProjectExporter
+from novel_dedup import DuplicateContentError, DuplicateIndex, DuplicateMonitor
+from novel_flight import SingleFlight
+from novel_entities import EntityIndex
+from novel_history import diff_lines
+from novel_checkpoint import RESUME_TAIL_CHARS, CheckpointStore, resume_point
+
+CONFIG_PATH = "novel_creator_config.json"
+
+DEFAULT_CONFIG = {
+    "api_providers": {
+        "OpenAI": {
+            "api_key": "",
+            "endpoint": "https://api.openai.com/v1/chat/completions"
+        },
+        "Claude": {
+            "api_key": "",
+            "endpoint": "https://api.anthropic.com/v1/messages"
+        },
+        "Gemini": {
+            "api_key": "",
+            "endpoint": "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+        }
+    },
+    "current_provider": "OpenAI",
+    "project_dir": "novel_projects"
+}
+
+# 多提供商路由的默认设置，config["routing"] 中的同名项覆盖
+DEFAULT_ROUTING = {
+    "policy": "failover",
+    "hedge_percentile": 95,
+    "hedge_min_delay": 1.0,
+    "hedge_default_delay": 5.0,
+    "failure_threshold": 3,
+    "cooldown": 30,
+}
+ROUTING_LABELS = {"single": "单一提供商", "failover": "失败切换", "hedge": "对冲请求"}
+
+# 近似重复检测的默认设置，config["dedup"] 中的同名项覆盖：threshold 为单个窗口
+# 判定相似的 Jaccard 相似度，重复窗口的比例达到 max_ratio 时视为近似重复
+DEFAULT_DEDUP = {
+    "enabled": True,
+    "threshold": 0.5,
+    "max_ratio": 0.3,
+}
+
+PROMPT_TYPES = ["角色设定", "世界观设定", "情节大纲", "完整故事"]
+GENERATE_TYPES = ["完整章节", "段落续写", "场景描述", "对话生成"]
+STYLES = ["简洁", "详细", "文学性", "诗意", "幽默", "悬疑"]
+LENGTHS = ["短", "中等", "长", "超长"]
+
+# 参与全文检索的项目字段（章节另外索引）
+SEARCH_FIELDS = {"outline": "大纲", "characters": "角色", "setting": "世界观"}
+
+# 未配置API密钥时使用的模拟提示词
+SIMULATED_PROMPTS = {
+    "角色设定": [
+        f"角色名称：林风\n年龄：28岁\n职业：私家侦探\n特点：聪明但愤世嫉俗，右腿因一次任务受伤而微跛，有酗酒倾向\n背景故事：曾是警队精英，因不满体制腐败而辞职，开了一家小型侦探社\n动机：寻找三年前杀害搭档的真凶",
+        f"角色名称：艾莉亚\n年龄：17岁\n身份：魔法学院学生\n特点：拥有罕见的时空魔法天赋，但难以控制，左眼因魔法事故变为银色\n背景故事：孤儿，在教会孤儿院长大，被魔法学院院长发掘\n动机：寻找关于自己身世的秘密，控制体内强大的魔法力量"
+    ],
+    "世界观设定": [
+        f"世界名称：埃瑟兰\n纪元：第三魔法纪元\n主要特征：\n- 魔法与蒸汽科技共存\n- 空中浮岛与地下城并存\n- 六大魔法家族掌控政治经济\n- 魔法能源危机日益严重\n独特设定：\n'灵魂共鸣'系统 - 每个人在16岁时会觉醒一个灵魂共鸣体，可以是动物、植物或器物，决定个人的魔法属性与能力上限",
+        f"世界名称：新长安\n时代：赛博朋克唐朝\n主要特征：\n- 传统唐风建筑与霓虹全息投影结合\n- 机械义肢与古武术并存\n- 四大公司控制城市命脉\n- 底层人民生活在充满蒸汽管道的'地下唐城'\n独特设定：\n'经脉芯片' - 将武学经脉系统数字化，通过植入芯片可快速习得武功，但过度使用会导致'经脉过载'"
+    ],
+    "情节大纲": [
+        f"标题：《星尘挽歌》\n\n第一章：陨落之星\n- 主角在垃圾星发现神秘水晶\n- 被帝国士兵追捕，意外激活水晶\n- 获得星尘之力，逃离垃圾星\n\n第二章：星尘学院\n- 进入培养星尘能力者的学院\n- 结识同伴与对手\n- 发现水晶与古代文明的联系\n\n第三章：暗流涌动\n- 学院内部派系斗争\n- 帝国势力渗透学院\n- 主角小队发现院长秘密\n\n最终章：星尘觉醒\n- 古代文明真相揭露\n- 最终决战：学院 vs 帝国舰队\n- 主角牺牲自我重启星尘网络，带来和平新时代",
+        f"标题：《长安夜行录》\n\n第一章：夜雨客\n- 雨夜，神秘女子将婴儿托付给退休捕快\n- 婴儿身上有奇异莲花印记\n- 当晚女子被黑衣人追杀身亡\n\n第二章：十年之后\n- 婴儿长大成为街头混混\n- 莲花印记觉醒，吸引各方势力\n- 退休捕快为保护养子被杀\n\n第三章：身世之谜\n- 主角寻找生母线索\n- 发现与消失的'莲花教'有关\n- 结识前朝遗孤与神秘剑客\n\n最终章：长安决战\n- 揭穿当朝宰相的阴谋\n- 莲花教真相：守护前朝龙脉\n- 主角抉择：复兴前朝还是守护当下长安"
+    ],
+    "完整故事": [
+        f"标题：《时间修补匠》\n\n故事：在时间管理局最底层的维修部，老张是个不起眼的'时间修补匠'，负责修复微小的时间裂缝。一次例行维修中，他发现一个裂缝正在不断扩大。调查后得知，这是有人故意制造'时间炸弹'，目的是让整个时间线崩溃。老张只有72小时，他必须利用自己对时间裂缝的了解和一台老旧的时光穿梭机，穿越到不同历史节点收集'时间锚点'。在维多利亚时代的伦敦，他结识了女发明家艾达；在二战时期的诺曼底，他救下年轻士兵托马斯；在23世纪的月球基地，他获得未来科学家的帮助。最终他揭露了幕后黑手——未来的自己。原来为了拯救患绝症的女儿，未来的他试图重置时间线。老张面临抉择：拯救女儿还是守护时间线。最终他选择后者，但将自己的记忆封存在时间裂缝中，给女儿留下线索..."
+    ]
+}
+
+# 未配置API密钥时使用的模拟生成内容
+SIMULATED_CONTENT = {
+    "完整章节": [
+        "第一章 星尘觉醒\n\n林风推开吱呀作响的木门，雨水顺着他的旧皮衣滴落在斑驳的地板上。'老张，有新案子了？'他朝昏暗的屋内喊道。角落的阴影里，一个佝偻的身影动了动，烟斗的火光在黑暗中明灭。'这次不一样，'沙哑的声音响起，'有人出高价，找一块会发光的石头。'林风嗤笑一声，'又是寻宝？你知道我不接这种——'话未说完，一张泛黄的照片被推到桌上。照片上是一块菱形的蓝色水晶，内部仿佛有星河流动。林风的手指微微颤抖，这块水晶...和他三年前在搭档尸体旁见到的一模一样。",
+        "第二章 魔法学院的秘密\n\n艾莉亚屏住呼吸，藏在图书馆的巨大书架后。月光透过彩色玻璃窗，在古老的书卷上投下诡异的光影。她听到脚步声越来越近——是院长和那个黑袍人。'仪式必须在下个满月完成，'院长低沉的声音中带着一丝急切，'那个女孩的力量比我们想象的还要强大。'黑袍人发出沙哑的笑声，'银眼少女...终于找到了。艾莉亚感到一阵寒意，她下意识地碰了碰自己的左眼，那里在黑暗中正发出微弱的银光。"
+    ],
+    "段落续写": [
+        "林风握紧照片，冰冷的触感从指尖蔓延至心脏。三年来，这个画面无数次在他噩梦中出现——搭档李明倒在血泊中，右手紧握着这样一块发光的石头，眼神里满是未说出口的警告。雨水敲打窗户的声音将他拉回现实。'雇主是谁？'他声音沙哑。老张摇摇头，'匿名。但定金足够你买下半个街区。'林风盯着照片，蓝色水晶仿佛有生命般微微脉动。突然，他注意到照片角落有个模糊的标记——一只展开翅膀的鹰，那是李氏家族的徽章。李明从未提起过自己的家族背景。",
+        "艾莉亚悄悄后退，却不小心碰倒了一摞古籍。巨大的声响在寂静的图书馆回荡。'谁在那里？'院长的声音陡然变得凌厉。艾莉亚转身就跑，耳边风声呼啸。突然，一道魔法屏障在她面前升起，她猝不及防撞了上去。黑袍人缓步走来，兜帽下露出苍白的下巴，'意外的收获。'他的手指在空中划出复杂的符号，艾莉亚感到全身魔力被禁锢。就在这时，她胸前的吊坠突然发热——这是孤儿院院长临终前给她的遗物，从未有过任何反应。"
+    ],
+    "场景描述": [
+        "废弃的教堂里，彩色玻璃早已破碎，月光从空洞的窗口倾泻而下，照亮空气中漂浮的尘埃。墙角蛛网密布，倒下的长椅像巨兽的骸骨。祭坛上方，巨大的管风琴只剩扭曲的骨架，琴键上停着一只乌鸦，血红的眼睛注视着闯入者。林风的手电光束扫过墙壁，突然定格——那里刻着与照片上一模一样的鹰形徽章，下方用拉丁文写着：'光生于暗'。徽章中央有个水晶形状的凹槽，大小与他手中的照片完全吻合。",
+        "魔法学院的星象塔顶，艾莉亚站在环形露台边缘。脚下是翻滚的云海，头顶是触手可及的璀璨星河。七座悬浮的岛屿环绕着主塔，由发光的虹桥相连。东岛是植物园，发光的藤蔓缠绕成塔；西岛是炼金工坊，蒸汽与魔法火焰交织升腾；南岛图书馆的穹顶是巨大的水晶球，映照着银河的投影；北岛训练场上，学徒们骑着扫帚在空中划出银色轨迹。中央的主塔尖顶射出一道蓝色光柱，直通云霄——那是维持浮岛魔力的能量源，也是院长禁止任何人接近的禁地。"
+    ],
+    "对话生成": [
+        "'你早知道李明的身份，是不是？'林风猛地转身，枪口对准老张。老人叹了口气，烟斗在黑暗中明灭，'三年前我警告过你，别查那个案子。''他是你什么人？'林风的手指扣在扳机上。'我儿子，'老张的声音突然苍老了十岁，'他加入李氏家族是为了查清他们用星石做的勾当。'枪口微微下垂，'那为什么现在告诉我？''因为昨晚，'老张掀开外套，腹部缠着渗血的绷带，'他们找到了我。这块石头...'他掏出一块蓝色水晶，'是唯一能阻止他们的关键。拿着它，去找一个叫'星尘之子'的组织...'话未说完，窗外传来玻璃破碎声，一道红光射入，正中老张胸口。",
+        "'你到底是什么人？'艾莉亚紧握发烫的吊坠，盯着黑袍人。对方低笑，'我是影法师，被学院驱逐的第一任院长。'他掀开兜帽，露出一张布满符文刺青的脸，'现在的院长是我曾经的学徒，他背叛了我，偷走了控制浮岛的核心咒语。'艾莉亚皱眉，'这和我有什么关系？''因为你是星之女，'影法师指着她的左眼，'只有你的银眼能看穿虹桥的魔法路径，进入中央塔顶。'吊坠突然漂浮起来，投射出一幅星图，'这吊坠里有你母亲留下的信息。她不是抛弃你，而是为了保护你逃离院长的追捕。'"
+    ]
+}
+
+
+class NovelCore:
+    """项目、配置与生成功能的统一入口"""
+
+    def __init__(self, config_path=CONFIG_PATH):
+        self.config_path = config_path
+        # 配置文件损坏时记录 (备份路径, 异常)，由界面或命令行提示用户
+        self.config_error = None
+        self.config = self.load_config()
+        self.projects = self.load_projects()
+
+        # 后台生成引擎，网络请求不在调用线程中执行
+        self.engine = GenerationEngine(max_workers=self.config.get("max_workers", 4))
+        # 各提供商的持久会话（keep-alive 连接池）
+        self.providers = ProviderPool()
+        # 相同请求的生成结果缓存
+        cache_config = self.config.get("cache", {})
+        self.cache = ResponseCache(root=cache_config.get("dir", "novel_cache"),
+                                   memory_entries=cache_config.get("memory_entries", 128),
+                                   max_disk_mb=cache_config.get("max_disk_mb", 200),
+                                   max_age_days=cache_config.get("max_age_days", 30))
+        self._summary_lock = threading.Lock()
+        # 进行中的相同请求只调用一次提供商
+        self.flights = SingleFlight()
+        # 多提供商路由与各提供商的健康统计
+        routing = self.routing_config()
+        self.router = ProviderRouter(failure_threshold=routing["failure_threshold"], cooldown=routing["cooldown"])
+        # 所有提供商调用经过调度器：按提供商配置的 rpm/tpm 限流，交互请求优先于批量请求
+        scheduler_config = self.config.get("scheduler", {})
+        self.scheduler = RequestScheduler(max_retries=scheduler_config.get("max_retries", 3),
+                                          base_delay=scheduler_config.get("base_delay", 1.0),
+                                          max_delay=scheduler_config.get("max_delay", 30.0))
+        # 每次提供商调用的延迟、token 和费用
+        self.metrics = MetricsRecorder()
+        # 提示词模板，第一次使用时编译，文件修改后重新编译
+        self.templates = TemplateLibrary(self.config.get("templates") or BUILTIN_TEMPLATES)
+        # 全文索引在第一次检索时（或界面启动后在后台）构建，之后增量更新
+        self.search_index = SearchIndex()
+        # 各项目章节的近似重复索引，第一次生成时在后台构建
+        self.duplicate_indexes = {}
+        self._dedup_lock = threading.Lock()
+        # 各项目的人物与设定索引，角色或世界观修改后重建
+        self.entity_indexes = {}
+        self._entity_lock = threading.Lock()
+        # 交互生成和批量任务的断点，中断后从断点继续
+        checkpoint_config = self.config.get("checkpoints", {})
+        self.checkpoints = CheckpointStore(os.path.join(self.store.root, "checkpoints"),
+                                           flush_chars=checkpoint_config.get("flush_chars", 200),
+                                           flush_interval=checkpoint_config.get("flush_interval", 2.0))
+
+    def close(self):
+        """中断后台任务（保留断点），写入剩余修改"""
+        self.engine.shutdown()
+        self.providers.close_all()
+        self.writer.close()
+
+    # ---- 配置 ----
+
+    def load_config(self):
+        """加载配置文件"""
+        default_config = json.loads(json.dumps(DEFAULT_CONFIG))
+        if os.path.exists(self.config_path):
+            try:
+                with open(self.config_path, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                # 保留损坏的文件，避免之后保存时把它覆盖掉
+                backup_path = f"{self.config_path}.corrupt-{datetime.datetime.now():%Y%m%d%H%M%S}"
+                os.replace(self.config_path, backup_path)
+                self.config_error = (backup_path, e)
+                return default_config
+        return default_config
+
+    def save_config(self):
+        """保存配置文件（只包含API设置，项目保存在项目存储中），原子替换"""
+        write_text(self.config_path, json.dumps(self.config, indent=2))
+
+    def routing_config(self):
+        """路由设置（默认值与配置合并）"""
+        routing = dict(DEFAULT_ROUTING)
+        routing.update(self.config.get("routing", {}))
+        return routing
+
+    def dedup_config(self):
+        """近似重复检测设置（默认值与配置合并）"""
+        dedup = dict(DEFAULT_DEDUP)
+        dedup.update(self.config.get("dedup", {}))
+        return dedup
+
+    def health_summary(self):
+        """提供商健康状况和限流统计"""
+        return f"{self.router.summary()}\n{self.scheduler.summary()}"
+
+    def test_connection(self, job, provider, provider_config):
+        """真实请求测试连接，返回 (首次耗时, 复用连接耗时)"""
+        return self.providers.get(provider, provider_config).check_connection()
+
+    def candidate_providers(self):
+        """交互生成可用的 [(提供商, 配置副本)]：当前提供商在前，其后是其他配置了密钥的提供商
+
+        当前提供商没有密钥时只返回它自己（使用模拟内容）。
+        """
+        current, current_config = self.provider_config()
+        candidates = [(current, current_config)]
+        if current_config.get("api_key"):
+            for name, cfg in self.config["api_providers"].items():
+                if name != current and cfg.get("api_key"):
+                    candidates.append((name, dict(cfg)))
+        return candidates
+
+    def provider_config(self, provider=None):
+        """返回 (提供商, 配置副本)，副本可以安全地交给工作线程"""
+        provider = provider or self.config["current_provider"]
+        return provider, dict(self.config["api_providers"][provider])
+
+    # ---- 项目 ----
+
+    def load_projects(self):
+        """打开项目存储，首次运行时迁移旧版配置文件中的项目"""
+        self.store = ProjectStore(self.config.get("project_dir", "novel_projects"))
+        # 重放上次异常退出时未写入的修改，之后的修改都在后台线程写入
+        self.writer = StoreWriter(self.store)
+        legacy_projects = self.config.pop("projects", None)
+        if legacy_projects is not None:
+            # 存储已有项目说明上次迁移已完成，只是配置文件还没来得及重写
+            if not self.store.list_projects():
+                self.store.import_legacy(legacy_projects)
+            self.save_config()
+        return [self.store.load_project(p["id"]) for p in self.store.list_projects()]
+
+    def find_project(self, title):
+        """按标题（或项目 id）查找项目"""
+        for p in self.projects:
+            if p["title"] == title or p["id"] == title:
+                return p
+        return None
+
+    def save_project(self, project_data, project=None, source="保存"):
+        """保存项目字段；project 为 None 时新建，返回项目。source 为版本历史中记录的修改来源"""
+        if project is None:
+            project_data["id"] = self.store.new_project_id()
+            self.writer.submit({"op": "save_project", "id": project_data["id"], "data": project_data})
+            project_data["chapters"], project_data["summaries"] = self.store.lazy_texts(project_data["id"])
+            self.projects.append(project_data)
+            self.index_fields(project_data)
+            return project_data
+        # 更新现有项目，只写入有变化的字段，章节保持不变
+        self.writer.submit({"op": "save_project", "id": project["id"], "data": project_data, "source": source})
+        changed = [field for field in SEARCH_FIELDS if project.get(field) != project_data.get(field)]
+        project.update(project_data)
+        self.index_fields(project, changed)
+        if "characters" in changed or "setting" in changed:
+            with self._entity_lock:
+                self.entity_indexes.pop(project["id"], None)
+        return project
+
+    def delete_project(self, project):
+        """删除项目"""
+        self.writer.submit({"op": "delete_project", "id": project["id"]})
+        self.projects.remove(project)
+        self.search_index.remove_project(project["id"])
+        with self._dedup_lock:
+            self.duplicate_indexes.pop(project["id"], None)
+        with self._entity_lock:
+            self.entity_indexes.pop(project["id"], None)
+        self.checkpoints.remove_project(project["id"])
+
+    def add_chapter(self, project, content):
+        """在项目末尾追加章节（只新建一个章节文件），返回章节编号"""
+        number = self.store.reserve_chapter(project["id"])
+        summary = summarize_chapter(content)
+        self.writer.submit({"op": "put_chapter", "id": project["id"], "number": number,
+                            "content": content, "summary": summary, "source": "插入"})
+        project["chapters"][number] = content
+        project["summaries"][number] = summary
+        self.search_index.update((project["id"], "chapter", number), content)
+        self.index_duplicates(project, number, content)
+        self.index_entities(project, number, content)
+        return number
+
+    def ensure_summaries(self, project):
+        """为还没有摘要的章节（旧版本保存的章节）补算摘要"""
+        with self._summary_lock:
+            summaries = project["summaries"]
+            for number in list(project["chapters"]):
+                if number not in summaries:
+                    summaries[number] = summarize_chapter(project["chapters"][number])
+                    self.writer.submit({"op": "put_summary", "id": project["id"], "number": number,
+                                        "summary": summaries[number]})
+
+    # ---- 版本历史 ----
+
+    def history_target(self, target):
+        """版本历史中的名称：设定字段名原样返回，章节编号转换为 chapter-000001"""
+        if isinstance(target, int):
+            return self.store.chapter_target(target)
+        if target not in SEARCH_FIELDS:
+            raise ValueError(f"没有版本历史的字段: {target}")
+        return target
+
+    def current_text(self, project, target):
+        """字段或章节（编号）的当前内容"""
+        if isinstance(target, int):
+            return project["chapters"].get(target, "")
+        return project.get(target, "")
+
+    def history(self, project, target):
+        """字段或章节的修订列表（从旧到新），每项增加从 1 开始的 index"""
+        # 后台写入器还没落盘的修改也要出现在历史中
+        self.writer.flush()
+        revisions = self.store.history(project["id"]).revisions(self.history_target(target))
+        for i, revision in enumerate(revisions, 1):
+            revision["index"] = i
+        return revisions
+
+    def history_text(self, project, target, revision):
+        """修订（整数或 #序号，或哈希前缀，见 VersionHistory.find）的内容，找不到时抛出 KeyError"""
+        self.writer.flush()
+        history = self.store.history(project["id"])
+        return history.load(history.find(self.history_target(target), revision)["hash"])
+
+    def history_diff(self, project, target, old, new=None):
+        """两个修订之间的差异行，new 为 None 时与当前内容比较"""
+        old_text = self.history_text(project, target, old)
+        if new is None:
+            new_text, new_label = self.current_text(project, target), "当前"
+        else:
+            new_text, new_label = self.history_text(project, target, new), f"修订 {new}"
+        return diff_lines(old_text, new_text, f"修订 {old}", new_label)
+
+    def restore_revision(self, project, target, revision):
+        """把字段或章节恢复为某个修订的内容（作为新修订记录），返回恢复后的文本"""
+        text = self.history_text(project, target, revision)
+        if isinstance(target, int):
+            summary = summarize_chapter(text)
+            self.store.claim_chapter(project["id"], target)
+            self.writer.submit({"op": "put_chapter", "id": project["id"], "number": target,
+                                "content": text, "summary": summary, "source": "恢复"})
+            project["chapters"][target] = text
+            project["summaries"][target] = summary
+            self.search_index.update((project["id"], "chapter", target), text)
+            self.index_duplicates(project, target, text)
+            self.index_entities(project, target, text)
+        else:
+            data = {key: project.get(key, "") for key in ("title", "author", "genre", *SEARCH_FIELDS)}
+            data[target] = text
+            self.save_project(data, project, source="恢复")
+        return text
+
+    # ---- 近似重复 ----
+
+    def duplicate_index(self, project):
+        """项目的近似重复索引，还没有构建完成时返回 None
+
+        第一次调用时提交后台任务读取全部章节构建索引，构建期间的新章节也会加入。
+        """
+        with self._dedup_lock:
+            index = self.duplicate_indexes.get(project["id"])
+            if index is None:
+                index = DuplicateIndex(self.dedup_config()["threshold"])
+                self.duplicate_indexes[project["id"]] = index
+                chapters = project["chapters"]
+                self.engine.submit("dedup", lambda job: index.build(
+                    (number, chapters.get(number, "")) for number in list(chapters)))
+        return index if index.ready else None
+
+    def duplicate_monitor(self, project, exclude=None):
+        """检查新生成文本的 DuplicateMonitor，未启用或索引未就绪时返回 None"""
+        dedup = self.dedup_config()
+        if not dedup["enabled"]:
+            return None
+        index = self.duplicate_index(project)
+        if index is None:
+            return None
+        return DuplicateMonitor(index, exclude, dedup["max_ratio"])
+
+    def index_duplicates(self, project, number, content):
+        """章节写入后更新近似重复索引（索引尚未创建时由构建任务读取）"""
+        index = self.duplicate_indexes.get(project["id"])
+        if index is not None:
+            index.update(number, content)
+
+    def check_duplicate(self, job, monitor, chunk, emit, strict):
+        """检查新到达的片段（chunk 为 None 表示生成结束）
+
+        近似重复时 strict 为 True 抛出 DuplicateContentError，否则发送 duplicate 事件。
+        """
+        if chunk is None:
+            monitor.finish()
+        elif monitor.feed(chunk) is None:
+            return
+        if not monitor.duplicate:
+            return
+        report = monitor.report()
+        if strict:
+            raise DuplicateContentError(report)
+        if emit:
+            job.emit("duplicate", report)
+
+    # ---- 人物与设定 ----
+
+    def entity_index(self, project):
+        """项目的人物与设定索引；第一次调用时提交后台任务扫描全部章节
+
+        条目（用于挑选提示词中的角色和世界观）立即可用，各章的出现情况在扫描完成后才完整。
+        """
+        with self._entity_lock:
+            index = self.entity_indexes.get(project["id"])
+            if index is None:
+                index = EntityIndex(project.get("characters"), project.get("setting"))
+                self.entity_indexes[project["id"]] = index
+                chapters = project["chapters"]
+                self.engine.submit("entities", lambda job: index.build(
+                    (number, chapters.get(number, "")) for number in list(chapters)))
+        return index
+
+    def index_entities(self, project, number, content):
+        """章节写入后重新扫描该章，返回该章与设定矛盾之处（索引尚未创建时由构建任务扫描）"""
+        index = self.entity_indexes.get(project["id"])
+        if index is None:
+            return []
+        return index.update(number, content)
+
+    def check_entities(self, project, text):
+        """新文本（未写入项目）与设定矛盾之处"""
+        return self.entity_index(project).scan(text)[1]
+
+    def entity_report(self, project):
+        """{"entities": 各条目的出现章节和次数, "conflicts": 全部矛盾}，扫描未完成时在调用线程中完成"""
+        index = self.entity_index(project)
+        chapters = project["chapters"]
+        index.build((number, chapters.get(number, "")) for number in list(chapters))
+        return {"entities": index.report(), "conflicts": index.conflicts()}
+
+    # ---- 检索 ----
+
+    def index_fields(self, project, fields=SEARCH_FIELDS):
+        """重新索引项目的设定字段"""
+        for field in fields:
+            self.search_index.update((project["id"], field, None), project.get(field, ""))
+
+    def build_index(self):
+        """为所有项目构建全文索引（可在工作线程中调用）"""
+        docs = []
+        for project in list(self.projects):
+            for field in SEARCH_FIELDS:
+                docs.append(((project["id"], field, None), project.get(field, "")))
+            for number in list(project["chapters"]):
+                docs.append(((project["id"], "chapter", number), project["chapters"].get(number, "")))
+        self.search_index.build(docs)
+
+    def chapter_heading(self, project, number):
+        """章节第一行（标题），不读取整章"""
+        text = project["chapters"].peek(number)
+        if text is not None:
+            return text.strip().split("\n", 1)[0][:200]
+        return self.store.chapter_heading(project["id"], number)
+
+    def doc_text(self, doc):
+        """检索结果对应的文本"""
+        project_id, field, number = doc
+        project = self.find_project(project_id)
+        if project is None:
+            return ""
+        if field == "chapter":
+            return project["chapters"].get(number, "")
+        return project.get(field, "")
+
+    def search(self, query, limit=20, project_id=None):
+        """全文检索，返回 [{"project_id", "title", "field", "number", "location", "score", "snippet"}]
+
+        完整包含查询文字的结果排在前面，其余按 BM25 得分排序。
+        """
+        if not self.search_index.ready:
+            self.build_index()
+        # 多取一些候选，核对原文后再截断
+        ranked = self.search_index.search(query, limit * 5, project_id)
+        needle = query.strip().lower()
+        results = []
+        for score, doc in ranked:
+            text = self.doc_text(doc)
+            if not text:
+                continue
+            project_id, field, number = doc
+            project = self.find_project(project_id)
+            results.append({
+                "project_id": project_id,
+                "title": project["title"],
+                "field": field,
+                "number": number,
+                "location": f"第{number}章" if field == "chapter" else SEARCH_FIELDS[field],
+                "score": score,
+                "exact": needle in text.lower(),
+                "snippet": make_snippet(text, query.strip()),
+            })
+        results.sort(key=lambda r: not r["exact"])
+        return results[:limit]
+
+    def export_project(self, job, project, path, fmt=None, include_settings=True, incremental=True):
+        """导出整部小说（在工作线程中调用），发送 export_progress (完成章数, 总章数) 事件
+
+        格式按 fmt 或扩展名确定（txt/md/epub），再次导出到同一路径时只重写变化的章节，
+        见 novel_export。返回导出报告。
+        """
+        self.writer.flush()
+        reported = [-1]
+
+        def on_progress(done, total):
+            # 每完成 1% 报告一次
+            percent = done * 100 // max(total, 1)
+            if percent != reported[0]:
+                reported[0] = percent
+                job.emit("export_progress", (done, total))
+
+        exporter = ProjectExporter(self.store, project, path, fmt, include_settings, incremental,
+                                   on_progress=on_progress, check_cancelled=job.check_cancelled)
+        return exporter.run()
+
+    # ---- 提示词 ----
+
+    def suggestion_prompt(self, theme, prompt_type):
+        """提示词生成请求"""
+        return self.templates.render("suggestion", {"theme": theme, "prompt_type": prompt_type})
+
+    def build_generation_prompt(self, project, gen_type, style, length, custom_prompt, chapter=None,
+                                budget=DEFAULT_PROMPT_TOKENS):
+        """根据项目信息和生成设置渲染 generation 模板，chapter 为批量生成时大纲中的章节
+
+        大纲、设定和前文按 budget（token）裁剪，见 novel_context；角色和世界观
+        只放入本章大纲、额外要求和最近几章涉及的条目，见 novel_entities。项目的
+        templates.txt 可以覆盖内置模板，模板格式和稳定前缀见 novel_templates。
+        """
+        override = self.store.template_path(project["id"]) if project.get("id") else None
+        chapters = project.get("chapters") or {}
+        target = chapter["number"] if chapter else (max(chapters) + 1 if chapters else 1)
+        entities = None
+        focus = custom_prompt or ""
+        if project.get("id"):
+            entities = self.entity_index(project)
+            planned = chapter or next((c for c in parse_outline_chapters(project.get("outline") or "")
+                                       if c["number"] == target), None)
+            if planned:
+                focus = f"{planned['title']}\n{planned['outline']}\n{focus}"
+        values = build_context(project, target, budget, entities, focus)
+        values.update(title=project["title"], genre=project.get("genre", ""), gen_type=gen_type, style=style,
+                      length=length, custom_prompt=custom_prompt or "", chapter="")
+        guide = self.templates.find(f"guide:{gen_type}", override)
+        values["guide"] = guide.render(values) if guide else ""
+        if chapter:
+            values["chapter"] = f"第{chapter['number']}章 {chapter['title']}\n{chapter['outline']}"
+        return self.templates.render("generation", values, override)
+
+    # ---- 生成（在工作线程中调用） ----
+
+    def generate_prompt(self, job, theme, prompt_type, use_cache=True):
+        """生成提示词，逐段发送 chunk 事件"""
+        return self.generate_text(job, self.candidate_providers(), self.suggestion_prompt(theme, prompt_type),
+                                  LENGTH_MAX_TOKENS["短"], lambda: random.choice(SIMULATED_PROMPTS[prompt_type]),
+                                  use_cache, kind=prompt_type)
+
+    def content_prompt(self, project, gen_type, style, length, custom_prompt, providers=None):
+        """交互生成的提示词和最大输出 token 数"""
+        providers = providers or self.candidate_providers()
+        max_tokens = LENGTH_MAX_TOKENS.get(length, LENGTH_MAX_TOKENS["中等"])
+        self.ensure_summaries(project)
+        # 同一提示词可能发给任一候选提供商，按最小的预算组装
+        budget = min(prompt_budget(provider, cfg, max_tokens) for provider, cfg in providers)
+        return self.build_generation_prompt(project, gen_type, style, length, custom_prompt, budget=budget), max_tokens
+
+    def generate_content(self, job, project, gen_type, style, length, custom_prompt, use_cache=True,
+                         checkpoint_id=None):
+        """生成小说内容，逐段发送 chunk 事件，与人物设定矛盾时最后发送 entity_conflicts 事件
+
+        生成过程记入断点（novel_checkpoint）：checkpoint_id 对应的断点存在时
+        沿用其中的提示词，从已生成的部分继续（先发送 resumed 事件和已生成
+        部分的 chunk），否则以该 id（为空时自动生成）新建断点。完成或被用户
+        取消后删除断点，失败或因退出中断时保留。
+        """
+        providers = self.candidate_providers()
+        checkpoint = self.checkpoints.get(checkpoint_id) if checkpoint_id else None
+        if checkpoint is not None:
+            prompt = PromptText(checkpoint.state["prompt"])
+            prompt.prefix_length = checkpoint.state.get("prefix_length", 0)
+            max_tokens = checkpoint.state["max_tokens"]
+        else:
+            prompt, max_tokens = self.content_prompt(project, gen_type, style, length, custom_prompt, providers)
+            params = {"gen_type": gen_type, "style": style, "length": length, "custom_prompt": custom_prompt,
+                      "use_cache": use_cache}
+            checkpoint = self.checkpoints.create("generate", project["id"], params, checkpoint_id, prompt=prompt,
+                                                 prefix_length=getattr(prompt, "prefix_length", 0),
+                                                 max_tokens=max_tokens)
+        part = checkpoint.part()
+        monitor = self.duplicate_monitor(project)
+        try:
+            text = self.resume_generation(job, project, part, prompt, lambda resumed_prompt: self.generate_text(
+                job, providers, resumed_prompt, max_tokens, lambda: random.choice(SIMULATED_CONTENT[gen_type]),
+                use_cache, kind=gen_type, monitor=monitor, partial=part))
+        except JobCancelled:
+            if not job.suspended:
+                checkpoint.remove()
+            raise
+        checkpoint.remove()
+        conflicts = self.check_entities(project, text)
+        if conflicts:
+            job.emit("entity_conflicts", conflicts)
+        return text
+
+    def resume_generation(self, job, project, part, prompt, generate, emit=True):
+        """从断点续写，返回完整文本
+
+        part（PartialText）中上次已生成的部分足够长时保留到最后一个完整的
+        句子，按 continuation 模板请提供商接着写；否则从头生成。
+        generate(提示词) 调用提供商并把新片段记入 part。
+        """
+        written = resume_point(part.read())
+        if written:
+            override = self.store.template_path(project["id"]) if project.get("id") else None
+            prompt = self.templates.render("continuation", {"prompt": prompt, "written": written[-RESUME_TAIL_CHARS:]},
+                                           override)
+            if emit:
+                job.emit("resumed", len(written))
+                job.emit("chunk", written)
+        part.begin(written)
+        return written + generate(prompt)
+
+    def generate_text(self, job, providers, prompt, max_tokens, simulated, use_cache=True, emit=True,
+                      priority=INTERACTIVE, kind="生成", monitor=None, strict=False, partial=None):
+        """调用提供商生成文本，emit 为 True 时逐段发送 chunk 事件
+
+        providers 为按优先顺序排列的 [(提供商, 配置)]，按 routing 策略在其间
+        切换或对冲；换用其他提供商重新生成时发送 restart 事件，首个片段
+        到达时发送 provider 事件。相同请求优先使用缓存结果；第一个提供商
+        未配置API密钥时回放模拟内容（不缓存）。每次请求都经过调度器限流，
+        priority 为 INTERACTIVE 或 BATCH。每次调用（包括缓存命中和失败）
+        按 kind（生成类型）记入 metrics，取消的调用不记录。
+
+        进行中的相同请求（不论 use_cache）合并为一次上游调用（novel_flight），
+        后加入的请求先收到已生成的片段；所有请求都取消后上游调用才取消。
+
+        上游结果由第一个接受它的请求写入缓存。
+
+        monitor 为 DuplicateMonitor 时边生成边检查近似重复：strict 为 True 时
+        重复即放弃请求并抛出 DuplicateContentError（没有其他请求在等待时上游
+        调用中止；放弃的结果不写入缓存，除非合并的其他请求接受了它；重复的
+        缓存结果视为未命中），否则发送 duplicate 事件，由用户决定是否停止。
+
+        partial 为 PartialText 时收到的片段同时记入断点，换用提供商时清空。
+        """
+        if not providers[0][1].get("api_key"):
+            return self.emit_chunks(job, self.simulate_stream(job, simulated()), emit, partial)
+
+        clients = {provider: self.providers.get(provider, cfg) for provider, cfg in providers}
+        params = {"max_tokens": max_tokens}
+        call = CallRecord(kind, estimate_tokens(prompt))
+        if use_cache:
+            for i, (provider, client) in enumerate(clients.items()):
+                key = ResponseCache.make_key(provider, client.model, prompt, params)
+                cached = self.cache.get(key, count_miss=i == len(clients) - 1)
+                if cached is not None and monitor is not None:
+                    try:
+                        self.check_duplicate(job, monitor, cached, emit, strict)
+                        self.check_duplicate(job, monitor, None, emit, strict)
+                    except DuplicateContentError:
+                        monitor.reset()
+                        break
+                if cached is not None:
+                    call.provider = provider
+                    call.cache_hit = True
+                    call.prompt_tokens = 0
+                    call.total = time.monotonic() - call.started
+                    self.metrics.record(call)
+                    if emit:
+                        job.emit("cache_hit")
+                        job.emit("chunk", cached)
+                    return cached
+
+        key = SingleFlight.make_key([(provider, client.model) for provider, client in clients.items()],
+                                    prompt, params, priority)
+        flight, created = self.flights.join(key, functools.partial(
+            self.stream_upstream, providers, clients, prompt, params, priority, call))
+        served_by = None
+        try:
+            for name, payload in flight.follow(job):
+                if name == "restart":
+                    # 换了提供商，之前的片段作废
+                    if monitor is not None:
+                        monitor.reset()
+                    if partial is not None:
+                        partial.restart()
+                elif name == "provider":
+                    served_by = payload
+                elif name == "chunk" and partial is not None:
+                    partial.write(payload)
+                if emit:
+                    job.emit(name, payload)
+                if name == "chunk" and monitor is not None:
+                    self.check_duplicate(job, monitor, payload, emit, strict)
+            if monitor is not None:
+                self.check_duplicate(job, monitor, None, emit, strict)
+            provider, text = flight.outcome()
+            if flight.claim_result():
+                self.cache.put(ResponseCache.make_key(provider, clients[provider].model, prompt, params),
+                               text, prompt)
+        finally:
+            self.flights.leave(flight)
+            if partial is not None:
+                partial.flush()
+        if not created:
+            # 合并到其他请求：不产生费用，等待时间不计入提供商的延迟分布
+            call.provider = served_by or providers[0][0]
+            call.coalesced = True
+            call.prompt_tokens = 0
+            call.total = time.monotonic() - call.started
+            self.metrics.record(call)
+        return text
+
+    def stream_upstream(self, providers, clients, prompt, params, priority, call, flight):
+        """在 Flight 的线程中调用提供商，片段记入 flight，返回 (提供商, 文本)
+
+        按 routing 策略在候选提供商之间切换或对冲，取消由最后一个订阅者离开时触发。
+        """
+        job = flight.job
+        routing = self.routing_config()
+        max_tokens = params["max_tokens"]
+        # tpm 按提示词加最大输出估算
+        tokens = call.prompt_tokens + max_tokens
+        configs = dict(providers)
+        attempts = [(provider, functools.partial(self.scheduler.stream, job, provider, configs[provider],
+                                                 functools.partial(client.stream, prompt, max_tokens),
+                                                 tokens, priority, call))
+                    for provider, client in clients.items()]
+        stream = self.router.stream(job, attempts, routing["policy"], routing["hedge_percentile"],
+                                    routing["hedge_min_delay"], routing["hedge_default_delay"])
+        parts = []
+        served_by = None
+        try:
+            for provider, chunk in stream:
+                job.check_cancelled()
+                if chunk is None:
+                    parts = []
+                    flight.add("restart", provider)
+                    continue
+                if provider != served_by:
+                    served_by = provider
+                    flight.add("provider", provider)
+                call.mark_first_token()
+                parts.append(chunk)
+                flight.add("chunk", chunk)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            call.provider = served_by or providers[0][0]
+            call.error = str(e)
+            call.total = time.monotonic() - call.started
+            self.metrics.record(call)
+            raise
+        finally:
+            stream.close()
+        text = "".join(parts)
+        served_by = served_by or providers[0][0]
+        call.provider = served_by
+        call.total = time.monotonic() - call.started
+        call.completion_tokens = estimate_tokens(text)
+        call.cost = estimate_cost(served_by, configs[served_by], call.prompt_tokens, call.completion_tokens)
+        self.metrics.record(call)
+        # 由接受结果的订阅者写入缓存，被判为近似重复而放弃的结果不缓存
+        return served_by, text
+
+    def emit_chunks(self, job, chunks, emit=True, partial=None):
+        """逐段转发生成器产出的文本（同时记入断点 partial），返回完整文本"""
+        parts = []
+        try:
+            for chunk in chunks:
+                job.check_cancelled()
+                parts.append(chunk)
+                if partial is not None:
+                    partial.write(chunk)
+                if emit:
+                    job.emit("chunk", chunk)
+        finally:
+            # 取消时及时关闭连接
+            chunks.close()
+            if partial is not None:
+                partial.flush()
+        return "".join(parts)
+
+    def simulate_stream(self, job, text, chunk_size=4, delay=0.02):
+        """把模拟内容按小段逐步产出，模拟逐字到达"""
+        for i in range(0, len(text), chunk_size):
+            job.sleep(delay)
+            yield text[i:i + chunk_size]
+
+    # ---- 批量生成 ----
+
+    def create_batch(self, project, start, end, overwrite, style, length, custom_prompt, checkpoint_id=None):
+        """按大纲章节范围创建批量任务，没有可生成的章节时抛出 ValueError
+
+        返回的 BatchRunner 交给引擎执行（engine.submit("batch", runner.run)），
+        每章完成后立即写入存储（连同摘要），并发送 chapter_done 事件。
+
+        任务开始时以 checkpoint_id（为空时自动生成）新建断点，记录要生成的
+        章节和它们当时内容的哈希，生成中的章节记入各自的 .part 文件。
+        checkpoint_id 对应的断点存在时从断点恢复：章节以断点为准，内容已经
+        变化（已完成）的章节不再生成，生成到一半的章节从断点续写。
+        """
+        checkpoint = self.checkpoints.get(checkpoint_id) if checkpoint_id else None
+        if checkpoint is not None:
+            before = checkpoint.state["before"]
+            chapters = [c for c in checkpoint.state["chapters"]
+                        if self.chapter_hash(project, c["number"]) == before[str(c["number"])]]
+            if not chapters:
+                checkpoint.remove()
+                raise ValueError("断点中的章节都已生成完成")
+        else:
+            outline_chapters = parse_outline_chapters(project["outline"])
+            if not outline_chapters:
+                raise ValueError("大纲中没有找到“第N章”格式的章节")
+            chapters = [c for c in outline_chapters if start <= c["number"] <= end]
+            if not overwrite:
+                chapters = [c for c in chapters if c["number"] not in project["chapters"]]
+            if not chapters:
+                raise ValueError("所选范围内没有需要生成的章节")
+
+        # 所有配置了密钥的提供商都参与，并发上限取各自的 max_concurrency
+        provider_configs = {name: dict(cfg) for name, cfg in self.config["api_providers"].items()
+                            if cfg.get("api_key")}
+        if not provider_configs:
+            provider, provider_config = self.provider_config()
+            provider_configs = {provider: provider_config}
+        concurrency = {name: int(cfg.get("max_concurrency", 2)) for name, cfg in provider_configs.items()}
+        max_tokens = LENGTH_MAX_TOKENS.get(length, LENGTH_MAX_TOKENS["中等"])
+        self.ensure_summaries(project)
+        if self.dedup_config()["enabled"]:
+            # 提前构建近似重复索引，就绪后的章节都会检查
+            self.duplicate_index(project)
+
+        params = {"start": start, "end": end, "overwrite": overwrite, "style": style, "length": length,
+                  "custom_prompt": custom_prompt}
+
+        def on_start(job):
+            nonlocal checkpoint
+            if checkpoint is None:
+                before = {str(c["number"]): self.chapter_hash(project, c["number"]) for c in chapters}
+                checkpoint = self.checkpoints.create("batch", project["id"], params, checkpoint_id,
+                                                     chapters=chapters, before=before, done=[])
+
+        def generate(job, provider, chapter):
+            budget = prompt_budget(provider, provider_configs[provider], max_tokens)
+            prompt = self.build_generation_prompt(project, "完整章节", style, length, custom_prompt, chapter, budget)
+            part = checkpoint.part(f"chapter-{chapter['number']:06d}")
+            # 与已有章节近似重复时中止并抛出异常，由 BatchRunner 丢弃后重试
+            try:
+                return self.resume_generation(job, project, part, prompt, lambda resumed_prompt: self.generate_text(
+                    job, [(provider, provider_configs[provider])], resumed_prompt, max_tokens,
+                    lambda: random.choice(SIMULATED_CONTENT["完整章节"]), emit=False, priority=BATCH,
+                    kind="批量章节", monitor=self.duplicate_monitor(project, chapter["number"]), strict=True,
+                    partial=part), emit=False)
+            except DuplicateContentError:
+                # 重复的部分不能作为续写的起点
+                part.discard()
+                raise
+
+        def on_chapter(job, chapter, provider, text):
+            # 在工作线程中立即写入项目，不等整批完成
+            self.store.claim_chapter(project["id"], chapter["number"])
+            summary = summarize_chapter(text)
+            self.writer.submit({"op": "put_chapter", "id": project["id"], "number": chapter["number"],
+                                "content": text, "summary": summary, "source": "批量生成"})
+            checkpoint.mark_done(chapter["number"])
+            checkpoint.part(f"chapter-{chapter['number']:06d}").discard()
+            self.search_index.update((project["id"], "chapter", chapter["number"]), text)
+            self.index_duplicates(project, chapter["number"], text)
+            conflicts = self.index_entities(project, chapter["number"], text)
+            job.emit("chapter_done", (chapter["number"], text, summary), deliver_cancelled=True)
+            if conflicts:
+                job.emit("entity_conflicts", conflicts)
+
+        def on_end(job, report):
+            # 因退出中断时保留断点；失败的章节留在断点中，恢复时重试；
+            # 用户停止时放弃断点（已完成的章节已经写入项目）
+            keep = job.suspended if job.cancelled else report["failed"]
+            if not keep:
+                checkpoint.remove()
+
+        return BatchRunner(chapters, concurrency, generate, on_chapter, on_start=on_start, on_end=on_end)
+
+    # ---- 断点 ----
+
+    @staticmethod
+    def chapter_hash(project, number):
+        """章节当前内容的哈希，章节不存在时为 None"""
+        if number not in project["chapters"]:
+            return None
+        return hashlib.sha1(project["chapters"][number].encode("utf-8")).hexdigest()
+
+    def pending_checkpoints(self):
+        """上次没有完成的本机任务（服务器任务由服务器自己恢复），项目已删除的断点直接丢弃"""
+        pending = []
+        for checkpoint in self.checkpoints.pending():
+            if self.find_project(checkpoint.project) is None:
+                checkpoint.remove()
+            else:
+                pending.append(checkpoint)
+        return pending
+
+    def describe_checkpoint(self, checkpoint):
+        """断点的一行说明"""
+        project = self.find_project(checkpoint.project)
+        title = project["title"] if project else checkpoint.project
+        params = checkpoint.state["params"]
+        updated = checkpoint.state.get("updated", "").replace("T", " ")
+        if checkpoint.kind == "batch":
+            total = len(checkpoint.state["chapters"])
+            done = len(checkpoint.state.get("done", []))
+            return f"《{title}》批量生成第{params['start']}-{params['end']}章，已完成 {done}/{total} 章（{updated}）"
+        written = len(checkpoint.part().read())
+        return f"《{title}》{params['gen_type']}，已生成 {written} 字（{updated}）"
+
+
+def format_batch_report(report):
+    """批量进度与吞吐量"""
+    return (f"{report['done']}/{report['total']} 章，失败 {len(report['failed'])}，"
+            f"{report['chapters_per_min']:.1f} 章/分钟，{report['chars_per_sec']:.0f} 字/秒")
+
+
+def format_conflict(conflict):
+    """一处与人物设定矛盾的描述"""
+    chapter = f"第{conflict['chapter']}章 " if conflict.get("chapter") is not None else ""
+    return (f"{chapter}{conflict['name']}的{conflict['attribute']}：设定为{conflict['expected']}，"
+            f"文中为{conflict['found']}（{conflict['excerpt']}）")
@@ -1,59 +1,111 @@
 # -*- coding: utf-8 -*-
-import requests
-import json
-import os
+import time
 import datetime
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 
+from novel_core import (NovelCore, PROMPT_TYPES, GENERATE_TYPES, STYLES, LENGTHS, ROUTING_LABELS, SEARCH_FIELDS,
+                        format_batch_report, format_conflict)
+
+
+class TextStreamWriter:
+    """把流式片段合并后按帧写入文本框
+    
+    每个 token 调用一次 insert 会让长章节的界面明显变卡，
+    这里先缓存片段，每隔 interval 毫秒统一插入一次。
+    """
+    
+    def __init__(self, root, widget, interval=40):
+        self.root = root
+        self.widget = widget
+        self.interval = interval
+        self.pending = []
+        self.timer = None
+    
+    def write(self, text):
+        """缓存片段，必要时安排一次刷新"""
+        self.pending.append(text)
+        if self.timer is None:
+            self.timer = self.root.after(self.interval, self.flush)
+    
+    def flush(self):
+        """把缓存的片段一次性写入文本框"""
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending = []
+        self.widget.config(state=tk.NORMAL)
+        self.widget.insert(tk.END, text)
+        self.widget.see(tk.END)
+        self.widget.config(state=tk.DISABLED)
+    
+    def reset(self, text=""):
+        """丢弃未写入的片段并清空文本框"""
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+        self.pending = []
+        self.widget.config(state=tk.NORMAL)
+        self.widget.delete(1.0, tk.END)
+        self.widget.insert(tk.END, text)
+        self.widget.config(state=tk.DISABLED)
+
+
 class NovelCreator:
-    def __init__(self, root):
+    # 章节列表每页显示的章节数
+    CHAPTER_PAGE_SIZE = 50
+    
+    def __init__(self, root, core=None):
         self.root = root
         self.root.title("AI小说创作工具")
         self.root.geometry("1000x700")
         self.root.configure(bg='#2d2d2d')
         
-        # 加载配置
-        self.config = self.load_config()
+        # 加载配置和项目，生成引擎、连接池和缓存都由核心层持有
+        self.core = core or NovelCore()
+        self.config = self.core.config
+        self.projects = self.core.projects
+        self.engine = self.core.engine
+        self.cache = self.core.cache
         self.current_project = None
+        self.project_combo = None
+        
+        self.prompt_job = None
+        self.generate_job = None
+        self.batch_job = None
+        self.search_job = None
+        self.export_job = None
+        self.entity_job = None
+        self.search_results = []
         
         # 创建界面
         self.create_widgets()
         
-    def load_config(self):
-        """加载配置文件"""
-        config_path = "novel_creator_config.json"
-        default_config = {
-            "api_providers": {
-                "OpenAI": {
-                    "api_key": "",
-                    "endpoint": "https://api.openai.com/v1/chat/completions"
-                },
-                "Claude": {
-                    "api_key": "",
-                    "endpoint": "https://api.anthropic.com/v1/messages"
-                },
-                "Gemini": {
-                    "api_key": "",
-                    "endpoint": "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-                }
-            },
-            "current_provider": "OpenAI",
-            "projects": []
-        }
-        
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, "r") as f:
-                    return json.load(f)
-            except:
-                return default_config
-        return default_config
+        # 轮询后台任务结果
+        self.poll_engine()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        # 后台构建全文索引，第一次检索不必等待
+        self.engine.submit("index", lambda job: self.core.build_index())
+        # 界面显示出来之后再询问是否继续上次中断的任务
+        self.root.after(500, self.offer_resume)
+        
+        if self.core.config_error:
+            backup_path, error = self.core.config_error
+            messagebox.showwarning("配置文件损坏", f"无法读取配置文件，已使用默认配置。\n"
+                                   f"原文件已备份为 {backup_path}\n\n{error}")
+        
+    def poll_engine(self):
+        """在主线程中分发后台任务的结果"""
+        self.engine.poll()
+        self.root.after(50, self.poll_engine)
     
-    def save_config(self):
-        """保存配置文件"""
-        with open("novel_creator_config.json", "w") as f:
-            json.dump(self.config, f, indent=2)
+    def on_close(self):
+        """关闭窗口时中断所有后台任务，生成和批量任务保留断点，下次启动时继续"""
+        self.core.close()
+        self.root.destroy()
     
     def create_widgets(self):
         # 创建选项卡
@@ -65,6 +117,8 @@ class NovelCreator:
         self.create_prompt_tab()
         self.create_project_tab()
         self.create_generate_tab()
+        self.create_search_tab()
+        self.create_metrics_tab()
         
         # 状态栏
         self.status_var = tk.StringVar()
@@ -72,7 +126,10 @@ class NovelCreator:
                                  bd=1, relief=tk.SUNKEN, anchor=tk.W,
                                  bg='#3d3d3d', fg='white')
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
-        self.update_status("就绪")
+        if self.core.writer.replayed:
+            self.update_status(f"已恢复上次未保存的 {self.core.writer.replayed} 项修改")
+        else:
+            self.update_status("就绪")
     
     def update_status(self, message):
         """更新状态栏"""
@@ -112,6 +169,28 @@ class NovelCreator:
                             bg='#4a6fa5', fg='white', relief=tk.FLAT)
         test_btn.pack(pady=10)
         
+        # 缓存统计
+        cache_frame = tk.LabelFrame(api_tab, text="生成缓存", bg='#2d2d2d', fg='white')
+        cache_frame.pack(fill=tk.X, padx=20, pady=10)
+        self.cache_stats_var = tk.StringVar(value=self.cache.summary())
+        tk.Label(cache_frame, textvariable=self.cache_stats_var, bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=5, pady=5)
+        clear_btn = tk.Button(cache_frame, text="清空缓存", command=self.clear_cache,
+                            bg='#a55a5a', fg='white', relief=tk.FLAT)
+        clear_btn.pack(side=tk.RIGHT, padx=5, pady=5)
+        
+        # 多提供商路由：当前提供商出错或过慢时使用其他配置了密钥的提供商
+        routing_frame = tk.LabelFrame(api_tab, text="多提供商路由", bg='#2d2d2d', fg='white')
+        routing_frame.pack(fill=tk.X, padx=20, pady=10)
+        tk.Label(routing_frame, text="策略:", bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=5)
+        self.routing_var = tk.StringVar(value=ROUTING_LABELS[self.core.routing_config()["policy"]])
+        routing_combo = ttk.Combobox(routing_frame, textvariable=self.routing_var,
+                                     values=list(ROUTING_LABELS.values()), state="readonly", width=12)
+        routing_combo.pack(side=tk.LEFT, padx=5, pady=5)
+        routing_combo.bind("<<ComboboxSelected>>", self.routing_changed)
+        self.health_var = tk.StringVar(value=self.health_summary())
+        tk.Label(routing_frame, textvariable=self.health_var, bg='#2d2d2d', fg='white',
+                 justify=tk.LEFT).pack(side=tk.LEFT, padx=10, pady=5)
+        
         # 加载当前选择的API密钥
         self.provider_changed()
     
@@ -129,13 +208,48 @@ class NovelCreator:
         
         # 保存密钥
         self.config["api_providers"][provider]["api_key"] = api_key
-        self.save_config()
+        self.core.save_config()
         
-        # 测试连接
-        self.update_status(f"测试 {provider} 连接...")
+        if not api_key:
+            messagebox.showerror("错误", "请输入API密钥")
+            return
         
-        # 模拟测试 - 在实际应用中应发送真实请求
-        self.root.after(1500, lambda: self.update_status(f"{provider} 连接成功!"))
+        # 测试连接（后台发送真实请求）
+        self.update_status(f"测试 {provider} 连接...")
+        provider_config = dict(self.config["api_providers"][provider])
+        self.engine.submit(
+            "test", self.core.test_connection, provider, provider_config,
+            on_done=lambda latency: self.update_status(
+                f"{provider} 连接成功! 首次 {latency[0] * 1000:.0f} ms（含握手），"
+                f"复用连接 {latency[1] * 1000:.0f} ms"),
+            on_error=lambda e: self.connection_failed(provider, e))
+    
+    def routing_changed(self, event=None):
+        """保存路由策略"""
+        policy = next(name for name, label in ROUTING_LABELS.items() if label == self.routing_var.get())
+        self.config.setdefault("routing", {})["policy"] = policy
+        self.core.save_config()
+        self.update_status(f"路由策略：{self.routing_var.get()}")
+    
+    def update_stats(self):
+        """刷新缓存统计和提供商健康状况"""
+        self.cache_stats_var.set(self.cache.summary())
+        self.health_var.set(self.health_summary())
+
+    def health_summary(self):
+        """提供商健康状况和限流统计"""
+        return self.core.health_summary()
+    
+    def clear_cache(self):
+        """清空生成缓存"""
+        self.cache.clear()
+        self.cache_stats_var.set(self.cache.summary())
+        self.update_status("生成缓存已清空")
+    
+    def connection_failed(self, provider, error):
+        """连接测试失败"""
+        self.update_status(f"{provider} 连接失败")
+        messagebox.showerror("连接失败", str(error))
 
     def create_prompt_tab(self):
         """创建提示词生成选项卡"""
@@ -158,11 +272,14 @@ class NovelCreator:
         frame = tk.Frame(prompt_tab, bg='#2d2d2d')
         frame.pack(fill=tk.X, padx=20, pady=5)
         tk.Label(frame, text="提示类型:", bg='#2d2d2d', fg='white').pack(side=tk.LEFT)
-        prompt_types = ["角色设定", "世界观设定", "情节大纲", "完整故事"]
-        self.prompt_type_var = tk.StringVar(value=prompt_types[0])
-        prompt_type_combo = ttk.Combobox(frame, textvariable=self.prompt_type_var, values=prompt_types)
+        self.prompt_type_var = tk.StringVar(value=PROMPT_TYPES[0])
+        prompt_type_combo = ttk.Combobox(frame, textvariable=self.prompt_type_var, values=PROMPT_TYPES)
         prompt_type_combo.pack(side=tk.LEFT, padx=10)
         
+        self.prompt_no_cache_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="跳过缓存", variable=self.prompt_no_cache_var,
+                       bg='#2d2d2d', fg='white', selectcolor='#1e1e1e').pack(side=tk.LEFT, padx=10)
+        
         # 生成按钮
         generate_btn = tk.Button(prompt_tab, text="生成提示词", command=self.generate_prompt,
                                 bg='#4a6fa5', fg='white', relief=tk.FLAT)
@@ -174,6 +291,7 @@ class NovelCreator:
                                                       insertbackground='white')
         self.prompt_result.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
         self.prompt_result.config(state=tk.DISABLED)
+        self.prompt_writer = TextStreamWriter(self.root, self.prompt_result)
         
         # 保存按钮
         save_btn = tk.Button(prompt_tab, text="保存到剪贴板", command=self.copy_prompt,
@@ -189,39 +307,46 @@ class NovelCreator:
             messagebox.showerror("错误", "请输入主题或关键词")
             return
         
-        self.update_status(f"正在生成 {prompt_type} 提示词...")
-        
-        # 模拟不同提示词生成
-        prompt_results = {
-            "角色设定": [
-                f"角色名称：林风\n年龄：28岁\n职业：私家侦探\n特点：聪明但愤世嫉俗，右腿因一次任务受伤而微跛，有酗酒倾向\n背景故事：曾是警队精英，因不满体制腐败而辞职，开了一家小型侦探社\n动机：寻找三年前杀害搭档的真凶",
-                f"角色名称：艾莉亚\n年龄：17岁\n身份：魔法学院学生\n特点：拥有罕见的时空魔法天赋，但难以控制，左眼因魔法事故变为银色\n背景故事：孤儿，在教会孤儿院长大，被魔法学院院长发掘\n动机：寻找关于自己身世的秘密，控制体内强大的魔法力量"
-            ],
-            "世界观设定": [
-                f"世界名称：埃瑟兰\n纪元：第三魔法纪元\n主要特征：\n- 魔法与蒸汽科技共存\n- 空中浮岛与地下城并存\n- 六大魔法家族掌控政治经济\n- 魔法能源危机日益严重\n独特设定：\n'灵魂共鸣'系统 - 每个人在16岁时会觉醒一个灵魂共鸣体，可以是动物、植物或器物，决定个人的魔法属性与能力上限",
-                f"世界名称：新长安\n时代：赛博朋克唐朝\n主要特征：\n- 传统唐风建筑与霓虹全息投影结合\n- 机械义肢与古武术并存\n- 四大公司控制城市命脉\n- 底层人民生活在充满蒸汽管道的'地下唐城'\n独特设定：\n'经脉芯片' - 将武学经脉系统数字化，通过植入芯片可快速习得武功，但过度使用会导致'经脉过载'"
-            ],
-            "情节大纲": [
-                f"标题：《星尘挽歌》\n\n第一章：陨落之星\n- 主角在垃圾星发现神秘水晶\n- 被帝国士兵追捕，意外激活水晶\n- 获得星尘之力，逃离垃圾星\n\n第二章：星尘学院\n- 进入培养星尘能力者的学院\n- 结识同伴与对手\n- 发现水晶与古代文明的联系\n\n第三章：暗流涌动\n- 学院内部派系斗争\n- 帝国势力渗透学院\n- 主角小队发现院长秘密\n\n最终章：星尘觉醒\n- 古代文明真相揭露\n- 最终决战：学院 vs 帝国舰队\n- 主角牺牲自我重启星尘网络，带来和平新时代",
-                f"标题：《长安夜行录》\n\n第一章：夜雨客\n- 雨夜，神秘女子将婴儿托付给退休捕快\n- 婴儿身上有奇异莲花印记\n- 当晚女子被黑衣人追杀身亡\n\n第二章：十年之后\n- 婴儿长大成为街头混混\n- 莲花印记觉醒，吸引各方势力\n- 退休捕快为保护养子被杀\n\n第三章：身世之谜\n- 主角寻找生母线索\n- 发现与消失的'莲花教'有关\n- 结识前朝遗孤与神秘剑客\n\n最终章：长安决战\n- 揭穿当朝宰相的阴谋\n- 莲花教真相：守护前朝龙脉\n- 主角抉择：复兴前朝还是守护当下长安"
-            ],
-            "完整故事": [
-                f"标题：《时间修补匠》\n\n故事：在时间管理局最底层的维修部，老张是个不起眼的'时间修补匠'，负责修复微小的时间裂缝。一次例行维修中，他发现一个裂缝正在不断扩大。调查后得知，这是有人故意制造'时间炸弹'，目的是让整个时间线崩溃。老张只有72小时，他必须利用自己对时间裂缝的了解和一台老旧的时光穿梭机，穿越到不同历史节点收集'时间锚点'。在维多利亚时代的伦敦，他结识了女发明家艾达；在二战时期的诺曼底，他救下年轻士兵托马斯；在23世纪的月球基地，他获得未来科学家的帮助。最终他揭露了幕后黑手——未来的自己。原来为了拯救患绝症的女儿，未来的他试图重置时间线。老张面临抉择：拯救女儿还是守护时间线。最终他选择后者，但将自己的记忆封存在时间裂缝中，给女儿留下线索..."
-            ]
-        }
-        
-        # 随机选择一个结果
-        import random
-        result = random.choice(prompt_results[prompt_type])
-        
-        # 显示结果
-        self.prompt_result.config(state=tk.NORMAL)
-        self.prompt_result.delete(1.0, tk.END)
-        self.prompt_result.insert(tk.END, result)
-        self.prompt_result.config(state=tk.DISABLED)
+        # 同一结果框只保留最新的任务，旧任务直接取消
+        if self.prompt_job is not None:
+            self.prompt_job.cancel()
         
+        self.update_status(f"正在生成 {prompt_type} 提示词...")
+        self.prompt_writer.reset()
+        self.prompt_job = self.engine.submit(
+            "prompt", self.core.generate_prompt, theme, prompt_type,
+            use_cache=not self.prompt_no_cache_var.get(),
+            on_event=self.prompt_event,
+            on_done=lambda result: self.finish_prompt(prompt_type, result),
+            on_error=lambda e: self.generation_failed("prompt_job", prompt_type, e),
+            on_cancel=self.prompt_writer.flush)
+    
+    def prompt_event(self, name, payload):
+        """提示词任务的流式事件"""
+        if name == "chunk":
+            self.prompt_writer.write(payload)
+        elif name == "cache_hit":
+            self.update_status("提示词命中缓存")
+        elif name == "restart":
+            self.prompt_writer.reset()
+            self.update_status(f"切换到 {payload} 重新生成提示词...")
+    
+    def finish_prompt(self, prompt_type, result):
+        """提示词流式输出结束"""
+        self.prompt_job = None
+        self.prompt_writer.flush()
+        self.update_stats()
         self.update_status(f"{prompt_type}提示词生成完成")
     
+    def generation_failed(self, job_attr, task_name, error):
+        """后台任务失败时提示用户"""
+        setattr(self, job_attr, None)
+        self.prompt_writer.flush()
+        self.generate_writer.flush()
+        self.update_stats()
+        self.update_status(f"{task_name}生成失败: {error}")
+        messagebox.showerror("错误", f"{task_name}生成失败:\n{error}")
+    
     def copy_prompt(self):
         """复制提示词到剪贴板"""
         self.root.clipboard_clear()
@@ -260,6 +385,10 @@ class NovelCreator:
                              bg='#a55a5a', fg='white', relief=tk.FLAT, width=8)
         delete_btn.pack(side=tk.LEFT, padx=2)
         
+        export_btn = tk.Button(list_frame, text="导出整部小说", command=self.export_project,
+                             bg='#5a7d9c', fg='white', relief=tk.FLAT)
+        export_btn.pack(fill=tk.X, pady=(0, 5))
+        
         # 右侧项目编辑器
         edit_frame = tk.Frame(project_tab, bg='#2d2d2d')
         edit_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(5, 10), pady=10)
@@ -284,6 +413,7 @@ class NovelCreator:
         # 项目内容
         notebook = ttk.Notebook(edit_frame)
         notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.project_notebook = notebook
         
         # 大纲选项卡
         outline_frame = ttk.Frame(notebook)
@@ -309,16 +439,50 @@ class NovelCreator:
                                                     insertbackground='white')
         self.setting_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # 章节选项卡：分页列出章节，一次只把一章读入文本框
+        chapter_frame = ttk.Frame(notebook)
+        notebook.add(chapter_frame, text="章节")
+        nav_frame = tk.Frame(chapter_frame, bg='#2d2d2d')
+        nav_frame.pack(fill=tk.X, padx=5, pady=5)
+        tk.Button(nav_frame, text="上一页", command=lambda: self.turn_chapter_page(-1),
+                  bg='#5a7d9c', fg='white', relief=tk.FLAT).pack(side=tk.LEFT, padx=2)
+        tk.Button(nav_frame, text="下一页", command=lambda: self.turn_chapter_page(1),
+                  bg='#5a7d9c', fg='white', relief=tk.FLAT).pack(side=tk.LEFT, padx=2)
+        self.chapter_page_var = tk.StringVar()
+        tk.Label(nav_frame, textvariable=self.chapter_page_var, bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=10)
+        
+        self.chapter_list = tk.Listbox(chapter_frame, width=28, bg='#1e1e1e', fg='white', selectbackground='#4a6fa5',
+                                       exportselection=False)
+        self.chapter_list.pack(side=tk.LEFT, fill=tk.Y, padx=5, pady=5)
+        self.chapter_list.bind("<<ListboxSelect>>", self.show_chapter)
+        self.chapter_viewer = scrolledtext.ScrolledText(chapter_frame, height=10, 
+                                                      bg='#1e1e1e', fg='white',
+                                                      insertbackground='white')
+        self.chapter_viewer.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.chapter_viewer.config(state=tk.DISABLED)
+        self.chapter_page = 0
+        self.chapter_page_numbers = []
+        
         # 保存按钮
-        save_btn = tk.Button(edit_frame, text="保存项目", command=self.save_project,
+        action_frame = tk.Frame(edit_frame, bg='#2d2d2d')
+        action_frame.pack(pady=10)
+        save_btn = tk.Button(action_frame, text="保存项目", command=self.save_project,
                            bg='#4a6fa5', fg='white', relief=tk.FLAT)
-        save_btn.pack(pady=10)
+        save_btn.pack(side=tk.LEFT, padx=5)
+        history_btn = tk.Button(action_frame, text="版本历史", command=self.show_history,
+                              bg='#5a7d9c', fg='white', relief=tk.FLAT)
+        history_btn.pack(side=tk.LEFT, padx=5)
+        entity_btn = tk.Button(action_frame, text="人物设定检查", command=self.show_entities,
+                             bg='#5a7d9c', fg='white', relief=tk.FLAT)
+        entity_btn.pack(side=tk.LEFT, padx=5)
     
     def refresh_project_list(self):
         """刷新项目列表"""
         self.project_list.delete(0, tk.END)
-        for project in self.config["projects"]:
+        for project in self.projects:
             self.project_list.insert(tk.END, project["title"])
+        if self.project_combo is not None:
+            self.project_combo.config(values=[p["title"] for p in self.projects])
     
     def new_project(self):
         """创建新项目"""
@@ -329,6 +493,8 @@ class NovelCreator:
         self.character_text.delete(1.0, tk.END)
         self.setting_text.delete(1.0, tk.END)
         self.current_project = None
+        self.chapter_page = 0
+        self.refresh_chapter_list()
         self.update_status("已创建新项目")
     
     def load_project(self, event):
@@ -337,7 +503,7 @@ class NovelCreator:
             return
         
         index = self.project_list.curselection()[0]
-        project = self.config["projects"][index]
+        project = self.projects[index]
         self.current_project = index
         
         self.title_var.set(project["title"])
@@ -349,9 +515,50 @@ class NovelCreator:
         self.character_text.insert(tk.END, project["characters"])
         self.setting_text.delete(1.0, tk.END)
         self.setting_text.insert(tk.END, project["setting"])
+        # 章节正文在打开时才读取
+        self.chapter_page = 0
+        self.refresh_chapter_list()
         
         self.update_status(f"已加载项目: {project['title']}")
     
+    def refresh_chapter_list(self):
+        """显示当前页的章节（只读取每章的标题行）"""
+        self.chapter_list.delete(0, tk.END)
+        self.show_chapter_text("")
+        if self.current_project is None:
+            self.chapter_page_numbers = []
+            self.chapter_page_var.set("")
+            return
+        project = self.projects[self.current_project]
+        numbers = list(project["chapters"])
+        pages = max(1, (len(numbers) + self.CHAPTER_PAGE_SIZE - 1) // self.CHAPTER_PAGE_SIZE)
+        self.chapter_page = min(max(self.chapter_page, 0), pages - 1)
+        start = self.chapter_page * self.CHAPTER_PAGE_SIZE
+        self.chapter_page_numbers = numbers[start:start + self.CHAPTER_PAGE_SIZE]
+        for number in self.chapter_page_numbers:
+            self.chapter_list.insert(tk.END, f"{number}. {self.core.chapter_heading(project, number)}")
+        self.chapter_page_var.set(f"第 {self.chapter_page + 1}/{pages} 页，共 {len(numbers)} 章")
+    
+    def turn_chapter_page(self, step):
+        """章节列表翻页"""
+        self.chapter_page += step
+        self.refresh_chapter_list()
+    
+    def show_chapter(self, event):
+        """把选中的章节读入文本框"""
+        if not self.chapter_list.curselection() or self.current_project is None:
+            return
+        number = self.chapter_page_numbers[self.chapter_list.curselection()[0]]
+        project = self.projects[self.current_project]
+        self.show_chapter_text(project["chapters"].get(number, ""))
+    
+    def show_chapter_text(self, text):
+        """替换章节文本框的内容"""
+        self.chapter_viewer.config(state=tk.NORMAL)
+        self.chapter_viewer.delete(1.0, tk.END)
+        self.chapter_viewer.insert(tk.END, text)
+        self.chapter_viewer.config(state=tk.DISABLED)
+    
     def save_project(self):
         """保存当前项目"""
         title = self.title_var.get()
@@ -365,37 +572,212 @@ class NovelCreator:
             "genre": self.genre_var.get(),
             "outline": self.outline_text.get(1.0, tk.END).strip(),
             "characters": self.character_text.get(1.0, tk.END).strip(),
-            "setting": self.setting_text.get(1.0, tk.END).strip(),
-            "chapters": []  # 章节内容
+            "setting": self.setting_text.get(1.0, tk.END).strip()
         }
         
         if self.current_project is None:
             # 新项目
-            self.config["projects"].append(project_data)
-            self.current_project = len(self.config["projects"]) - 1
+            self.core.save_project(project_data)
+            self.current_project = len(self.projects) - 1
         else:
-            # 更新现有项目
-            self.config["projects"][self.current_project] = project_data
+            self.core.save_project(project_data, self.projects[self.current_project])
         
-        self.save_config()
         self.refresh_project_list()
         self.update_status(f"项目已保存: {title}")
     
+    def show_history(self):
+        """当前选项卡的字段（或选中章节）的版本历史：与当前内容比较、查看全文、恢复"""
+        if self.current_project is None:
+            messagebox.showerror("错误", "没有打开的项目")
+            return
+        project = self.projects[self.current_project]
+        fields = list(SEARCH_FIELDS)
+        tab = self.project_notebook.index("current")
+        if tab < len(fields):
+            target = fields[tab]
+            label = SEARCH_FIELDS[target]
+        else:
+            if not self.chapter_list.curselection():
+                messagebox.showinfo("提示", "请先选择一个章节")
+                return
+            target = self.chapter_page_numbers[self.chapter_list.curselection()[0]]
+            label = f"第 {target} 章"
+        revisions = self.core.history(project, target)
+        if not revisions:
+            messagebox.showinfo("提示", f"{label}还没有历史版本")
+            return
+        revisions.reverse()
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"版本历史 - {label}")
+        window.geometry("800x500")
+        window.configure(bg='#2d2d2d')
+        revision_list = tk.Listbox(window, width=36, bg='#1e1e1e', fg='white', selectbackground='#4a6fa5',
+                                   exportselection=False)
+        revision_list.pack(side=tk.LEFT, fill=tk.Y, padx=5, pady=5)
+        for revision in revisions:
+            stamp = datetime.datetime.fromtimestamp(revision["time"]).strftime("%m-%d %H:%M")
+            revision_list.insert(tk.END, f"{revision['index']}. {stamp} {revision['source']} "
+                                         f"{revision['size']}字 +{revision['added']}/-{revision['removed']}")
+        right_frame = tk.Frame(window, bg='#2d2d2d')
+        right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        viewer = scrolledtext.ScrolledText(right_frame, bg='#1e1e1e', fg='white')
+        viewer.tag_config("added", foreground='#7fc97f')
+        viewer.tag_config("removed", foreground='#e07070')
+        viewer.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        def selected():
+            if not revision_list.curselection():
+                return None
+            return revisions[revision_list.curselection()[0]]
+        
+        def show(lines):
+            viewer.config(state=tk.NORMAL)
+            viewer.delete(1.0, tk.END)
+            for line in lines:
+                tag = "added" if line.startswith("+") else "removed" if line.startswith("-") else ""
+                viewer.insert(tk.END, line + "\n", tag)
+            viewer.config(state=tk.DISABLED)
+        
+        def show_diff(event=None):
+            revision = selected()
+            if revision is not None:
+                show(self.core.history_diff(project, target, f"#{revision['index']}") or ["（与当前内容相同）"])
+        
+        def show_text():
+            revision = selected()
+            if revision is not None:
+                show(self.core.history_text(project, target, f"#{revision['index']}").splitlines())
+        
+        def restore():
+            revision = selected()
+            if revision is None or not messagebox.askyesno(
+                    "确认恢复", f"把{label}恢复为修订 {revision['index']}？当前内容会保留在历史中。", parent=window):
+                return
+            text = self.core.restore_revision(project, target, f"#{revision['index']}")
+            if isinstance(target, int):
+                self.refresh_chapter_list()
+            else:
+                widget = {"outline": self.outline_text, "characters": self.character_text,
+                          "setting": self.setting_text}[target]
+                widget.delete(1.0, tk.END)
+                widget.insert(tk.END, text)
+            self.update_status(f"{label}已恢复为修订 {revision['index']}")
+            window.destroy()
+        
+        revision_list.bind("<<ListboxSelect>>", show_diff)
+        btn_frame = tk.Frame(right_frame, bg='#2d2d2d')
+        btn_frame.pack(pady=5)
+        for text, command in (("与当前比较", show_diff), ("查看全文", show_text), ("恢复此版本", restore)):
+            tk.Button(btn_frame, text=text, command=command, bg='#5a7d9c', fg='white',
+                      relief=tk.FLAT).pack(side=tk.LEFT, padx=5)
+        revision_list.selection_set(0)
+        show_diff()
+    
+    def show_entities(self):
+        """在后台扫描全部章节，列出角色和世界观条目的出现情况以及与设定矛盾之处"""
+        if self.current_project is None:
+            messagebox.showerror("错误", "没有打开的项目")
+            return
+        if self.entity_job is not None:
+            return
+        project = self.projects[self.current_project]
+        self.update_status("正在检查人物设定...")
+        
+        def done(report):
+            self.entity_job = None
+            self.update_status(f"人物设定检查完成：{len(report['entities'])} 个条目，"
+                               f"{len(report['conflicts'])} 处可能矛盾")
+            self.show_entity_report(project, report)
+        
+        def failed(error):
+            self.entity_job = None
+            messagebox.showerror("错误", f"人物设定检查失败:\n{error}")
+        
+        self.entity_job = self.engine.submit("entities", self.core.entity_report, project,
+                                             on_done=done, on_error=failed)
+    
+    def show_entity_report(self, project, report):
+        """人物设定检查结果窗口"""
+        if not report["entities"]:
+            messagebox.showinfo("提示", "角色和世界观中没有识别出条目，请按“名称（别名）：描述”每行写一个")
+            return
+        window = tk.Toplevel(self.root)
+        window.title(f"人物设定 - {project['title']}")
+        window.geometry("800x500")
+        window.configure(bg='#2d2d2d')
+        columns = (("name", "名称", 100), ("field", "类型", 60), ("aliases", "别名", 140),
+                   ("attributes", "属性", 220), ("chapters", "出现章节", 160), ("count", "次数", 60))
+        tree = ttk.Treeview(window, columns=[c[0] for c in columns], show="headings", height=10)
+        for name, heading, width in columns:
+            tree.heading(name, text=heading)
+            tree.column(name, width=width, anchor=tk.W)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        for entity in report["entities"]:
+            chapters = entity["chapters"]
+            appeared = f"{len(chapters)} 章（第{chapters[0]}-{chapters[-1]}章）" if chapters else "未出现"
+            attributes = "，".join(f"{key}：{value}" for key, value in entity["attributes"].items())
+            tree.insert("", tk.END, values=(entity["name"], SEARCH_FIELDS[entity["field"]],
+                                            "、".join(entity["aliases"]), attributes, appeared, entity["count"]))
+        tk.Label(window, text=f"可能矛盾（{len(report['conflicts'])} 处）", bg='#2d2d2d',
+                 fg='white').pack(anchor=tk.W, padx=5)
+        conflicts = scrolledtext.ScrolledText(window, height=8, bg='#1e1e1e', fg='white')
+        conflicts.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        conflicts.insert(tk.END, "\n".join(map(format_conflict, report["conflicts"])) or "没有发现矛盾")
+        conflicts.config(state=tk.DISABLED)
+    
     def delete_project(self):
         """删除当前选中的项目"""
         if not self.project_list.curselection():
             return
         
         index = self.project_list.curselection()[0]
-        title = self.config["projects"][index]["title"]
+        title = self.projects[index]["title"]
         
         if messagebox.askyesno("确认删除", f"确定要删除项目 '{title}' 吗？"):
-            del self.config["projects"][index]
-            self.save_config()
+            self.core.delete_project(self.projects[index])
             self.refresh_project_list()
             self.new_project()
             self.update_status(f"已删除项目: {title}")
     
+    def export_project(self):
+        """在后台导出当前项目（TXT、Markdown 或 EPUB），再次导出同一文件时只重写变化的章节"""
+        if self.current_project is None:
+            messagebox.showerror("错误", "没有打开的项目")
+            return
+        if self.export_job is not None:
+            messagebox.showinfo("提示", "正在导出，请稍候")
+            return
+        project = self.projects[self.current_project]
+        file_path = filedialog.asksaveasfilename(
+            initialfile=project["title"],
+            defaultextension=".txt",
+            filetypes=[("文本文件", "*.txt"), ("Markdown", "*.md"), ("EPUB 电子书", "*.epub")]
+        )
+        if not file_path:
+            return
+        
+        def on_event(name, payload):
+            if name == "export_progress":
+                done, total = payload
+                self.update_status(f"正在导出：{done}/{total} 章")
+        
+        self.export_job = self.engine.submit("export", self.core.export_project, project, file_path,
+                                             on_event=on_event, on_done=self.finish_export,
+                                             on_error=self.export_failed)
+    
+    def finish_export(self, report):
+        """导出完成"""
+        self.export_job = None
+        self.update_status(f"已导出到: {report['path']}（{report['chapters']} 章，"
+                           f"重写 {report['written']} 章）")
+    
+    def export_failed(self, error):
+        """导出失败"""
+        self.export_job = None
+        self.update_status(f"导出失败: {error}")
+        messagebox.showerror("错误", f"导出失败:\n{error}")
+    
     def create_generate_tab(self):
         """创建小说生成选项卡"""
         generate_tab = ttk.Frame(self.notebook)
@@ -407,32 +789,35 @@ class NovelCreator:
         
         # 项目选择
         tk.Label(settings_frame, text="选择项目:", bg='#2d2d2d', fg='white').grid(row=0, column=0, sticky="e", padx=5, pady=5)
-        self.project_names = [p["title"] for p in self.config["projects"]]
+        self.project_names = [p["title"] for p in self.projects]
         self.generate_project_var = tk.StringVar()
-        project_combo = ttk.Combobox(settings_frame, textvariable=self.generate_project_var, values=self.project_names, width=40)
-        project_combo.grid(row=0, column=1, sticky="w", padx=5, pady=5)
+        self.project_combo = ttk.Combobox(settings_frame, textvariable=self.generate_project_var, values=self.project_names, width=40)
+        self.project_combo.grid(row=0, column=1, sticky="w", padx=5, pady=5)
         
         # 生成类型
         tk.Label(settings_frame, text="生成类型:", bg='#2d2d2d', fg='white').grid(row=1, column=0, sticky="e", padx=5, pady=5)
-        generate_types = ["完整章节", "段落续写", "场景描述", "对话生成"]
-        self.generate_type_var = tk.StringVar(value=generate_types[0])
-        type_combo = ttk.Combobox(settings_frame, textvariable=self.generate_type_var, values=generate_types, width=15)
+        self.generate_type_var = tk.StringVar(value=GENERATE_TYPES[0])
+        type_combo = ttk.Combobox(settings_frame, textvariable=self.generate_type_var, values=GENERATE_TYPES, width=15)
         type_combo.grid(row=1, column=1, sticky="w", padx=5, pady=5)
         
         # 风格控制
         tk.Label(settings_frame, text="写作风格:", bg='#2d2d2d', fg='white').grid(row=2, column=0, sticky="e", padx=5, pady=5)
         self.style_var = tk.StringVar(value="文学性")
         style_combo = ttk.Combobox(settings_frame, textvariable=self.style_var, 
-                                  values=["简洁", "详细", "文学性", "诗意", "幽默", "悬疑"], width=15)
+                                  values=STYLES, width=15)
         style_combo.grid(row=2, column=1, sticky="w", padx=5, pady=5)
         
         # 生成长度
         tk.Label(settings_frame, text="生成长度:", bg='#2d2d2d', fg='white').grid(row=3, column=0, sticky="e", padx=5, pady=5)
         self.length_var = tk.StringVar(value="中等")
         length_combo = ttk.Combobox(settings_frame, textvariable=self.length_var, 
-                                   values=["短", "中等", "长", "超长"], width=15)
+                                   values=LENGTHS, width=15)
         length_combo.grid(row=3, column=1, sticky="w", padx=5, pady=5)
         
+        self.no_cache_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(settings_frame, text="跳过缓存（重新生成）", variable=self.no_cache_var,
+                       bg='#2d2d2d', fg='white', selectcolor='#1e1e1e').grid(row=4, column=1, sticky="w", padx=5, pady=5)
+        
         # 提示词输入
         prompt_frame = tk.LabelFrame(generate_tab, text="自定义提示词（可选）", bg='#2d2d2d', fg='white')
         prompt_frame.pack(fill=tk.X, padx=20, pady=5)
@@ -448,6 +833,30 @@ class NovelCreator:
                                bg='#4a6fa5', fg='white', relief=tk.FLAT, font=("Arial", 10, "bold"))
         generate_btn.pack(side=tk.LEFT, padx=10)
         
+        cancel_btn = tk.Button(generate_frame, text="取消生成", command=self.cancel_generation,
+                             bg='#a55a5a', fg='white', relief=tk.FLAT)
+        cancel_btn.pack(side=tk.LEFT, padx=10)
+        
+        # 批量生成：按大纲中的章节范围并行生成
+        batch_frame = tk.LabelFrame(generate_tab, text="批量生成（按大纲章节）", bg='#2d2d2d', fg='white')
+        batch_frame.pack(fill=tk.X, padx=20, pady=5)
+        tk.Label(batch_frame, text="从第", bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=(10, 2))
+        self.batch_start_var = tk.IntVar(value=1)
+        tk.Spinbox(batch_frame, from_=1, to=9999, textvariable=self.batch_start_var, width=5).pack(side=tk.LEFT)
+        tk.Label(batch_frame, text="章到第", bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=2)
+        self.batch_end_var = tk.IntVar(value=10)
+        tk.Spinbox(batch_frame, from_=1, to=9999, textvariable=self.batch_end_var, width=5).pack(side=tk.LEFT)
+        tk.Label(batch_frame, text="章", bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=2)
+        self.batch_overwrite_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(batch_frame, text="覆盖已有章节", variable=self.batch_overwrite_var,
+                       bg='#2d2d2d', fg='white', selectcolor='#1e1e1e').pack(side=tk.LEFT, padx=10)
+        tk.Button(batch_frame, text="开始批量生成", command=self.start_batch,
+                  bg='#4a6fa5', fg='white', relief=tk.FLAT).pack(side=tk.LEFT, padx=5)
+        tk.Button(batch_frame, text="停止", command=self.cancel_batch,
+                  bg='#a55a5a', fg='white', relief=tk.FLAT).pack(side=tk.LEFT, padx=5)
+        self.batch_status_var = tk.StringVar()
+        tk.Label(batch_frame, textvariable=self.batch_status_var, bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=10)
+        
         # 结果展示
         result_frame = tk.Frame(generate_tab, bg='#2d2d2d')
         result_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
@@ -457,6 +866,7 @@ class NovelCreator:
                                                       insertbackground='white')
         self.generated_text.pack(fill=tk.BOTH, expand=True)
         self.generated_text.config(state=tk.DISABLED)
+        self.generate_writer = TextStreamWriter(self.root, self.generated_text)
         
         # 操作按钮
         btn_frame = tk.Frame(result_frame, bg='#2d2d2d')
@@ -481,62 +891,197 @@ class NovelCreator:
             messagebox.showerror("错误", "请选择一个项目")
             return
         
-        # 查找项目
-        project = None
-        for p in self.config["projects"]:
-            if p["title"] == project_name:
-                project = p
-                break
-        
+        project = self.core.find_project(project_name)
         if not project:
             messagebox.showerror("错误", "项目不存在")
             return
         
-        # 模拟生成不同内容
-        content_types = {
-            "完整章节": [
-                "第一章 星尘觉醒\n\n林风推开吱呀作响的木门，雨水顺着他的旧皮衣滴落在斑驳的地板上。'老张，有新案子了？'他朝昏暗的屋内喊道。角落的阴影里，一个佝偻的身影动了动，烟斗的火光在黑暗中明灭。'这次不一样，'沙哑的声音响起，'有人出高价，找一块会发光的石头。'林风嗤笑一声，'又是寻宝？你知道我不接这种——'话未说完，一张泛黄的照片被推到桌上。照片上是一块菱形的蓝色水晶，内部仿佛有星河流动。林风的手指微微颤抖，这块水晶...和他三年前在搭档尸体旁见到的一模一样。",
-                "第二章 魔法学院的秘密\n\n艾莉亚屏住呼吸，藏在图书馆的巨大书架后。月光透过彩色玻璃窗，在古老的书卷上投下诡异的光影。她听到脚步声越来越近——是院长和那个黑袍人。'仪式必须在下个满月完成，'院长低沉的声音中带着一丝急切，'那个女孩的力量比我们想象的还要强大。'黑袍人发出沙哑的笑声，'银眼少女...终于找到了。艾莉亚感到一阵寒意，她下意识地碰了碰自己的左眼，那里在黑暗中正发出微弱的银光。"
-            ],
-            "段落续写": [
-                "林风握紧照片，冰冷的触感从指尖蔓延至心脏。三年来，这个画面无数次在他噩梦中出现——搭档李明倒在血泊中，右手紧握着这样一块发光的石头，眼神里满是未说出口的警告。雨水敲打窗户的声音将他拉回现实。'雇主是谁？'他声音沙哑。老张摇摇头，'匿名。但定金足够你买下半个街区。'林风盯着照片，蓝色水晶仿佛有生命般微微脉动。突然，他注意到照片角落有个模糊的标记——一只展开翅膀的鹰，那是李氏家族的徽章。李明从未提起过自己的家族背景。",
-                "艾莉亚悄悄后退，却不小心碰倒了一摞古籍。巨大的声响在寂静的图书馆回荡。'谁在那里？'院长的声音陡然变得凌厉。艾莉亚转身就跑，耳边风声呼啸。突然，一道魔法屏障在她面前升起，她猝不及防撞了上去。黑袍人缓步走来，兜帽下露出苍白的下巴，'意外的收获。'他的手指在空中划出复杂的符号，艾莉亚感到全身魔力被禁锢。就在这时，她胸前的吊坠突然发热——这是孤儿院院长临终前给她的遗物，从未有过任何反应。"
-            ],
-            "场景描述": [
-                "废弃的教堂里，彩色玻璃早已破碎，月光从空洞的窗口倾泻而下，照亮空气中漂浮的尘埃。墙角蛛网密布，倒下的长椅像巨兽的骸骨。祭坛上方，巨大的管风琴只剩扭曲的骨架，琴键上停着一只乌鸦，血红的眼睛注视着闯入者。林风的手电光束扫过墙壁，突然定格——那里刻着与照片上一模一样的鹰形徽章，下方用拉丁文写着：'光生于暗'。徽章中央有个水晶形状的凹槽，大小与他手中的照片完全吻合。",
-                "魔法学院的星象塔顶，艾莉亚站在环形露台边缘。脚下是翻滚的云海，头顶是触手可及的璀璨星河。七座悬浮的岛屿环绕着主塔，由发光的虹桥相连。东岛是植物园，发光的藤蔓缠绕成塔；西岛是炼金工坊，蒸汽与魔法火焰交织升腾；南岛图书馆的穹顶是巨大的水晶球，映照着银河的投影；北岛训练场上，学徒们骑着扫帚在空中划出银色轨迹。中央的主塔尖顶射出一道蓝色光柱，直通云霄——那是维持浮岛魔力的能量源，也是院长禁止任何人接近的禁地。"
-            ],
-            "对话生成": [
-                "'你早知道李明的身份，是不是？'林风猛地转身，枪口对准老张。老人叹了口气，烟斗在黑暗中明灭，'三年前我警告过你，别查那个案子。''他是你什么人？'林风的手指扣在扳机上。'我儿子，'老张的声音突然苍老了十岁，'他加入李氏家族是为了查清他们用星石做的勾当。'枪口微微下垂，'那为什么现在告诉我？''因为昨晚，'老张掀开外套，腹部缠着渗血的绷带，'他们找到了我。这块石头...'他掏出一块蓝色水晶，'是唯一能阻止他们的关键。拿着它，去找一个叫'星尘之子'的组织...'话未说完，窗外传来玻璃破碎声，一道红光射入，正中老张胸口。",
-                "'你到底是什么人？'艾莉亚紧握发烫的吊坠，盯着黑袍人。对方低笑，'我是影法师，被学院驱逐的第一任院长。'他掀开兜帽，露出一张布满符文刺青的脸，'现在的院长是我曾经的学徒，他背叛了我，偷走了控制浮岛的核心咒语。'艾莉亚皱眉，'这和我有什么关系？''因为你是星之女，'影法师指着她的左眼，'只有你的银眼能看穿虹桥的魔法路径，进入中央塔顶。'吊坠突然漂浮起来，投射出一幅星图，'这吊坠里有你母亲留下的信息。她不是抛弃你，而是为了保护你逃离院长的追捕。'"
-            ]
-        }
-        
         # 获取生成类型
         gen_type = self.generate_type_var.get()
+        self.start_generation(project, gen_type, self.style_var.get(), self.length_var.get(),
+                              self.custom_prompt_var.get(), use_cache=not self.no_cache_var.get())
+    
+    def start_generation(self, project, gen_type, style, length, custom_prompt, use_cache=True, checkpoint_id=None):
+        """提交生成任务，checkpoint_id 不为空时从该断点继续"""
+        # 同一结果框只保留最新的任务，旧任务直接取消
+        if self.generate_job is not None:
+            self.generate_job.cancel()
         
-        # 模拟生成过程
         self.update_status(f"正在生成 {gen_type}...")
-        self.generated_text.config(state=tk.NORMAL)
-        self.generated_text.delete(1.0, tk.END)
-        
-        # 显示"正在生成"动画
-        self.generated_text.insert(tk.END, f"正在生成{gen_type}内容，请稍候...")
-        self.root.update()
-        
-        # 模拟延迟
-        import random
-        self.root.after(2000, lambda: self.finish_generation(content_types, gen_type))
+        # 首个片段到达前显示等待提示
+        self.generate_writer.reset(f"正在生成{gen_type}内容，请稍候...")
+        self.generate_started = time.monotonic()
+        self.generate_first_chunk = None
+        self.generate_cache_hit = False
+        self.generate_provider = None
+        self.generate_conflicts = []
+        # 服务器模式由服务器管理断点，只有恢复时才传入
+        options = {"checkpoint_id": checkpoint_id} if checkpoint_id else {}
+        
+        self.generate_job = self.engine.submit(
+            "generate", self.core.generate_content, project, gen_type, style, length, custom_prompt,
+            use_cache=use_cache, **options,
+            on_event=lambda name, payload: self.generation_event(gen_type, name, payload),
+            on_done=lambda content: self.finish_generation(gen_type, content),
+            on_error=lambda e: self.generation_failed("generate_job", gen_type, e),
+            on_cancel=lambda: self.generation_cancelled(gen_type))
     
-    def finish_generation(self, content_types, gen_type):
-        """完成生成并显示结果"""
-        # 随机选择一个内容
-        content = random.choice(content_types[gen_type])
+    def generation_event(self, gen_type, name, chunk):
+        """收到流式片段：首个片段替换等待提示并记录首字延迟"""
+        if name == "cache_hit":
+            self.generate_cache_hit = True
+            return
+        if name == "provider":
+            self.generate_provider = chunk
+            return
+        if name == "restart":
+            # 原提供商中途失败，换用其他提供商从头生成
+            self.generate_writer.reset()
+            self.update_status(f"切换到 {chunk} 重新生成 {gen_type}...")
+            return
+        if name == "resumed":
+            # 下一个片段是断点中已生成的全部内容
+            self.generate_writer.reset()
+            self.generate_first_chunk = time.monotonic() - self.generate_started
+            self.update_status(f"从断点继续生成 {gen_type}（已生成 {chunk} 字）...")
+            return
+        if name == "entity_conflicts":
+            self.generate_conflicts = chunk
+            return
+        if name == "duplicate":
+            # 与已有章节近似重复，提示用户可以停止生成
+            chapters = "、".join(f"第{n}章" for n in chunk["chapters"][:3])
+            self.update_status(f"注意：正在生成的内容与{chapters}近似重复"
+                               f"（重复 {chunk['ratio']:.0%}），可以点击“取消生成”")
+            return
+        if self.generate_first_chunk is None:
+            self.generate_first_chunk = time.monotonic() - self.generate_started
+            self.generate_writer.reset()
+            self.update_status(f"正在生成 {gen_type}...（首字 {self.generate_first_chunk:.2f}s）")
+        self.generate_writer.write(chunk)
+    
+    def finish_generation(self, gen_type, content):
+        """流式输出结束"""
+        self.generate_job = None
+        self.generate_writer.flush()
+        elapsed = time.monotonic() - self.generate_started
+        first = self.generate_first_chunk or elapsed
+        source = "，命中缓存" if self.generate_cache_hit else ""
+        if self.generate_provider and not self.generate_cache_hit:
+            source += f"，{self.generate_provider}"
+        self.update_stats()
+        status = f"{gen_type}生成完成（首字 {first:.2f}s，总计 {elapsed:.2f}s，{len(content)} 字{source}）"
+        if self.generate_conflicts:
+            status += (f"；注意：与人物设定可能矛盾 {len(self.generate_conflicts)} 处，"
+                       f"如 {format_conflict(self.generate_conflicts[0])}")
+        self.update_status(status)
+    
+    def cancel_generation(self):
+        """取消正在进行的生成任务"""
+        if self.generate_job is None:
+            return
+        self.generate_job.cancel()
+        self.generate_job = None
+    
+    def generation_cancelled(self, gen_type):
+        """用户主动取消时更新状态（被新任务替换的旧任务不提示）"""
+        if self.generate_job is None:
+            self.generate_writer.flush()
+            self.update_status(f"{gen_type}生成已取消")
+    
+    def start_batch(self):
+        """批量生成大纲中指定范围的章节"""
+        if self.batch_job is not None:
+            messagebox.showinfo("提示", "已有批量任务在运行")
+            return
+        project = self.core.find_project(self.generate_project_var.get())
+        if not project:
+            messagebox.showerror("错误", "请选择一个项目")
+            return
         
-        self.generated_text.delete(1.0, tk.END)
-        self.generated_text.insert(tk.END, content)
-        self.generated_text.config(state=tk.DISABLED)
-        self.update_status(f"{gen_type}生成完成")
+        try:
+            runner = self.core.create_batch(project, self.batch_start_var.get(), self.batch_end_var.get(),
+                                            self.batch_overwrite_var.get(), self.style_var.get(),
+                                            self.length_var.get(), self.custom_prompt_var.get())
+        except ValueError as e:
+            messagebox.showinfo("提示", str(e))
+            return
+        self.run_batch(project, runner)
+    
+    def run_batch(self, project, runner):
+        """提交批量任务"""
+        self.batch_job = self.engine.submit(
+            "batch", runner.run,
+            on_event=lambda name, payload: self.batch_event(project, name, payload),
+            on_done=self.finish_batch,
+            on_error=lambda e: self.generation_failed("batch_job", "批量章节", e),
+            on_cancel=lambda: self.finish_batch(runner.snapshot(), cancelled=True))
+        self.batch_status_var.set(f"批量生成 {len(runner.chapters)} 章，使用 {', '.join(runner.providers)}")
+        self.update_status(f"开始批量生成 {len(runner.chapters)} 章")
+    
+    def batch_event(self, project, name, payload):
+        """批量任务的进度事件"""
+        if name == "chapter_done":
+            number, text, summary = payload
+            project["chapters"][number] = text
+            project["summaries"][number] = summary
+            if self.current_project is not None and self.projects[self.current_project] is project:
+                self.refresh_chapter_list()
+        elif name == "entity_conflicts":
+            self.update_status(f"注意：{format_conflict(payload[0])}（共 {len(payload)} 处，见“人物设定检查”）")
+        elif name == "batch_progress":
+            self.batch_status_var.set(format_batch_report(payload))
+    
+    def finish_batch(self, report, cancelled=False):
+        """批量任务结束"""
+        self.batch_job = None
+        summary = format_batch_report(report)
+        by_provider = "，".join(f"{name} {count} 章" for name, count in report["by_provider"].items())
+        self.batch_status_var.set(summary)
+        self.update_stats()
+        state = "已停止" if cancelled else "完成"
+        self.update_status(f"批量生成{state}：{summary}（{by_provider}，用时 {report['elapsed']:.0f}s）")
+        if report["failed"]:
+            failed = "、".join(str(number) for number, _ in report["failed"])
+            messagebox.showwarning("部分章节失败", f"以下章节生成失败：第 {failed} 章\n\n{report['failed'][0][1]}")
+    
+    def offer_resume(self):
+        """上次中断的生成和批量任务：询问继续、放弃还是下次再说"""
+        checkpoints = self.core.pending_checkpoints()
+        if not checkpoints:
+            return
+        lines = "\n".join(f"· {self.core.describe_checkpoint(c)}" for c in checkpoints[:10])
+        answer = messagebox.askyesnocancel(
+            "继续未完成的任务",
+            f"上次有 {len(checkpoints)} 个任务没有完成：\n\n{lines}\n\n"
+            f"是：从断点继续（已完成的章节不会重新生成）\n否：放弃这些任务\n取消：下次启动时再问")
+        if answer is None:
+            return
+        if not answer:
+            for checkpoint in checkpoints:
+                checkpoint.remove()
+            return
+        # 结果框和批量任务各只有一个，分别继续最近的一个，其余的下次启动时再问
+        latest = {checkpoint.kind: checkpoint for checkpoint in checkpoints}
+        for kind, checkpoint in latest.items():
+            project = self.core.find_project(checkpoint.project)
+            params = checkpoint.state["params"]
+            if kind == "batch":
+                try:
+                    runner = self.core.create_batch(project, checkpoint_id=checkpoint.id, **params)
+                except ValueError as e:
+                    self.update_status(str(e))
+                    continue
+                self.run_batch(project, runner)
+            else:
+                self.generate_project_var.set(project["title"])
+                self.generate_type_var.set(params["gen_type"])
+                self.start_generation(project, checkpoint_id=checkpoint.id, **params)
+    
+    def cancel_batch(self):
+        """停止批量任务（已完成的章节保留）"""
+        if self.batch_job is not None:
+            self.batch_job.cancel()
     
     def copy_generated(self):
         """复制生成的内容"""
@@ -561,6 +1106,149 @@ class NovelCreator:
                 f.write(content)
             self.update_status(f"内容已保存到: {file_path}")
     
+    def create_search_tab(self):
+        """创建全文检索选项卡"""
+        search_tab = ttk.Frame(self.notebook)
+        self.notebook.add(search_tab, text="全文检索")
+        
+        frame = tk.Frame(search_tab, bg='#2d2d2d')
+        frame.pack(fill=tk.X, padx=20, pady=10)
+        tk.Label(frame, text="检索内容:", bg='#2d2d2d', fg='white').pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(frame, textvariable=self.search_var, width=40)
+        search_entry.pack(side=tk.LEFT, padx=10)
+        search_entry.bind("<Return>", lambda event: self.run_search())
+        self.search_current_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="仅当前项目", variable=self.search_current_var,
+                       bg='#2d2d2d', fg='white', selectcolor='#1e1e1e').pack(side=tk.LEFT, padx=5)
+        tk.Button(frame, text="检索", command=self.run_search,
+                  bg='#4a6fa5', fg='white', relief=tk.FLAT).pack(side=tk.LEFT, padx=5)
+        
+        self.search_list = tk.Listbox(search_tab, height=10, bg='#1e1e1e', fg='white', selectbackground='#4a6fa5',
+                                      exportselection=False)
+        self.search_list.pack(fill=tk.X, padx=20, pady=5)
+        self.search_list.bind("<<ListboxSelect>>", self.show_search_result)
+        
+        self.search_preview = scrolledtext.ScrolledText(search_tab, height=12, bg='#1e1e1e', fg='white',
+                                                        insertbackground='white')
+        self.search_preview.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        self.search_preview.tag_config("hit", background='#8a6d3b')
+        self.search_preview.config(state=tk.DISABLED)
+    
+    def run_search(self):
+        """在后台执行检索（首次检索时可能需要等待索引构建完成）"""
+        query = self.search_var.get().strip()
+        if not query:
+            return
+        project_id = None
+        if self.search_current_var.get() and self.current_project is not None:
+            project_id = self.projects[self.current_project]["id"]
+        if self.search_job is not None:
+            self.search_job.cancel()
+        started = time.monotonic()
+        self.search_job = self.engine.submit(
+            "search", lambda job: self.core.search(query, limit=50, project_id=project_id),
+            on_done=lambda results: self.show_search_results(query, results, time.monotonic() - started),
+            on_error=self.search_failed)
+    
+    def search_failed(self, error):
+        """检索失败"""
+        self.search_job = None
+        self.update_status(f"检索失败: {error}")
+        messagebox.showerror("错误", f"检索失败:\n{error}")
+    
+    def show_search_results(self, query, results, elapsed):
+        """显示检索结果列表"""
+        self.search_job = None
+        self.search_query = query
+        self.search_results = results
+        self.search_list.delete(0, tk.END)
+        for result in results:
+            self.search_list.insert(tk.END, f"{result['title']} · {result['location']}：{result['snippet']}")
+        self.update_status(f"检索“{query}”：{len(results)} 条结果（{elapsed * 1000:.0f} ms）")
+    
+    def show_search_result(self, event):
+        """预览选中的检索结果并高亮命中的文字"""
+        if not self.search_list.curselection():
+            return
+        result = self.search_results[self.search_list.curselection()[0]]
+        text = self.core.doc_text((result["project_id"], result["field"], result["number"]))
+        self.search_preview.config(state=tk.NORMAL)
+        self.search_preview.delete(1.0, tk.END)
+        self.search_preview.insert(tk.END, text)
+        start = self.search_preview.search(self.search_query, 1.0, nocase=True, stopindex=tk.END)
+        if start:
+            self.search_preview.tag_add("hit", start, f"{start}+{len(self.search_query)}c")
+            self.search_preview.see(start)
+        self.search_preview.config(state=tk.DISABLED)
+    
+    def create_metrics_tab(self):
+        """创建调用指标选项卡"""
+        metrics_tab = ttk.Frame(self.notebook)
+        self.notebook.add(metrics_tab, text="调用指标")
+        
+        frame = tk.Frame(metrics_tab, bg='#2d2d2d')
+        frame.pack(fill=tk.X, padx=20, pady=10)
+        tk.Button(frame, text="刷新", command=self.refresh_metrics,
+                  bg='#4a6fa5', fg='white', relief=tk.FLAT).pack(side=tk.LEFT, padx=5)
+        tk.Button(frame, text="导出", command=self.export_metrics,
+                  bg='#4a6fa5', fg='white', relief=tk.FLAT).pack(side=tk.LEFT, padx=5)
+        self.metrics_total_var = tk.StringVar()
+        tk.Label(frame, textvariable=self.metrics_total_var, bg='#2d2d2d', fg='white').pack(side=tk.LEFT, padx=10)
+        
+        columns = (("provider", "提供商", 80), ("kind", "类型", 80), ("calls", "调用", 50), ("errors", "失败", 50),
+                   ("cache_hits", "缓存", 50), ("coalesced", "合并", 50), ("retries", "重试", 50),
+                   ("queue", "排队 p50/p95", 100),
+                   ("first", "首字 p50/p95", 100), ("total", "总耗时 p50/p95", 110),
+                   ("tokens", "输入/输出 token", 120), ("cost", "估算费用", 80))
+        self.metrics_tree = ttk.Treeview(metrics_tab, columns=[c[0] for c in columns], show="headings")
+        for name, heading, width in columns:
+            self.metrics_tree.heading(name, text=heading)
+            self.metrics_tree.column(name, width=width, anchor=tk.CENTER)
+        self.metrics_tree.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        self.refresh_metrics()
+        self.auto_refresh_metrics()
+    
+    def refresh_metrics(self):
+        """刷新指标表格"""
+        def pair(stats):
+            if stats["p50"] is None:
+                return "-"
+            return f"{stats['p50']:.2f}s / {stats['p95']:.2f}s"
+        
+        rows = self.core.metrics.snapshot()
+        self.metrics_tree.delete(*self.metrics_tree.get_children())
+        for row in rows:
+            self.metrics_tree.insert("", tk.END, values=(
+                row["provider"], row["kind"], row["calls"], row["errors"], row["cache_hits"], row["coalesced"],
+                row["retries"],
+                pair(row["queue_time"]), pair(row["first_token"]), pair(row["total"]),
+                f"{row['prompt_tokens']}/{row['completion_tokens']}", f"${row['cost']:.4f}"))
+        calls = sum(row["calls"] for row in rows)
+        cost = sum(row["cost"] for row in rows)
+        self.metrics_total_var.set(f"共 {calls} 次调用，估算费用 ${cost:.4f}")
+    
+    def auto_refresh_metrics(self):
+        """指标选项卡可见时每两秒刷新一次"""
+        if self.notebook.select() == str(self.metrics_tree.master):
+            self.refresh_metrics()
+        self.root.after(2000, self.auto_refresh_metrics)
+    
+    def export_metrics(self):
+        """导出调用记录（JSON lines）或累计指标（Prometheus 文本格式）"""
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".jsonl",
+            filetypes=[("JSON lines", "*.jsonl"), ("Prometheus", "*.prom"), ("所有文件", "*.*")]
+        )
+        
+        if file_path:
+            try:
+                self.core.metrics.export(file_path)
+            except OSError as e:
+                messagebox.showerror("错误", f"导出失败:\n{e}")
+                return
+            self.update_status(f"指标已导出到: {file_path}")
+    
     def insert_to_project(self):
         """将生成的内容插入到当前项目"""
         if self.current_project is None:
@@ -572,12 +1260,18 @@ class NovelCreator:
             messagebox.showinfo("提示", "没有内容可插入")
             return
         
-        # 添加到项目的章节中
-        self.config["projects"][self.current_project]["chapters"].append(content)
-        self.save_config()
+        # 添加到项目的章节中（只新建一个章节文件）
+        self.core.add_chapter(self.projects[self.current_project], content)
+        self.refresh_chapter_list()
         self.update_status("内容已添加到当前项目")
 
-if __name__ == "__main__":
+
+def main(core=None):
+    """启动界面；core 为 RemoteCore 时作为服务器模式的客户端运行"""
     root = tk.Tk()
-    app = NovelCreator(root)
-    root.mainloop()
\ No newline at end of file
+    app = NovelCreator(root, core)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""近似重复检测
+
+生成的章节经常重复前文的情节或描写。这里为每个项目维护一个 MinHash/LSH
+索引：
+
+- 章节去掉空白和标点后切成 WINDOW 字一段、每隔 STRIDE（半个窗口）一个的
+  重叠窗口，窗口按 4 字 shingle 计算 MinHash 签名（单次哈希分桶，空桶向右
+  借值补齐，每个窗口约 0.2ms）。新文本按不重叠的窗口检查，与原文的位置
+  如何错开，都至少有 3/4 个窗口与某个索引窗口重合（Jaccard 约 0.6）；
+- 签名分成 BANDS 段，每段 ROWS 个值，任一段完全相同的窗口才作为候选，
+  再用签名估计 Jaccard 相似度，查询耗时与章节数基本无关；
+- 新生成的文本边生成边检查：每凑满一个窗口查询一次，重复窗口的比例
+  超过 max_ratio 即视为近似重复，可以提前停止生成。
+
+索引只在内存中，第一次使用时在后台读取项目的全部章节构建。
+"""
+import re
+import threading
+from array import array
+
+WINDOW = 500
+# 索引窗口的间隔，复制的段落不必与原文的窗口边界对齐
+STRIDE = WINDOW // 2
+MIN_WINDOW = 150
+SHINGLE = 4
+NUM_PERM = 64
+BANDS = 21
+ROWS = NUM_PERM // BANDS
+
+CLEAN = re.compile(r"[\W_]+")
+MASK = (1 << 64) - 1
+EMPTY = MASK >> 6
+
+
+def clean_text(text):
+    """去掉空白和标点，只保留文字"""
+    return CLEAN.sub("", text)
+
+
+def minhash(text):
+    """窗口的 MinHash 签名（NUM_PERM 个 32 位值）
+
+    单次哈希分桶：每个 shingle 的哈希低位决定桶，高位参与取最小值；
+    空桶按与右侧最近非空桶的距离借值（rotation densification）。
+    哈希使用内置 hash()，签名只在本进程内有效。
+    """
+    mins = [EMPTY] * NUM_PERM
+    for h in {hash(text[i:i + SHINGLE]) & MASK for i in range(len(text) - SHINGLE + 1)}:
+        bucket = h % NUM_PERM
+        value = h >> 6
+        if value < mins[bucket]:
+            mins[bucket] = value
+    if EMPTY in mins:
+        filled = [i for i, v in enumerate(mins) if v != EMPTY]
+        if not filled:
+            return None
+        for i in range(NUM_PERM):
+            if mins[i] == EMPTY:
+                distance = next((d for d in range(1, NUM_PERM) if mins[(i + d) % NUM_PERM] != EMPTY))
+                mins[i] = mins[(i + distance) % NUM_PERM] + distance * 0x9E3779B1
+    return array("I", (v & 0xFFFFFFFF for v in mins))
+
+
+def similarity(a, b):
+    """两个签名估计的 Jaccard 相似度"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def windows(text, stride=WINDOW):
+    """把清洗后的文本每隔 stride 字切出一个窗口，过短的末尾窗口和被前一个窗口包含的窗口丢弃"""
+    return [text[i:i + WINDOW] for i in range(0, max(len(text) - WINDOW + stride, 1), stride)
+            if len(text) - i >= MIN_WINDOW]
+
+
+class DuplicateContentError(Exception):
+    """生成的文本与已有章节近似重复（批量生成时抛出，由批量任务丢弃并重试）"""
+
+    def __init__(self, report):
+        chapters = "、".join(f"第{n}章" for n in report["chapters"][:3])
+        super().__init__(f"内容与{chapters}近似重复（重复 {report['ratio']:.0%}）")
+        self.report = report
+
+
+class DuplicateIndex:
+    """一个项目的窗口 LSH 索引，线程安全"""
+
+    def __init__(self, threshold=0.5):
+        self.threshold = threshold
+        self.signatures = {}
+        self.chapters = {}
+        self.bands = [{} for _ in range(BANDS)]
+        self.ready = False
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _band_keys(signature):
+        return [hash(signature[b * ROWS:(b + 1) * ROWS].tobytes()) for b in range(BANDS)]
+
+    def _remove(self, number):
+        for window_id in self.chapters.pop(number, ()):
+            signature, _, _ = self.signatures.pop(window_id)
+            for band, key in zip(self.bands, self._band_keys(signature)):
+                entry = band.get(key)
+                if entry == window_id:
+                    del band[key]
+                elif isinstance(entry, set):
+                    entry.discard(window_id)
+                    if len(entry) == 1:
+                        band[key] = entry.pop()
+
+    def update(self, number, text):
+        """重新索引一章"""
+        signatures = [s for s in map(minhash, windows(clean_text(text), STRIDE)) if s is not None]
+        with self._lock:
+            self._remove(number)
+            ids = []
+            for position, signature in enumerate(signatures):
+                self._ids += 1
+                window_id = self._ids
+                self.signatures[window_id] = (signature, number, position)
+                # 多数桶只有一个窗口，直接存 id，冲突时才换成集合
+                for band, key in zip(self.bands, self._band_keys(signature)):
+                    entry = band.get(key)
+                    if entry is None:
+                        band[key] = window_id
+                    elif isinstance(entry, set):
+                        entry.add(window_id)
+                    else:
+                        band[key] = {entry, window_id}
+                ids.append(window_id)
+            self.chapters[number] = ids
+
+    def remove(self, number):
+        with self._lock:
+            self._remove(number)
+
+    def build(self, chapters):
+        """从 [(章节编号, 文本)] 构建"""
+        for number, text in chapters:
+            self.update(number, text)
+        self.ready = True
+
+    def query(self, signature, exclude=None):
+        """与签名相似度不低于阈值的窗口，返回 [(相似度, 章节编号, 窗口序号)]，相似度从高到低"""
+        candidates = set()
+        with self._lock:
+            for band, key in zip(self.bands, self._band_keys(signature)):
+                entry = band.get(key)
+                if entry is None:
+                    continue
+                if isinstance(entry, set):
+                    candidates.update(entry)
+                else:
+                    candidates.add(entry)
+            stored = [self.signatures[c] for c in candidates]
+        matches = []
+        for other, number, position in stored:
+            if number == exclude:
+                continue
+            score = similarity(signature, other)
+            if score >= self.threshold:
+                matches.append((score, number, position))
+        matches.sort(reverse=True)
+        return matches
+
+
+class DuplicateMonitor:
+    """边生成边检查一段新文本
+
+    feed() 每凑满一个窗口查询一次，返回该窗口最相似的匹配（没有时为 None）；
+    finish() 检查末尾不足一个窗口的部分。exclude 为正在生成（覆盖）的章节编号。
+    """
+
+    def __init__(self, index, exclude=None, max_ratio=0.3):
+        self.index = index
+        self.exclude = exclude
+        self.max_ratio = max_ratio
+        self.buffer = ""
+        self.checked = 0
+        self.matches = []
+
+    def reset(self):
+        """丢弃已检查的内容（换用其他提供商从头生成时）"""
+        self.buffer = ""
+        self.checked = 0
+        self.matches = []
+
+    def _check(self, window):
+        signature = minhash(window)
+        self.checked += 1
+        if signature is None:
+            return None
+        found = self.index.query(signature, self.exclude)
+        if found:
+            self.matches.append(found[0])
+            return found[0]
+        return None
+
+    def feed(self, chunk):
+        self.buffer += clean_text(chunk)
+        match = None
+        while len(self.buffer) >= WINDOW:
+            window, self.buffer = self.buffer[:WINDOW], self.buffer[WINDOW:]
+            match = self._check(window) or match
+        return match
+
+    def finish(self):
+        if len(self.buffer) >= MIN_WINDOW:
+            self._check(self.buffer)
+        self.buffer = ""
+        return self.report()
+
+    @property
+    def ratio(self):
+        """重复窗口的比例"""
+        return len(self.matches) / self.checked if self.checked else 0.0
+
+    @property
+    def duplicate(self):
+        """重复窗口的比例是否超过 max_ratio（至少检查过两个窗口，避免开头误判）"""
+        return self.checked >= 2 and self.ratio >= self.max_ratio
+
+    def report(self):
+        """{"ratio", "duplicate", "chapters": 最相似的章节编号（按重复窗口数）, "similarity": 最高相似度}"""
+        counts = {}
+        for _, number, _ in self.matches:
+            counts[number] = counts.get(number, 0) + 1
+        return {"ratio": self.ratio, "duplicate": self.duplicate,
+                "chapters": sorted(counts, key=lambda n: -counts[n]),
+                "similarity": max((m[0] for m in self.matches), default=0.0)}
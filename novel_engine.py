@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""后台生成引擎
+
+耗时的生成任务在线程池中执行，结果通过线程安全的队列交回，
+由 Tk 主循环定时调用 poll() 分发回调，保证界面不会被网络请求卡住。
+"""
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+class GenerationJob:
+    """提交给引擎的单个任务"""
+
+    def __init__(self, engine, job_id, kind, on_done=None, on_error=None, on_event=None, on_cancel=None):
+        self.engine = engine
+        self.job_id = job_id
+        self.kind = kind
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_event = on_event
+        self.on_cancel = on_cancel
+        self.cancel_event = threading.Event()
+        # 因退出而中断（而不是用户放弃）：断点保留，下次启动时继续
+        self.suspended = False
+        self.future = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self, suspend=False):
+        """请求取消任务（工作线程在下一个检查点退出）
+
+        suspend 为 True 表示程序退出或服务器停止导致的中断，可恢复的任务保留断点。
+        """
+        if suspend:
+            self.suspended = True
+        self.cancel_event.set()
+        # 尚未开始执行的任务不会进入 _run，需要在这里补发取消通知
+        if self.future is not None and self.future.cancel():
+            self.engine.results.put((self, "cancelled", None))
+
+    def check_cancelled(self):
+        """在工作线程中调用，任务被取消时抛出 JobCancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def sleep(self, seconds):
+        """可被取消打断的等待"""
+        if self.cancel_event.wait(seconds):
+            raise JobCancelled()
+
+    def emit(self, name, payload=None, deliver_cancelled=False):
+        """从工作线程向主线程发送中间事件
+
+        任务取消后默认丢弃尚未分发的事件；deliver_cancelled 为 True 的事件
+        （例如已经写入磁盘的结果）仍会分发。
+        """
+        self.engine.results.put((self, "event", (name, payload, deliver_cancelled)))
+
+
+class GenerationEngine:
+    """线程池生成引擎"""
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="novel-gen")
+        self.results = queue.Queue()
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, *args, on_done=None, on_error=None, on_event=None, on_cancel=None, **kwargs):
+        """提交任务，func(job, *args, **kwargs) 在工作线程中执行"""
+        job = GenerationJob(self, next(self._ids), kind, on_done, on_error, on_event, on_cancel)
+        with self._lock:
+            self.jobs[job.job_id] = job
+        job.future = self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        try:
+            job.check_cancelled()
+            result = func(job, *args, **kwargs)
+            job.check_cancelled()
+        except JobCancelled:
+            self.results.put((job, "cancelled", None))
+        except Exception as e:
+            self.results.put((job, "error", e))
+        else:
+            self.results.put((job, "done", result))
+
+    def poll(self, max_items=200, timeout=None):
+        """在 Tk 主线程中调用：分发已完成任务和中间事件的回调
+
+        timeout 不为 None 时最多等待这么多秒直到第一条结果到达（命令行使用）。
+        """
+        for i in range(max_items):
+            try:
+                if i == 0 and timeout is not None:
+                    job, status, payload = self.results.get(timeout=timeout)
+                else:
+                    job, status, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if status == "event":
+                name, data, deliver_cancelled = payload
+                # 已取消任务的残留事件直接丢弃
+                if job.on_event and (deliver_cancelled or not job.cancelled):
+                    job.on_event(name, data)
+                continue
+
+            with self._lock:
+                self.jobs.pop(job.job_id, None)
+            if status == "done" and not job.cancelled:
+                if job.on_done:
+                    job.on_done(payload)
+            elif status == "error" and not job.cancelled:
+                if job.on_error:
+                    job.on_error(payload)
+            elif job.on_cancel:
+                job.on_cancel()
+
+    def active_jobs(self, kind=None):
+        """返回尚未结束的任务"""
+        with self._lock:
+            return [j for j in self.jobs.values() if kind is None or j.kind == kind]
+
+    def cancel(self, job_id):
+        """取消指定任务"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job:
+            job.cancel()
+
+    def cancel_all(self, kind=None, suspend=False):
+        """取消全部（或指定类型的）任务"""
+        for job in self.active_jobs(kind):
+            job.cancel(suspend)
+
+    def shutdown(self):
+        """取消所有任务并关闭线程池，可恢复的任务保留断点"""
+        self.cancel_all(suspend=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""人物与设定索引
+
+角色和世界观字段是自由文本，这里从中解析出条目：
+
+    林风（小风、阿风）：私家侦探，28岁，黑色的眼睛，沉默寡言。
+      年龄：28
+    - 新长安：近未来的都市，又名“不夜城”。
+
+以“名称（别名）：描述”开头的行开始一个条目，缩进的行和其他不是条目开头的
+行属于上一个条目；“年龄：28”这类属性行也属于上一个条目。描述中的“又名、
+外号、人称……”作为别名，“键：值”和年龄、眼睛颜色、发色作为属性。
+
+所有名称和别名构建一个 Aho–Corasick 自动机，一次扫描找出章节中全部人物和
+设定的出现位置。每章插入时增量扫描，记录各条目的出现次数，并检查只提到
+一个人物的句子里的年龄、眼睛颜色和发色是否与设定矛盾。
+
+生成时按本章大纲、额外要求、上一章结尾和最近几章的出现情况为条目排序，
+只把相关的人物和设定放进提示词，而不是每次都发送完整的角色表。
+"""
+import re
+import threading
+
+from novel_batch import chinese_to_int
+from novel_context import truncate
+from novel_providers import estimate_tokens
+
+# 名称最短 2 字，单字名称误匹配太多
+MIN_NAME = 2
+# 排序时参考的最近章节数
+RECENT_CHAPTERS = 3
+
+ENTRY = re.compile(r"^(?:[-*•·]|\d+[.、)）]|[（(]\d+[)）])?\s*【?([^\s:：,，。；;（(【】“”\"]{1,12})】?\s*"
+                   r"(?:[（(]([^）)]*)[）)])?\s*[:：]\s*(.*)$")
+ALIAS = re.compile(r"(?:又名|别名|外号|绰号|人称|化名|昵称|又称|简称)[:：]?\s*((?:[“\"「『]?[^\s，,。；;：:”\"」』、]{2,8}"
+                   r"[”\"」』]?(?:、|或|和)?)+)")
+ALIAS_SPLIT = re.compile(r"[、，,/|；;\s]+|或|和")
+QUOTES = "“”\"「」『』"
+ATTRIBUTE_KEYS = {"年龄", "性别", "身高", "体重", "外貌", "长相", "相貌", "眼睛", "眼睛颜色", "瞳色", "发色", "头发",
+                  "性格", "身份", "职业", "能力", "背景", "特点", "关系", "外号", "别名", "绰号", "爱好", "生日",
+                  "籍贯", "出身", "武器", "口头禅", "位置", "人口", "气候", "历史", "势力", "首领"}
+SEGMENT = re.compile(r"[^，,；;。！？!?\n]+")
+SENTENCE = re.compile(r"[^。！？!?\n]+")
+
+COLOR = r"(琥珀|黑|蓝|碧|绿|灰|褐|棕|金|紫|红|赤|银|白|青)"
+COLORS = {"碧": "绿", "赤": "红", "棕": "褐"}
+AGE = re.compile(r"(\d{1,3}|[零一二两三四五六七八九十百]{1,4})\s*岁")
+EYES = re.compile(COLOR + r"色?的?(?:眼睛|眼眸|双眸|眸子|瞳孔|瞳仁|眼珠|双眼)")
+HAIR = re.compile(COLOR + r"色?的?(?:头发|长发|短发|卷发|发丝|秀发|发)")
+# 含这些词的句子描述的可能不是现在的年龄
+AGE_CONTEXT = re.compile(r"年前|年后|那年|当年|那时|小时候|曾经|后来|将来|时候|岁时|岁那")
+EXPLICIT = {"年龄": "年龄", "眼睛": "眼睛", "眼睛颜色": "眼睛", "瞳色": "眼睛", "发色": "发色", "头发": "发色"}
+
+
+def normalize_attribute(key, value):
+    """年龄转为数字，颜色取第一个颜色字并合并近义色，无法识别时返回 None"""
+    if key == "年龄":
+        match = AGE.search(value) or re.search(r"(\d{1,3}|[零一二两三四五六七八九十百]{1,4})", value)
+        if match is None:
+            return None
+        number = match.group(1)
+        return int(number) if number.isdigit() else chinese_to_int(number)
+    match = re.search(COLOR, value)
+    if match is None:
+        return None
+    return COLORS.get(match.group(1), match.group(1))
+
+
+def describe_attributes(description):
+    """从描述中提取属性：{"年龄": 28, "眼睛": "黑", "发色": "银", 其他键: 原文}"""
+    attributes = {}
+    for segment in SEGMENT.findall(description):
+        key, sep, value = segment.partition("：") if "：" in segment else segment.partition(":")
+        key = key.strip()
+        if sep and 0 < len(key) <= 6 and value.strip():
+            if key in EXPLICIT:
+                normalized = normalize_attribute(EXPLICIT[key], value)
+                if normalized is not None:
+                    attributes[EXPLICIT[key]] = normalized
+            else:
+                attributes[key] = value.strip()
+    for key, pattern in (("年龄", AGE), ("眼睛", EYES), ("发色", HAIR)):
+        if key not in attributes:
+            match = pattern.search(description)
+            if match is not None:
+                attributes[key] = normalize_attribute(key, match.group(0))
+    return attributes
+
+
+def parse_entities(text, field):
+    """解析角色或世界观字段，返回 [{"name", "aliases", "field", "text", "attributes"}]，按原文顺序"""
+    entities = []
+    current = None
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = None if line[:1].isspace() and current is not None else ENTRY.match(line.strip())
+        if match and match.group(1) not in ATTRIBUTE_KEYS:
+            current = {"name": match.group(1), "aliases": [], "field": field, "lines": [line.strip()],
+                       "description": [match.group(3)]}
+            if match.group(2):
+                current["aliases"].extend(ALIAS_SPLIT.split(match.group(2)))
+            entities.append(current)
+        elif current is not None:
+            current["lines"].append(line.strip())
+            current["description"].append(line.strip())
+    result = []
+    for entity in entities:
+        description = "\n".join(entity["description"])
+        aliases = list(entity["aliases"])
+        for match in ALIAS.finditer(description):
+            aliases.extend(ALIAS_SPLIT.split(match.group(1)))
+        names = []
+        for alias in aliases:
+            alias = alias.strip(QUOTES + " ")
+            if len(alias) >= MIN_NAME and alias != entity["name"] and alias not in names:
+                names.append(alias)
+        result.append({"name": entity["name"], "aliases": names, "field": field,
+                       "text": "\n".join(entity["lines"]), "attributes": describe_attributes(description)})
+    return result
+
+
+class AhoCorasick:
+    """多模式匹配自动机：一次扫描找出文本中所有模式的出现位置"""
+
+    def __init__(self, patterns):
+        """patterns 为 {模式: 值}"""
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for pattern, value in patterns.items():
+            state = 0
+            for ch in pattern:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = next_state
+            self.out[state] = ((len(pattern), value),)
+        # 按层次计算失败链接，输出合并失败状态的输出
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def finditer(self, text):
+        """产出所有匹配 (起点, 终点, 值)，可能重叠"""
+        goto, fail, out = self.goto, self.fail, self.out
+        root = goto[0]
+        state = 0
+        for i, ch in enumerate(text):
+            if state == 0:
+                # 大部分字符不是任何模式的开头
+                state = root.get(ch, 0)
+                if not state:
+                    continue
+            else:
+                while True:
+                    next_state = goto[state].get(ch)
+                    if next_state is not None:
+                        state = next_state
+                        break
+                    if state == 0:
+                        break
+                    state = fail[state]
+            for length, value in out[state]:
+                yield i + 1 - length, i + 1, value
+
+    def search(self, text):
+        """最左最长、互不重叠的匹配 [(起点, 终点, 值)]"""
+        matches = sorted(self.finditer(text), key=lambda m: (m[0], m[0] - m[1]))
+        result = []
+        end = 0
+        for match in matches:
+            if match[0] >= end:
+                result.append(match)
+                end = match[1]
+        return result
+
+
+class EntityIndex:
+    """一个项目的人物与设定索引，线程安全
+
+    entities 在创建时从字段解析，立即可用；各章的出现次数和矛盾在 build()
+    之后（ready 为 True）才完整，之后随章节写入增量更新。
+    """
+
+    def __init__(self, characters, setting):
+        self.entities = parse_entities(characters or "", "characters") + parse_entities(setting or "", "setting")
+        patterns = {}
+        for i, entity in enumerate(self.entities):
+            for name in [entity["name"], *entity["aliases"]]:
+                # 名称重复时保留前面的条目
+                if len(name) >= MIN_NAME and name not in patterns:
+                    patterns[name] = i
+        self.matcher = AhoCorasick(patterns)
+        # 章节编号 -> ({条目序号: 次数}, [矛盾])
+        self.chapters = {}
+        self.ready = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def counts(self, text):
+        """{条目序号: 出现次数}"""
+        counts = {}
+        for _, _, i in self.matcher.search(text):
+            counts[i] = counts.get(i, 0) + 1
+        return counts
+
+    def scan(self, text, number=None):
+        """返回 ({条目序号: 次数}, [矛盾])
+
+        矛盾为 {"chapter", "name", "attribute", "expected", "found", "excerpt"}：
+        句子里只提到一个人物时，把句中的年龄、眼睛颜色和发色与该人物的设定比较。
+        """
+        matches = self.matcher.search(text)
+        counts = {}
+        for _, _, i in matches:
+            counts[i] = counts.get(i, 0) + 1
+        conflicts = []
+        if not matches:
+            return counts, conflicts
+        position = 0
+        for sentence in SENTENCE.finditer(text):
+            start, end = sentence.span()
+            mentioned = set()
+            while position < len(matches) and matches[position][0] < end:
+                if matches[position][0] >= start and self.entities[matches[position][2]]["field"] == "characters":
+                    mentioned.add(matches[position][2])
+                position += 1
+            if len(mentioned) != 1:
+                continue
+            entity = self.entities[mentioned.pop()]
+            body = sentence.group(0)
+            for key, pattern in (("年龄", AGE), ("眼睛", EYES), ("发色", HAIR)):
+                expected = entity["attributes"].get(key)
+                if expected is None or (key == "年龄" and AGE_CONTEXT.search(body)):
+                    continue
+                for match in pattern.finditer(body):
+                    found = normalize_attribute(key, match.group(0))
+                    if found is not None and found != expected:
+                        conflicts.append({"chapter": number, "name": entity["name"], "attribute": key,
+                                          "expected": expected, "found": found, "excerpt": body.strip()[:80]})
+                        break
+        return counts, conflicts
+
+    def update(self, number, text):
+        """重新扫描一章"""
+        result = self.scan(text, number)
+        with self._lock:
+            self.chapters[number] = result
+        return result[1]
+
+    def remove(self, number):
+        with self._lock:
+            self.chapters.pop(number, None)
+
+    def build(self, chapters):
+        """从 [(章节编号, 文本)] 构建，已经构建过时直接返回"""
+        with self._build_lock:
+            if self.ready:
+                return
+            for number, text in chapters:
+                self.update(number, text)
+            self.ready = True
+
+    def conflicts(self):
+        """全部章节的矛盾，按章节排列"""
+        with self._lock:
+            return [conflict for number in sorted(self.chapters) for conflict in self.chapters[number][1]]
+
+    def report(self):
+        """各条目的出现情况：[{"name", "aliases", "field", "attributes", "chapters", "count"}]，按原文顺序"""
+        with self._lock:
+            chapters = sorted(self.chapters.items())
+        result = []
+        for i, entity in enumerate(self.entities):
+            appeared = [number for number, (counts, _) in chapters if i in counts]
+            result.append({"name": entity["name"], "aliases": entity["aliases"], "field": entity["field"],
+                           "attributes": entity["attributes"], "chapters": appeared,
+                           "count": sum(counts.get(i, 0) for _, (counts, _) in chapters)})
+        return result
+
+    def select(self, field, focus, target, max_tokens):
+        """挑选放进提示词的条目，返回文本；字段没有解析出条目时返回 None
+
+        只选 focus（本章大纲、额外要求、上一章结尾）中提到的和最近几章出现过的
+        条目，提到次数多的优先；都没有时按原文顺序。选中的条目按原文顺序输出。
+        """
+        entries = [i for i, entity in enumerate(self.entities) if entity["field"] == field]
+        if not entries:
+            return None
+        mentioned = self.counts(focus) if focus else {}
+        recent = {}
+        with self._lock:
+            for number in range(target - RECENT_CHAPTERS, target):
+                for i, count in self.chapters.get(number, ({}, []))[0].items():
+                    recent[i] = recent.get(i, 0) + count
+        relevant = [i for i in entries if mentioned.get(i) or recent.get(i)]
+        # 都没有提到时（例如第一章）按原文顺序放到预算用完为止
+        ranked = sorted(relevant, key=lambda i: (-mentioned.get(i, 0), -recent.get(i, 0), i)) or entries
+        chosen = []
+        used = 0
+        for i in ranked:
+            tokens = estimate_tokens(self.entities[i]["text"]) + 1
+            if used + tokens > max_tokens:
+                continue
+            chosen.append(i)
+            used += tokens
+        if not chosen:
+            # 一个条目也放不下时截断最相关的条目
+            return truncate(self.entities[ranked[0]]["text"], max_tokens)
+        return "\n".join(self.entities[i]["text"] for i in sorted(chosen))
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""整部小说导出
+
+支持 TXT、Markdown 和 EPUB（zip）。章节逐章从项目存储读取并直接写入输出
+文件，不在内存中拼出整本书。
+
+每次导出后在项目目录的 exports.json 中记录输出文件的状态：各章节文件的
+(大小, 修改时间) 以及在输出中的位置。再次导出到同一路径时：
+
+- TXT/Markdown：开头部分（标题和设定）不变时，保留第一个有变化的章节之前
+  的内容，从那里截断后只写入之后的章节；只追加了新章节时只写入新章节；
+- EPUB：每章是一个单独的文件，未变化的章节直接从上一次的 EPUB 中复制，
+  只渲染有变化的章节。
+"""
+import hashlib
+import html
+import json
+import os
+import time
+import zipfile
+
+from novel_batch import CHAPTER_HEADING, FINAL_HEADING
+from novel_store import read_text, write_text
+
+EXPORT_FORMATS = {".txt": "txt", ".md": "md", ".epub": "epub"}
+SETTING_SECTIONS = (("outline", "大纲"), ("characters", "角色"), ("setting", "世界观"))
+
+
+def export_format(path, fmt=None):
+    """按参数或扩展名确定导出格式"""
+    fmt = fmt or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt not in EXPORT_FORMATS.values():
+        raise ValueError(f"不支持的导出格式: {fmt or path}")
+    return fmt
+
+
+def chapter_title(number, heading):
+    """章节标题：第一行是“第N章 …”时使用第一行，否则为“第N章”"""
+    if heading and (CHAPTER_HEADING.match(heading) or FINAL_HEADING.match(heading)):
+        return heading.strip()
+    return f"第{number}章"
+
+
+class ProjectExporter:
+    """把项目导出为单个文件
+
+    on_progress(完成章数, 总章数) 报告进度；check_cancelled 在每章之后调用，
+    抛出异常即中止导出（输出文件保持原样或在下次导出时完整重写）。
+    """
+
+    def __init__(self, store, project, path, fmt=None, include_settings=True, incremental=True,
+                 on_progress=None, check_cancelled=None):
+        self.store = store
+        self.project = project
+        self.path = os.path.abspath(path)
+        self.fmt = export_format(path, fmt)
+        self.include_settings = include_settings
+        self.incremental = incremental
+        self.on_progress = on_progress or (lambda done, total: None)
+        self.check_cancelled = check_cancelled or (lambda: None)
+        self.written = 0
+
+    # ---- 状态 ----
+
+    def _state_path(self):
+        return os.path.join(self.store.project_dir(self.project["id"]), "exports.json")
+
+    def _load_states(self):
+        try:
+            return json.loads(read_text(self._state_path(), "{}"))
+        except ValueError:
+            return {}
+
+    def _save_state(self, state):
+        states = self._load_states()
+        if state is None:
+            states.pop(self.path, None)
+        else:
+            states[self.path] = state
+        write_text(self._state_path(), json.dumps(states, ensure_ascii=False, indent=1))
+
+    def _signatures(self):
+        """[(章节编号, "大小-修改时间")]，不读取章节内容"""
+        signatures = []
+        for number in self.store.chapter_numbers(self.project["id"]):
+            stat = os.stat(self.store.chapter_path(self.project["id"], number))
+            signatures.append((number, f"{stat.st_size}-{stat.st_mtime_ns}"))
+        return signatures
+
+    def _header_hash(self):
+        fields = [self.fmt, str(self.include_settings)]
+        fields += [str(self.project.get(key, "")) for key in ("title", "author", "genre")]
+        if self.include_settings:
+            fields += [self.project.get(key, "") for key, _ in SETTING_SECTIONS]
+        return hashlib.sha256("\0".join(fields).encode("utf-8")).hexdigest()
+
+    def _progress(self, done, total):
+        self.check_cancelled()
+        self.on_progress(done, total)
+
+    # ---- 导出 ----
+
+    def run(self):
+        """执行导出，返回 {"path", "format", "chapters", "written", "reused", "bytes", "elapsed"}"""
+        started = time.monotonic()
+        signatures = self._signatures()
+        state = self._load_states().get(self.path) if self.incremental else None
+        if state is not None and (state.get("header") != self._header_hash() or not os.path.exists(self.path)
+                                  or os.path.getsize(self.path) != state.get("size")):
+            state = None
+        if self.fmt == "epub":
+            new_state = self._export_epub(signatures, state)
+        else:
+            new_state = self._export_text(signatures, state)
+        new_state["header"] = self._header_hash()
+        new_state["size"] = os.path.getsize(self.path)
+        self._save_state(new_state)
+        return {"path": self.path, "format": self.fmt, "chapters": len(signatures), "written": self.written,
+                "reused": len(signatures) - self.written, "bytes": new_state["size"],
+                "elapsed": time.monotonic() - started}
+
+    def _export_text(self, signatures, state):
+        old = state["chapters"] if state else []
+        # 第一个有变化的章节
+        keep = 0
+        while keep < len(old) and keep < len(signatures) and old[keep][:2] == list(signatures[keep]):
+            keep += 1
+        if state and keep == len(old) == len(signatures):
+            self._progress(len(signatures), len(signatures))
+            return state
+
+        temp_path = f"{self.path}.tmp"
+        if state:
+            # 原地截断再追加；中途失败时删除状态，下次完整导出
+            self._save_state(None)
+            chapters = [list(entry) for entry in old[:keep]]
+            f = open(self.path, "r+b")
+            f.seek(old[keep][2] if keep < len(old) else state["size"])
+            f.truncate()
+        else:
+            # 完整导出先写临时文件，中途取消时保留原来的文件
+            chapters = []
+            f = open(temp_path, "wb")
+            f.write(self._text_header().encode("utf-8"))
+        try:
+            with f:
+                for i in range(keep, len(signatures)):
+                    number, signature = signatures[i]
+                    offset = f.tell()
+                    text = self.store.load_chapter(self.project["id"], number)
+                    f.write(self._text_chapter(number, text).encode("utf-8"))
+                    chapters.append([number, signature, offset])
+                    self.written += 1
+                    self._progress(i + 1, len(signatures))
+        except BaseException:
+            if not state:
+                os.remove(temp_path)
+            raise
+        if not state:
+            os.replace(temp_path, self.path)
+        return {"chapters": chapters}
+
+    def _text_header(self):
+        project = self.project
+        md = self.fmt == "md"
+        lines = [f"# {project['title']}" if md else project["title"]]
+        if project.get("author"):
+            lines.append(f"作者：{project['author']}")
+        if project.get("genre"):
+            lines.append(f"类型：{project['genre']}")
+        parts = ["\n".join(lines)]
+        if self.include_settings:
+            for key, label in SETTING_SECTIONS:
+                text = project.get(key, "").strip()
+                if text:
+                    parts.append(f"## {label}\n\n{text}" if md else f"【{label}】\n{text}")
+        return "\n\n".join(parts) + "\n"
+
+    def _text_chapter(self, number, text):
+        text = text.strip()
+        if self.fmt != "md":
+            return f"\n\n{text}\n"
+        first, _, rest = text.partition("\n")
+        title = chapter_title(number, first)
+        if title == first.strip():
+            text = rest.strip()
+        return f"\n## {title}\n\n{text}\n"
+
+    # ---- EPUB ----
+
+    def _export_epub(self, signatures, state):
+        old = {entry[0]: entry for entry in state["chapters"]} if state else {}
+        old_zip = zipfile.ZipFile(self.path) if state else None
+        temp_path = f"{self.path}.tmp"
+        chapters = []
+        try:
+            with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as out:
+                # mimetype 必须是第一个且不压缩
+                out.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", zipfile.ZIP_STORED)
+                out.writestr("META-INF/container.xml", CONTAINER_XML)
+                if self.include_settings:
+                    out.writestr("OEBPS/front.xhtml", self._epub_front())
+                for i, (number, signature) in enumerate(signatures):
+                    name = f"OEBPS/chapters/{number:06d}.xhtml"
+                    entry = old.get(number)
+                    if entry is not None and entry[1] == signature:
+                        out.writestr(name, old_zip.read(name))
+                        title = entry[2]
+                    else:
+                        text = self.store.load_chapter(self.project["id"], number).strip()
+                        first, _, rest = text.partition("\n")
+                        title = chapter_title(number, first)
+                        out.writestr(name, xhtml_page(title, rest if title == first.strip() else text))
+                        self.written += 1
+                    chapters.append([number, signature, title])
+                    self._progress(i + 1, len(signatures))
+                out.writestr("OEBPS/nav.xhtml", self._epub_nav(chapters))
+                out.writestr("OEBPS/content.opf", self._epub_opf(chapters))
+        except BaseException:
+            if old_zip is not None:
+                old_zip.close()
+            os.remove(temp_path)
+            raise
+        if old_zip is not None:
+            old_zip.close()
+        os.replace(temp_path, self.path)
+        return {"chapters": chapters}
+
+    def _epub_front(self):
+        parts = []
+        for key, label in SETTING_SECTIONS:
+            if self.project.get(key, "").strip():
+                parts.append(f"<h2>{html.escape(label)}</h2>\n{paragraphs(self.project[key])}")
+        return xhtml_document(self.project["title"], "\n".join(parts))
+
+    def _epub_nav(self, chapters):
+        items = []
+        if self.include_settings:
+            items.append('<li><a href="front.xhtml">设定</a></li>')
+        for number, _, title in chapters:
+            items.append(f'<li><a href="chapters/{number:06d}.xhtml">{html.escape(title)}</a></li>')
+        body = '<nav epub:type="toc" id="toc"><h1>目录</h1><ol>\n' + "\n".join(items) + "\n</ol></nav>"
+        return xhtml_document("目录", body)
+
+    def _epub_opf(self, chapters):
+        project = self.project
+        items = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        spine = []
+        if self.include_settings:
+            items.append('<item id="front" href="front.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append('<itemref idref="front"/>')
+        for number, _, _ in chapters:
+            items.append(f'<item id="c{number}" href="chapters/{number:06d}.xhtml" '
+                         f'media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="c{number}"/>')
+        creator = f"<dc:creator>{html.escape(project['author'])}</dc:creator>" if project.get("author") else ""
+        modified = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n'
+                f'<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid">\n'
+                f'<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+                f'<dc:identifier id="bookid">urn:novel:{project["id"]}</dc:identifier>\n'
+                f'<dc:title>{html.escape(project["title"])}</dc:title>\n{creator}\n'
+                f'<dc:language>zh</dc:language>\n'
+                f'<meta property="dcterms:modified">{modified}</meta>\n'
+                f'</metadata>\n<manifest>\n' + "\n".join(items) + '\n</manifest>\n'
+                '<spine>\n' + "\n".join(spine) + '\n</spine>\n</package>\n')
+
+
+CONTAINER_XML = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                 '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                 '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                 '</rootfiles>\n</container>\n')
+
+
+def paragraphs(text):
+    """每个非空行一个 <p>"""
+    return "\n".join(f"<p>{html.escape(line.strip())}</p>" for line in text.splitlines() if line.strip())
+
+
+def xhtml_document(title, body):
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+            'lang="zh" xml:lang="zh">\n'
+            f'<head><meta charset="utf-8"/><title>{html.escape(title)}</title></head>\n'
+            f'<body>\n{body}\n</body>\n</html>\n')
+
+
+def xhtml_page(title, text):
+    return xhtml_document(title, f"<h2>{html.escape(title)}</h2>\n{paragraphs(text)}")
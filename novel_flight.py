@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""相同请求合并（single-flight）
+
+连点两次“生成小说内容”、服务器模式下两个写作者请求同一提示词，或者批量
+重试与交互生成撞在一起时，正在进行中的相同请求（候选提供商和模型、提示词、
+参数和优先级都相同）只向上游发出一次：
+
+- 第一个请求新建 Flight，在独立线程中调用提供商，片段依次记入 Flight；
+- 之后到达的请求加入同一个 Flight，先收到已经生成的部分（从最近一次换用
+  提供商之后开始），再继续接收新片段，最后得到同一个结果或异常；
+- 订阅者离开（取消、因近似重复放弃）时引用计数减一，最后一个订阅者离开
+  时才取消上游请求。
+
+上游请求不属于任何一个订阅者的任务，先发起的订阅者取消不影响其他订阅者。
+已经结束的请求由生成缓存负责，这里只合并进行中的请求；结果由第一个接受
+它的订阅者写入缓存（claim_result），所有订阅者都拒绝（例如近似重复）时不缓存。
+"""
+import hashlib
+import json
+import threading
+
+from novel_engine import JobCancelled
+
+
+class FlightCancel:
+    """上游请求的取消标志，提供路由和调度器用到的任务接口"""
+
+    def __init__(self):
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def sleep(self, seconds):
+        if self.cancel_event.wait(seconds):
+            raise JobCancelled()
+
+
+class Flight:
+    """一次进行中的上游请求
+
+    events 为 [(事件名, 数据)]：provider（首个片段来自该提供商）、restart（换用
+    该提供商重新生成）和 chunk（文本片段）。
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.job = FlightCancel()
+        self.events = []
+        # 最近一次 restart 之后的位置，新订阅者从这里开始接收
+        self.start = 0
+        self.subscribers = 0
+        self.done = False
+        self.result = None
+        self.error = None
+        self.claimed = False
+        self._cond = threading.Condition()
+
+    def add(self, name, payload=None):
+        with self._cond:
+            self.events.append((name, payload))
+            if name == "restart":
+                self.start = len(self.events)
+            self._cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def follow(self, job):
+        """逐个产出事件直到上游结束；job 取消时抛出 JobCancelled，结束后用 outcome() 取得结果"""
+        with self._cond:
+            position = self.start
+        while True:
+            with self._cond:
+                while position >= len(self.events) and not self.done and not job.cancelled:
+                    # 分段等待，以便及时响应订阅者的取消
+                    self._cond.wait(0.1)
+                events = self.events[position:]
+                done = self.done
+            position += len(events)
+            for event in events:
+                job.check_cancelled()
+                yield event
+            job.check_cancelled()
+            if done:
+                return
+
+    def claim_result(self):
+        """第一个接受结果的订阅者得到 True，由它写入缓存"""
+        with self._cond:
+            claimed, self.claimed = self.claimed, True
+            return not claimed
+
+    def outcome(self):
+        """上游的结果，失败时抛出上游的异常"""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """按请求键合并进行中的上游请求，线程安全"""
+
+    def __init__(self):
+        self.flights = {}
+        self.stats = {"started": 0, "joined": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(providers, prompt, params, priority):
+        """providers 为 [(提供商, 模型)]"""
+        raw = json.dumps([providers, prompt, params, priority], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def join(self, key, run):
+        """加入 key 对应的 Flight 并增加引用计数，返回 (Flight, 是否新建)
+
+        没有进行中的请求时新建 Flight，在后台线程中执行 run(flight)，返回值作为结果。
+        """
+        with self._lock:
+            flight = self.flights.get(key)
+            created = flight is None
+            if created:
+                flight = self.flights[key] = Flight(key)
+                self.stats["started"] += 1
+            else:
+                self.stats["joined"] += 1
+            flight.subscribers += 1
+        if created:
+            threading.Thread(target=self._run, args=(flight, run), name="novel-flight", daemon=True).start()
+        return flight, created
+
+    def _run(self, flight, run):
+        try:
+            result = run(flight)
+        except Exception as e:
+            flight.finish(error=e)
+        else:
+            flight.finish(result)
+        finally:
+            self._forget(flight)
+
+    def _forget(self, flight):
+        with self._lock:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+
+    def leave(self, flight):
+        """订阅者离开，最后一个订阅者离开时取消尚未结束的上游请求"""
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers or flight.done:
+                return
+            # 取消后不再接受新订阅者，相同请求重新发起
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+        flight.job.cancel()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self.flights)
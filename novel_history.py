@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""版本历史
+
+每个项目的设定字段（大纲、角色、世界观）和每个章节都保留修改历史，保存在
+项目目录的 history/ 下：
+
+    history/objects/ab/cdef…   内容对象，按全文的 SHA-256 命名，相同内容只存一份
+    history/outline.jsonl      每个字段或章节一个修订日志，每次修改追加一行
+    history/chapter-000001.jsonl
+
+对象是压缩后的全文，或者是相对上一个修订的增量：文本按句子和换行切分，
+增量记录“复制原文第 i 到 j 句”和“插入新文字”。增量链最长 MAX_DEPTH，
+超过或增量不比全文小时存全文，读取任一修订最多应用 MAX_DEPTH 个增量。
+小修改只占用几十到几百字节，几百个修订也不会每次都多存一份全文。
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+MAX_DEPTH = 50
+UNIT = re.compile(r"(?<=[\n。！？!?])")
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_units(text):
+    """按句末标点和换行切分，拼接后与原文相同"""
+    return [unit for unit in UNIT.split(text) if unit]
+
+
+def make_delta(base_units, units):
+    """增量：[i, j] 表示复制原文第 i 到 j 个片段，字符串为插入的文字；同时返回 (增加字数, 删除字数)"""
+    # 修改通常集中在一处，相同的开头和结尾不参与比较
+    head = 0
+    limit = min(len(base_units), len(units))
+    while head < limit and base_units[head] == units[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and base_units[-1 - tail] == units[-1 - tail]:
+        tail += 1
+    ops = [[0, head]] if head else []
+    added = removed = 0
+    matcher = difflib.SequenceMatcher(None, base_units[head:len(base_units) - tail], units[head:len(units) - tail],
+                                      autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([head + i1, head + i2])
+        else:
+            removed += sum(len(u) for u in base_units[head + i1:head + i2])
+            if j2 > j1:
+                inserted = "".join(units[head + j1:head + j2])
+                added += len(inserted)
+                ops.append(inserted)
+    if tail:
+        ops.append([len(base_units) - tail, len(base_units)])
+    return ops, added, removed
+
+
+def apply_delta(base_text, ops):
+    units = split_units(base_text)
+    return "".join(op if isinstance(op, str) else "".join(units[op[0]:op[1]]) for op in ops)
+
+
+def write_bytes(path, data):
+    """原子写入：先写临时文件再替换（对象可以从章节文件重新生成，不 fsync）"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class VersionHistory:
+    """一个项目的版本历史，线程安全
+
+    修订为 {"hash", "time", "size", "source", "added", "removed"}，按时间先后排列。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.RLock()
+        # 修订日志：target -> (文件大小, 修订列表)，文件被其他进程追加后重新读取
+        self._logs = {}
+        self._texts = OrderedDict()
+
+    def _log_path(self, target):
+        return os.path.join(self.root, f"{target}.jsonl")
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def targets(self):
+        """有历史的字段和章节"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-6] for name in names if name.endswith(".jsonl"))
+
+    def revisions(self, target):
+        """target 的全部修订（副本），从旧到新"""
+        with self._lock:
+            return [dict(entry) for entry in self._entries(target)]
+
+    def _entries(self, target):
+        path = self._log_path(target)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return []
+        cached = self._logs.get(target)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时最后一行可能只写了一半
+                    break
+        self._logs[target] = (size, entries)
+        return entries
+
+    # ---- 记录 ----
+
+    def record(self, target, text, source="", previous=None):
+        """记录 target 的新内容，与最新修订相同时不记录，返回新修订或 None
+
+        还没有历史时，previous（修改前的内容）先作为第一个修订记录下来。
+        """
+        with self._lock:
+            entries = self._entries(target)
+            if not entries and previous and previous != text:
+                self._append(target, None, previous, "原始版本")
+                entries = self._entries(target)
+            if not entries and not text:
+                return None
+            last = entries[-1] if entries else None
+            if last is not None and last["hash"] == content_hash(text):
+                return None
+            return self._append(target, last, text, source)
+
+    def _append(self, target, last, text, source):
+        digest = content_hash(text)
+        units = split_units(text)
+        if last is not None:
+            base_text = self.load(last["hash"])
+            ops, added, removed = make_delta(split_units(base_text), units)
+        else:
+            ops, added, removed = None, len(text), 0
+        if not os.path.exists(self._object_path(digest)):
+            self._write_object(digest, text, last["hash"] if last else None, ops)
+        entry = {"hash": digest, "time": time.time(), "size": len(text), "source": source,
+                 "added": added, "removed": removed}
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._log_path(target), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._remember(digest, text)
+        return dict(entry)
+
+    def _write_object(self, digest, text, base, ops):
+        full = zlib.compress(text.encode("utf-8"))
+        if base is not None:
+            depth = self._depth(base) + 1
+            delta = zlib.compress(json.dumps(ops, ensure_ascii=False).encode("utf-8"))
+            if depth <= MAX_DEPTH and len(delta) < len(full) * 0.8:
+                write_bytes(self._object_path(digest), f"D {base} {depth}\n".encode("ascii") + delta)
+                return
+        write_bytes(self._object_path(digest), b"F\n" + full)
+
+    def _read_object(self, digest):
+        """返回 (基准对象, 深度, 压缩内容)，全文对象的基准为 None"""
+        try:
+            with open(self._object_path(digest), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise KeyError(digest) from None
+        header, _, body = data.partition(b"\n")
+        fields = header.decode("ascii").split()
+        if fields[0] == "F":
+            return None, 0, body
+        return fields[1], int(fields[2]), body
+
+    def _depth(self, digest):
+        with open(self._object_path(digest), "rb") as f:
+            fields = f.readline().decode("ascii").split()
+        return 0 if fields[0] == "F" else int(fields[2])
+
+    # ---- 读取 ----
+
+    def _remember(self, digest, text):
+        self._texts[digest] = text
+        self._texts.move_to_end(digest)
+        while len(self._texts) > 32:
+            self._texts.popitem(last=False)
+
+    def load(self, digest):
+        """读取修订内容，沿增量链回溯到全文（或已缓存的修订）再依次应用"""
+        with self._lock:
+            chain = []
+            current = digest
+            while current not in self._texts:
+                base, _, body = self._read_object(current)
+                chain.append((current, base, body))
+                if base is None:
+                    break
+                current = base
+            text = self._texts.get(current)
+            for item_digest, base, body in reversed(chain):
+                if base is None:
+                    text = zlib.decompress(body).decode("utf-8")
+                else:
+                    text = apply_delta(text, json.loads(zlib.decompress(body)))
+                self._remember(item_digest, text)
+            return text
+
+    def find(self, target, revision):
+        """查找修订：整数或“#序号”为序号（从 1 开始，负数从最新往前数），其余为哈希前缀
+
+        全是数字的哈希前缀很常见，所以纯数字的字符串先按哈希前缀查找，
+        没有匹配时才作为序号（兼容旧的写法）。
+        """
+        entries = self.revisions(target)
+        text = str(revision).strip()
+        if isinstance(revision, int) or text.startswith("#"):
+            return self._at(entries, revision, text.lstrip("#"))
+        matches = [entry for entry in entries if entry["hash"].startswith(text)] if text else []
+        if matches:
+            return matches[-1]
+        if re.fullmatch(r"-?\d{1,6}", text):
+            return self._at(entries, revision, text)
+        raise KeyError(revision)
+
+    @staticmethod
+    def _at(entries, revision, number):
+        try:
+            index = int(number)
+        except ValueError:
+            raise KeyError(revision) from None
+        if index == 0:
+            raise KeyError(revision)
+        try:
+            return entries[index - 1 if index > 0 else index]
+        except IndexError:
+            raise KeyError(revision) from None
+
+    def storage_size(self):
+        """对象占用的字节数"""
+        total = 0
+        for directory, _, names in os.walk(os.path.join(self.root, "objects")):
+            total += sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+        return total
+
+
+def diff_lines(old, new, old_label="旧版本", new_label="新版本", context=2):
+    """按行比较的统一格式差异"""
+    return list(difflib.unified_diff(old.splitlines(), new.splitlines(), old_label, new_label,
+                                     n=context, lineterm=""))
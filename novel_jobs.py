@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""持久化任务队列
+
+服务器模式（novel_server）的生成、批量和导出任务先写入 SQLite 数据库再执行，
+服务器重启后排队中的任务继续执行，执行到一半的任务重新排队；完成的任务
+保留结果，客户端断线重连后仍能取得。
+
+任务为 {"id", "kind", "params", "owner", "status", "priority", "created",
+"started", "finished", "result", "error"}，status 为 queued、running、done、
+failed 或 cancelled。数据库使用 WAL 模式，claim() 在一个写事务中取出任务。
+
+队列只供一个服务器进程使用（与项目存储一样只有一个写入者）：running 状态
+不记录由谁执行，recover() 在启动时把它们全部重新排队。
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from novel_scheduler import BATCH, INTERACTIVE
+
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED = ("done", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    owner TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, id);
+"""
+
+
+class JobQueue:
+    """SQLite 任务队列，线程安全"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def submit(self, kind, params, owner="", priority=INTERACTIVE):
+        """新任务排队，返回任务"""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (kind, params, owner, status, priority, created) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (kind, json.dumps(params, ensure_ascii=False), owner, priority, time.time()))
+            return self._get(cursor.lastrowid)
+
+    def claim(self):
+        """取出下一个排队的任务（交互任务优先，同优先级先进先出）并标记为 running，没有时返回 None"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT id FROM jobs WHERE status = 'queued' "
+                                       "ORDER BY priority, id LIMIT 1").fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                                     (time.time(), row["id"]))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return self._get(row["id"]) if row is not None else None
+
+    def finish(self, job_id, status, result=None, error=None):
+        """记录任务结束"""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                             (status, time.time(), json.dumps(result, ensure_ascii=False)
+                              if result is not None else None, error, job_id))
+
+    def cancel(self, job_id):
+        """取消排队中的任务，返回任务当前的状态（running 需要由执行方取消）"""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                             (time.time(), job_id))
+            job = self._get(job_id)
+            return job["status"] if job else None
+
+    def recover(self):
+        """启动时调用：上次执行到一半的任务重新排队，返回任务数
+
+        所有 running 任务都视为上次退出时中断的，不能有其他进程正在使用这个队列。
+        """
+        with self._lock:
+            return self._db.execute("UPDATE jobs SET status = 'queued', started = NULL "
+                                    "WHERE status = 'running'").rowcount
+
+    def _get(self, job_id):
+        return self._job(self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def get(self, job_id):
+        with self._lock:
+            return self._get(job_id)
+
+    def list(self, owner=None, status=None, limit=50):
+        """最近的任务（不含结果），新的在前"""
+        query = "SELECT id, kind, params, owner, status, priority, created, started, finished, error FROM jobs"
+        conditions, args = [], []
+        if owner:
+            conditions.append("owner = ?")
+            args.append(owner)
+        if status:
+            conditions.append("status = ?")
+            args.append(status)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["params"] = json.loads(job["params"])
+            jobs.append(job)
+        return jobs
+
+    def counts(self):
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+
+def job_priority(kind):
+    """批量和导出任务排在交互任务之后"""
+    return BATCH if kind in ("batch", "export") else INTERACTIVE
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""调用指标
+
+每次提供商调用（包括缓存命中）记录一条 CallRecord：排队时间、首字延迟、
+总耗时、输入和输出 token 数、估算费用、是否命中缓存、是否合并到进行中的
+相同请求和重试次数。
+
+MetricsRecorder 按 (提供商, 生成类型) 汇总：延迟用累计直方图（用于
+Prometheus 导出）和最近若干次的滚动窗口（用于界面显示分位数），token 和
+费用累加。流式接口不返回用量，token 数按 estimate_tokens 估算。
+"""
+import json
+import threading
+import time
+from collections import deque
+
+from novel_router import percentile
+
+# 每百万 token 的美元价格（输入, 输出），提供商配置中可用 price_input/price_output 覆盖
+DEFAULT_PRICES = {
+    "OpenAI": (0.15, 0.6),
+    "Claude": (3.0, 15.0),
+    "Gemini": (0.5, 1.5),
+}
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+LATENCY_FIELDS = ("queue_time", "first_token", "total")
+
+
+def estimate_cost(provider, provider_config, prompt_tokens, completion_tokens):
+    """按配置或默认价格估算一次调用的费用（美元）"""
+    default_input, default_output = DEFAULT_PRICES.get(provider, (0.0, 0.0))
+    price_input = float(provider_config.get("price_input", default_input))
+    price_output = float(provider_config.get("price_output", default_output))
+    return (prompt_tokens * price_input + completion_tokens * price_output) / 1_000_000
+
+
+class CallRecord:
+    """一次提供商调用的指标，queue_time 和 retries 由调度器累加"""
+
+    def __init__(self, kind, prompt_tokens=0):
+        self.timestamp = time.time()
+        self.started = time.monotonic()
+        self.kind = kind
+        self.provider = None
+        self.queue_time = 0.0
+        self.first_token = None
+        self.total = None
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.cache_hit = False
+        # 合并到进行中的相同请求，没有单独调用提供商
+        self.coalesced = False
+        self.retries = 0
+        self.error = None
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.monotonic() - self.started
+
+    def to_dict(self):
+        return {"timestamp": self.timestamp, "provider": self.provider, "kind": self.kind,
+                "queue_time": self.queue_time, "first_token": self.first_token, "total": self.total,
+                "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+                "cost": self.cost, "cache_hit": self.cache_hit, "coalesced": self.coalesced, "retries": self.retries,
+                "error": self.error}
+
+
+class Histogram:
+    """累计直方图"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricSeries:
+    """一个 (提供商, 生成类型) 的汇总"""
+
+    def __init__(self, window):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.histograms = {field: Histogram() for field in LATENCY_FIELDS}
+        self.recent = {field: deque(maxlen=window) for field in LATENCY_FIELDS}
+
+
+class MetricsRecorder:
+    """收集调用指标，线程安全"""
+
+    def __init__(self, window=200, history=1000):
+        self.window = window
+        self.series = {}
+        self.records = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        """登记一次已结束的调用"""
+        with self._lock:
+            self.records.append(call)
+            key = (call.provider or "未知", call.kind)
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = MetricSeries(self.window)
+            series.calls += 1
+            series.errors += call.error is not None
+            series.cache_hits += call.cache_hit
+            series.coalesced += call.coalesced
+            series.retries += call.retries
+            series.prompt_tokens += call.prompt_tokens
+            series.completion_tokens += call.completion_tokens
+            series.cost += call.cost
+            for field in LATENCY_FIELDS:
+                value = getattr(call, field)
+                # 缓存命中和合并的请求没有单独的网络请求，不计入延迟分布
+                if value is not None and not call.cache_hit and not call.coalesced:
+                    series.histograms[field].observe(value)
+                    series.recent[field].append(value)
+
+    def snapshot(self):
+        """各序列的汇总：[{provider, kind, calls, errors, ..., "queue_time": {"p50", "p95"}, ...}]"""
+        with self._lock:
+            items = [(key, series, {field: list(values) for field, values in series.recent.items()})
+                     for key, series in sorted(self.series.items())]
+            rows = []
+            for (provider, kind), series, recent in items:
+                row = {"provider": provider, "kind": kind, "calls": series.calls, "errors": series.errors,
+                       "cache_hits": series.cache_hits, "coalesced": series.coalesced, "retries": series.retries,
+                       "prompt_tokens": series.prompt_tokens, "completion_tokens": series.completion_tokens,
+                       "cost": series.cost}
+                for field, values in recent.items():
+                    row[field] = {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+                rows.append(row)
+        return rows
+
+    def to_jsonl(self):
+        """最近的调用记录，每行一个 JSON 对象"""
+        with self._lock:
+            records = [call.to_dict() for call in self.records]
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式的累计指标"""
+        lines = []
+        counters = (("calls", "调用次数"), ("errors", "失败次数"), ("cache_hits", "缓存命中次数"),
+                    ("coalesced", "合并到进行中请求的次数"),
+                    ("retries", "重试次数"), ("prompt_tokens", "输入 token（估算）"),
+                    ("completion_tokens", "输出 token（估算）"), ("cost", "估算费用（美元）"))
+        with self._lock:
+            series = sorted(self.series.items())
+            for name, help_text in counters:
+                metric = f"novel_{name}_total"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for (provider, kind), s in series:
+                    lines.append(f"{metric}{{{labels(provider, kind)}}} {getattr(s, name)}")
+            for field in LATENCY_FIELDS:
+                metric = f"novel_{field}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for (provider, kind), s in series:
+                    histogram = s.histograms[field]
+                    label = labels(provider, kind)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f"{metric}_sum{{{label}}} {histogram.sum}")
+                    lines.append(f"{metric}_count{{{label}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """按扩展名导出：.prom 为 Prometheus 文本格式，其余为 JSON lines"""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_jsonl()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def labels(provider, kind):
+    """Prometheus 标签，转义反斜杠和引号"""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'provider="{escape(provider)}",kind="{escape(kind)}"'
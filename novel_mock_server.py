@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""本地模拟提供商服务器
+
+按 OpenAI、Claude、Gemini 的请求路径和流式格式返回模拟的中文文本，用于
+基准测试和没有外网的环境：
+
+- POST .../chat/completions          OpenAI SSE（data: {...}，以 [DONE] 结束）
+- POST .../messages                  Claude SSE（event + data，以 message_stop 结束）
+- POST ...:streamGenerateContent     Gemini SSE（每条 data 一个 candidates）
+- GET  其他路径                        连接测试，返回空的模型列表
+
+首字延迟按分布抽样，输出按 tokens_per_second 匀速发送，并可按比例返回
+500、带 Retry-After 的 429 或在中途断开连接。
+
+    python novel_mock_server.py --port 8765 --latency lognormal:0.3,0.5 --tps 200 --error-rate 0.05
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_TEXT = ("夜色渐深，长安城的灯火一盏接一盏地熄灭。林风站在城楼上，望着远处起伏的山影，"
+               "心里反复盘算着明日的计划。风从北方吹来，带着一丝潮湿的寒意。")
+
+
+class Distribution:
+    """延迟分布：fixed:秒、uniform:最小,最大、normal:均值,标准差、lognormal:中位数,sigma"""
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的分布: {spec}")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        self.spec = spec
+
+    def sample(self, rng):
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0] if p else 0.0
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        else:
+            value = p[0] * math.exp(rng.gauss(0, p[1]))
+        return max(0.0, value)
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    # 默认的 listen 队列只有 5，批量并发连接时溢出会让连接重传等待 1 秒
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class MockProviderServer:
+    """在后台线程运行的模拟服务器，属性可以在运行中修改"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", tokens_per_second=0.0,
+                 output_tokens=400, chunk_chars=4, error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0,
+                 disconnect_rate=0.0, seed=None):
+        self.latency = Distribution(latency)
+        # 0 表示不限速
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.disconnect_rate = disconnect_rate
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "disconnects": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = MockHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def endpoints(self):
+        """各提供商的 endpoint，可直接写入 config["api_providers"]"""
+        return {
+            "OpenAI": f"{self.base_url}/v1/chat/completions",
+            "Claude": f"{self.base_url}/v1/messages",
+            "Gemini": f"{self.base_url}/v1beta/models/gemini-pro:generateContent",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="novel-mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _draw(self):
+        """抽取本次请求的结果：("error" | "rate_limit" | "disconnect" | "ok", 首字延迟)"""
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            latency = self.latency.sample(self._rng)
+            if roll < self.error_rate:
+                outcome = "error"
+            elif roll < self.error_rate + self.rate_limit_rate:
+                outcome = "rate_limit"
+            elif roll < self.error_rate + self.rate_limit_rate + self.disconnect_rate:
+                outcome = "disconnect"
+            else:
+                outcome = "ok"
+            if outcome == "error":
+                self.stats["errors"] += 1
+            elif outcome == "rate_limit":
+                self.stats["rate_limited"] += 1
+            elif outcome == "disconnect":
+                self.stats["disconnects"] += 1
+        return outcome, latency
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和正文分开写入，不关闭 Nagle 时复用的连接每次多等 40ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body, headers=()):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def write_chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                self.send_json(200, {"data": [], "models": []})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self.send_json(400, {"error": {"message": "invalid json"}})
+                    return
+                if self.path.split("?", 1)[0].endswith("/chat/completions"):
+                    provider, max_tokens = "openai", body.get("max_tokens")
+                elif self.path.split("?", 1)[0].endswith("/messages"):
+                    provider, max_tokens = "claude", body.get("max_tokens")
+                elif ":streamGenerateContent" in self.path:
+                    provider = "gemini"
+                    max_tokens = body.get("generationConfig", {}).get("maxOutputTokens")
+                else:
+                    self.send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                outcome, latency = server._draw()
+                if outcome == "error":
+                    self.send_json(500, {"error": {"message": "mock server error"}})
+                    return
+                if outcome == "rate_limit":
+                    self.send_json(429, {"error": {"message": "rate limited"}},
+                                   [("Retry-After", f"{server.retry_after:g}")])
+                    return
+                time.sleep(latency)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                tokens = min(server.output_tokens, max_tokens or server.output_tokens)
+                text = (SAMPLE_TEXT * (tokens // len(SAMPLE_TEXT) + 1))[:tokens]
+                step = max(1, server.chunk_chars)
+                interval = step / server.tokens_per_second if server.tokens_per_second else 0
+                try:
+                    if provider == "claude":
+                        self.write_chunk(sse({"type": "message_start"}, "message_start"))
+                    for i in range(0, len(text), step):
+                        if outcome == "disconnect" and i >= len(text) // 2:
+                            # 不发送结束块，直接断开
+                            self.close_connection = True
+                            return
+                        piece = text[i:i + step]
+                        if provider == "openai":
+                            event = sse({"choices": [{"delta": {"content": piece}}]})
+                        elif provider == "claude":
+                            event = sse({"type": "content_block_delta", "delta": {"type": "text_delta",
+                                                                                   "text": piece}},
+                                        "content_block_delta")
+                        else:
+                            event = sse({"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]})
+                        self.write_chunk(event)
+                        if interval:
+                            time.sleep(interval)
+                    if provider == "openai":
+                        self.write_chunk("data: [DONE]\n\n")
+                    elif provider == "claude":
+                        self.write_chunk(sse({"type": "message_stop"}, "message_stop"))
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端取消或对冲请求落选
+                    self.close_connection = True
+
+        return Handler
+
+
+def sse(payload, event=None):
+    """一条 SSE 事件"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="novel_mock_server", description="本地模拟提供商服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="首字延迟分布，例如 fixed:0.2")
+    parser.add_argument("--tps", type=float, default=200, help="每秒输出 token 数，0 为不限速")
+    parser.add_argument("--output-tokens", type=int, default=400, help="每次输出的 token 上限")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="中途断开的比例")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    server = MockProviderServer(args.host, args.port, args.latency, args.tps, args.output_tokens,
+                                error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                                retry_after=args.retry_after, disconnect_rate=args.disconnect_rate,
+                                seed=args.seed)
+    print("在配置文件的 api_providers 中使用以下 endpoint（api_key 任意）：")
+    for provider, endpoint in server.endpoints().items():
+        print(f"  {provider}: {endpoint}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""AI 提供商客户端
+
+config["api_providers"] 中的每个提供商对应一个客户端类。三家都使用流式接口：
+OpenAI 与 Claude 为 SSE，Gemini 为 streamGenerateContent(alt=sse)。
+"""
+import json
+import re
+import time
+import threading
+
+# 各提供商未配置模型时使用的默认值
+DEFAULT_MODELS = {
+    "OpenAI": "gpt-4o-mini",
+    "Claude": "claude-3-5-sonnet-latest",
+    "Gemini": "gemini-pro",
+}
+
+# 生成长度对应的最大输出 token 数
+LENGTH_MAX_TOKENS = {
+    "短": 800,
+    "中等": 2000,
+    "长": 4000,
+    "超长": 8000,
+}
+
+
+# 各提供商默认模型的上下文窗口（token），提供商配置中可用 context_tokens 覆盖
+CONTEXT_WINDOWS = {
+    "OpenAI": 128000,
+    "Claude": 200000,
+    "Gemini": 30720,
+}
+
+# 近似 BPE 分词：英文单词、三位以内的数字各算一个 token，
+# 中日韩字符和标点每个字符算一个 token，空白不计
+TOKEN_PIECE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+LONG_WORD = re.compile(r"[A-Za-z]{9,}")
+
+
+def estimate_tokens(text):
+    """快速估计 token 数，中文按字计算，长单词额外多算一个"""
+    return len(TOKEN_PIECE.findall(text)) + len(LONG_WORD.findall(text))
+
+
+class ProviderError(Exception):
+    """提供商返回错误"""
+
+    def __init__(self, provider, message, status_code=None, retry_after=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def iter_sse_data(response):
+    """逐条产出 SSE 事件中的 data 字段"""
+    # text/event-stream 通常不带 charset，requests 会按 ISO-8859-1 解码导致中文乱码
+    response.encoding = "utf-8"
+    data_lines = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+def raise_for_status(provider, response):
+    """把 HTTP 错误转换为 ProviderError"""
+    if response.status_code < 400:
+        return
+    retry_after = response.headers.get("Retry-After")
+    try:
+        retry_after = float(retry_after) if retry_after else None
+    except ValueError:
+        retry_after = None
+    raise ProviderError(provider, f"HTTP {response.status_code}: {response.text[:200]}",
+                        status_code=response.status_code, retry_after=retry_after)
+
+
+class ProviderClient:
+    """提供商客户端基类
+
+    每个客户端持有一个 requests.Session，底层连接保持 keep-alive 并放入
+    连接池复用，批量调用时不必每次重新进行 TLS 握手。提供商配置中可选：
+    model、pool_size（连接池大小）、connect_timeout、read_timeout（秒）。
+    """
+    name = None
+    # 流是否以明确的结束事件收尾；有结束事件的提供商，连接提前断开视为失败
+    has_end_event = True
+
+    def __init__(self, provider_config):
+        self.api_key = provider_config.get("api_key", "")
+        self.endpoint = provider_config["endpoint"]
+        self.model = provider_config.get("model") or DEFAULT_MODELS[self.name]
+        self.pool_size = int(provider_config.get("pool_size", 10))
+        self.timeout = (float(provider_config.get("connect_timeout", 10)),
+                        float(provider_config.get("read_timeout", 120)))
+
+        # 延迟导入：只列项目或导出的命令行调用不需要加载 requests
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+        self.session.headers.update(self.auth_headers())
+
+    def auth_headers(self):
+        """鉴权相关的请求头"""
+        raise NotImplementedError
+
+    def stream_request(self, prompt, max_tokens):
+        """流式请求的 url 和请求体"""
+        raise NotImplementedError
+
+    def parse_stream_event(self, data):
+        """从一条 SSE data 中取出文本片段，流结束返回 None"""
+        raise NotImplementedError
+
+    def check_url(self):
+        """连接测试使用的轻量接口（列出模型或查询模型信息）"""
+        raise NotImplementedError
+
+    def stream(self, prompt, max_tokens=2000):
+        """流式调用，逐段产出生成的文本"""
+        url, body = self.stream_request(prompt, max_tokens)
+        with self.session.post(url, json=body, stream=True, timeout=self.timeout) as response:
+            raise_for_status(self.name, response)
+            for data in iter_sse_data(response):
+                text = self.parse_stream_event(data)
+                if text is None:
+                    return
+                if text:
+                    yield text
+        if self.has_end_event:
+            raise ProviderError(self.name, "连接在响应结束前断开")
+
+    def check_connection(self):
+        """真实请求测试连接，返回 (首次耗时, 复用连接耗时)，单位秒
+
+        第一次请求包含 DNS 与 TLS 握手，第二次复用连接池中的连接。
+        """
+        latencies = []
+        for _ in range(2):
+            start = time.monotonic()
+            response = self.session.get(self.check_url(), timeout=self.timeout)
+            # 读完响应体，连接才会放回连接池
+            response.content
+            latencies.append(time.monotonic() - start)
+            raise_for_status(self.name, response)
+        return latencies[0], latencies[1]
+
+    def close(self):
+        """关闭会话和连接池"""
+        self.session.close()
+
+
+class OpenAIClient(ProviderClient):
+    name = "OpenAI"
+
+    def auth_headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def stream_request(self, prompt, max_tokens):
+        body = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        return self.endpoint, body
+
+    def parse_stream_event(self, data):
+        if data == "[DONE]":
+            return None
+        choices = json.loads(data).get("choices") or []
+        if not choices:
+            return ""
+        return choices[0].get("delta", {}).get("content") or ""
+
+    def check_url(self):
+        return self.endpoint.rsplit("/chat/completions", 1)[0] + "/models"
+
+
+class ClaudeClient(ProviderClient):
+    name = "Claude"
+
+    def auth_headers(self):
+        return {"x-api-key": self.api_key, "anthropic-version": "2023-06-01"}
+
+    def stream_request(self, prompt, max_tokens):
+        content = prompt
+        prefix_length = getattr(prompt, "prefix_length", 0)
+        if 0 < prefix_length < len(prompt):
+            # 模板的稳定前缀单独成块并标记 cache_control，后续请求可以复用服务端缓存
+            content = [{"type": "text", "text": prompt[:prefix_length], "cache_control": {"type": "ephemeral"}},
+                       {"type": "text", "text": prompt[prefix_length:]}]
+        body = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        return self.endpoint, body
+
+    def parse_stream_event(self, data):
+        event = json.loads(data)
+        event_type = event.get("type")
+        if event_type == "error":
+            raise ProviderError(self.name, event.get("error", {}).get("message", "未知错误"))
+        if event_type == "message_stop":
+            return None
+        if event_type == "content_block_delta":
+            return event.get("delta", {}).get("text") or ""
+        return ""
+
+    def check_url(self):
+        return self.endpoint.rsplit("/messages", 1)[0] + "/models"
+
+
+class GeminiClient(ProviderClient):
+    name = "Gemini"
+    has_end_event = False
+
+    def auth_headers(self):
+        return {"x-goog-api-key": self.api_key}
+
+    def stream_request(self, prompt, max_tokens):
+        url = self.endpoint.replace(":generateContent", ":streamGenerateContent")
+        url += ("&" if "?" in url else "?") + "alt=sse"
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"maxOutputTokens": max_tokens},
+        }
+        return url, body
+
+    def parse_stream_event(self, data):
+        texts = []
+        for candidate in json.loads(data).get("candidates") or []:
+            for part in candidate.get("content", {}).get("parts") or []:
+                texts.append(part.get("text", ""))
+        return "".join(texts)
+
+    def check_url(self):
+        # .../models/gemini-pro:generateContent -> .../models/gemini-pro
+        return self.endpoint.split("?", 1)[0].rsplit(":", 1)[0]
+
+
+# config["api_providers"] 中每个条目对应的客户端类
+PROVIDER_CLIENTS = {
+    "OpenAI": OpenAIClient,
+    "Claude": ClaudeClient,
+    "Gemini": GeminiClient,
+}
+
+
+class ProviderPool:
+    """按提供商缓存客户端，配置变化时重建，线程安全"""
+
+    def __init__(self):
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider, provider_config):
+        """取得提供商客户端，相同配置复用同一个会话"""
+        if provider not in PROVIDER_CLIENTS:
+            raise ProviderError(provider, "不支持的提供商")
+        key = json.dumps(provider_config, sort_keys=True)
+        with self._lock:
+            cached = self.clients.get(provider)
+            if cached and cached[0] == key:
+                return cached[1]
+            client = PROVIDER_CLIENTS[provider](provider_config)
+            self.clients[provider] = (key, client)
+        if cached:
+            cached[1].close()
+        return client
+
+    def close_all(self):
+        """关闭所有客户端"""
+        with self._lock:
+            clients = [client for _, client in self.clients.values()]
+            self.clients = {}
+        for client in clients:
+            client.close()
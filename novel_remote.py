@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""服务器模式的客户端
+
+RemoteCore 提供图形界面使用的 NovelCore 接口，但项目、生成和检索都由
+novel_server 完成：生成类方法仍然在本地引擎的工作线程中调用（界面代码不变），
+它们在服务器上创建任务，再把任务的 SSE 事件原样转发为本地任务的事件。
+本地任务取消时同时取消服务器上的任务；连接中断时从最后收到的事件继续接收。
+"""
+import getpass
+import json
+import os
+from types import SimpleNamespace
+from urllib.parse import quote
+
+from novel_core import DEFAULT_ROUTING, SEARCH_FIELDS
+from novel_engine import GenerationEngine, JobCancelled
+from novel_store import LazyTexts
+
+PROJECT_FIELDS = ("title", "author", "genre", "outline", "characters", "setting")
+# 章节列表按页显示，取一个章节标题时顺便取之后这么多章的标题
+HEADING_PREFETCH = 50
+
+
+class RemoteError(Exception):
+    """服务器返回错误或任务失败"""
+
+
+class RemoteCache:
+    def __init__(self, remote):
+        self.remote = remote
+
+    def summary(self):
+        return self.remote.request("GET", "/api/status")["cache"]
+
+    def clear(self):
+        self.remote.request("POST", "/api/cache/clear")
+
+
+class RemoteMetrics:
+    def __init__(self, remote):
+        self.remote = remote
+
+    def snapshot(self):
+        return self.remote.request("GET", "/api/metrics")
+
+    def export(self, path):
+        """按扩展名导出服务器上的调用指标：.prom 为 Prometheus 文本格式，其余为 JSON lines"""
+        fmt = "prom" if path.endswith(".prom") else "jsonl"
+        text = self.remote.request("GET", "/api/metrics", params={"format": fmt})["text"]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+class RemoteBatch:
+    """服务器上的批量任务，接口与 BatchRunner 相同（chapters、providers、run、snapshot）"""
+
+    def __init__(self, remote, project, job):
+        self.remote = remote
+        self.project = project
+        self.job_id = job["id"]
+        self.chapters = [{"number": number} for number in job["chapters"]]
+        self.providers = job["providers"]
+        self.report = {"total": len(self.chapters), "done": 0, "failed": [], "chars": 0,
+                       "by_provider": dict.fromkeys(self.providers, 0), "elapsed": 0,
+                       "chapters_per_min": 0, "chars_per_sec": 0}
+
+    def snapshot(self):
+        return dict(self.report)
+
+    def run(self, job):
+        def on_event(name, payload):
+            if name == "batch_progress":
+                self.report = payload
+            job.emit(name, payload, deliver_cancelled=name == "chapter_done")
+
+        # 窗口关闭后批量任务继续在服务器上执行，完成的章节照常写入项目
+        result = self.remote.follow(job, self.job_id, on_event, keep_on_suspend=True)
+        if result is not None:
+            self.report = result
+        return self.report
+
+
+class RemoteCore:
+    """连接 novel_server 的瘦客户端"""
+
+    def __init__(self, url, token=None, user=None, max_workers=4, timeout=30):
+        # 延迟导入，与提供商客户端一样
+        import requests
+
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["X-Novel-User"] = user or getpass.getuser()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.config_error = None
+        self.writer = SimpleNamespace(replayed=0)
+        self.config = self.request("GET", "/api/status")["config"]
+        self.engine = GenerationEngine(max_workers=max_workers)
+        self.cache = RemoteCache(self)
+        self.metrics = RemoteMetrics(self)
+        self._headings = {}
+        self.projects = [self._project(data) for data in self.request("GET", "/api/projects")]
+
+    def close(self):
+        self.engine.shutdown()
+        self.session.close()
+
+    def request(self, method, path, body=None, params=None):
+        """调用接口，400 抛出 ValueError，404 抛出 KeyError，其他错误抛出 RemoteError"""
+        response = self.session.request(method, self.url + path, json=body, params=params, timeout=self.timeout)
+        if response.status_code >= 400:
+            try:
+                message = response.json()["error"]
+            except ValueError:
+                message = response.text[:200]
+            if response.status_code == 400:
+                raise ValueError(message)
+            if response.status_code == 404:
+                raise KeyError(message)
+            raise RemoteError(f"HTTP {response.status_code}: {message}")
+        return response.json()
+
+    # ---- 配置 ----
+
+    def save_config(self):
+        self.config.update(self.request("PUT", "/api/config", self.config))
+
+    def routing_config(self):
+        routing = dict(DEFAULT_ROUTING)
+        routing.update(self.config.get("routing", {}))
+        return routing
+
+    def health_summary(self):
+        return self.request("GET", "/api/status")["health"]
+
+    def test_connection(self, job, provider, provider_config):
+        first, reused = self.request("POST", f"/api/providers/{provider}/test")
+        return first, reused
+
+    # ---- 项目 ----
+
+    def _project(self, data):
+        project = {field: data.get(field, "") for field in PROJECT_FIELDS}
+        project["id"] = data["id"]
+        project_id = data["id"]
+        project["chapters"] = LazyTexts(
+            data.get("chapters", []),
+            lambda n: self.request("GET", f"/api/projects/{project_id}/chapters/{n}")["text"])
+        project["summaries"] = {}
+        return project
+
+    def find_project(self, title):
+        for p in self.projects:
+            if p["title"] == title or p["id"] == title:
+                return p
+        return None
+
+    def save_project(self, project_data, project=None, source="保存"):
+        data = {field: project_data.get(field, "") for field in PROJECT_FIELDS}
+        if project is None:
+            project = self._project(self.request("POST", "/api/projects", data))
+            self.projects.append(project)
+            return project
+        data["source"] = source
+        saved = self.request("PUT", f"/api/projects/{project['id']}", data)
+        project.update({field: saved[field] for field in PROJECT_FIELDS})
+        return project
+
+    def delete_project(self, project):
+        self.request("DELETE", f"/api/projects/{project['id']}")
+        self.projects.remove(project)
+
+    def add_chapter(self, project, content):
+        number = self.request("POST", f"/api/projects/{project['id']}/chapters", {"content": content})["number"]
+        project["chapters"][number] = content
+        return number
+
+    def chapter_heading(self, project, number):
+        text = project["chapters"].peek(number)
+        if text is not None:
+            return text.strip().split("\n", 1)[0][:200]
+        key = (project["id"], number)
+        if key not in self._headings:
+            numbers = [n for n in project["chapters"] if n >= number][:HEADING_PREFETCH]
+            headings = self.request("GET", f"/api/projects/{project['id']}/headings",
+                                    params={"numbers": ",".join(map(str, numbers))})
+            for n, heading in headings.items():
+                self._headings[(project["id"], int(n))] = heading
+        return self._headings.get(key, "")
+
+    # ---- 检索与版本历史 ----
+
+    def build_index(self):
+        """索引在服务器上"""
+
+    def search(self, query, limit=20, project_id=None):
+        return self.request("GET", "/api/search", params={"q": query, "limit": limit, "project": project_id or ""})
+
+    def doc_text(self, doc):
+        project_id, field, number = doc
+        project = self.find_project(project_id)
+        if project is None:
+            return ""
+        if field == "chapter":
+            return project["chapters"].get(number, "")
+        return project.get(field, "")
+
+    def history(self, project, target):
+        return self.request("GET", f"/api/projects/{project['id']}/history", params={"target": target})
+
+    def history_text(self, project, target, revision):
+        return self.request("GET", f"/api/projects/{project['id']}/history",
+                            params={"target": target, "revision": revision})["text"]
+
+    def history_diff(self, project, target, old, new=None):
+        params = {"target": target, "diff": old}
+        if new is not None:
+            params["against"] = new
+        return self.request("GET", f"/api/projects/{project['id']}/history", params=params)["lines"]
+
+    def restore_revision(self, project, target, revision):
+        text = self.request("POST", f"/api/projects/{project['id']}/history/restore",
+                            {"target": target, "revision": revision})["text"]
+        if isinstance(target, int):
+            project["chapters"][target] = text
+        elif target in SEARCH_FIELDS:
+            project[target] = text
+        return text
+
+    def entity_report(self, project):
+        return self.request("GET", f"/api/projects/{project['id']}/entities")
+
+    def pending_checkpoints(self):
+        """服务器上中断的任务由服务器重新执行时自己恢复"""
+        return []
+
+    # ---- 任务 ----
+
+    def run_job(self, job, kind, params):
+        """在服务器上执行任务，事件转发给本地任务，返回结果"""
+        return self.follow(job, self.request("POST", "/api/jobs", {"kind": kind, "params": params})["id"])
+
+    def follow(self, job, job_id, on_event=None, keep_on_suspend=False):
+        """接收任务事件直到结束；本地任务取消时取消服务器上的任务，连接中断时续传
+
+        keep_on_suspend 为 True 时，因退出而中断（job.suspended）不取消服务器上的任务。
+        """
+        on_event = on_event or job.emit
+        received = 0
+        failures = 0
+        try:
+            while True:
+                try:
+                    for event_id, name, payload in self._events(job, job_id, received):
+                        failures = 0
+                        if name == "end":
+                            if payload["status"] == "done":
+                                return payload["result"]
+                            if payload["status"] == "cancelled":
+                                raise JobCancelled()
+                            raise RemoteError(payload["error"])
+                        received = event_id
+                        on_event(name, payload)
+                except (OSError, ValueError) as e:
+                    # requests 的连接错误是 OSError 的子类，半截的事件数据是 ValueError
+                    failures += 1
+                    if failures > 3:
+                        raise RemoteError(f"与服务器的连接中断: {e}") from e
+                    job.sleep(failures)
+        except JobCancelled:
+            if keep_on_suspend and job.suspended:
+                raise
+            try:
+                self.request("POST", f"/api/jobs/{job_id}/cancel")
+            except Exception:
+                pass
+            raise
+
+    def _events(self, job, job_id, after):
+        """逐条产出 (事件 id, 事件名, 数据)，等待期间检查本地任务是否已取消"""
+        with self.session.get(f"{self.url}/api/jobs/{job_id}/events", params={"after": after},
+                              stream=True, timeout=self.timeout) as response:
+            if response.status_code >= 400:
+                raise RemoteError(f"HTTP {response.status_code}: {response.text[:200]}")
+            response.encoding = "utf-8"
+            event_id, name, data = after, None, []
+            for line in response.iter_lines(decode_unicode=True):
+                job.check_cancelled()
+                if line:
+                    field, _, value = line.partition(":")
+                    value = value[1:] if value.startswith(" ") else value
+                    if field == "id":
+                        event_id = int(value)
+                    elif field == "event":
+                        name = value
+                    elif field == "data":
+                        data.append(value)
+                elif data:
+                    yield event_id, name, json.loads("\n".join(data))
+                    name, data = None, []
+        raise ConnectionError("事件流在任务结束前断开")
+
+    def generate_prompt(self, job, theme, prompt_type, use_cache=True):
+        return self.run_job(job, "prompt", {"theme": theme, "prompt_type": prompt_type, "use_cache": use_cache})
+
+    def generate_content(self, job, project, gen_type, style, length, custom_prompt, use_cache=True):
+        return self.run_job(job, "generate", {"project": project["id"], "gen_type": gen_type, "style": style,
+                                              "length": length, "custom_prompt": custom_prompt,
+                                              "use_cache": use_cache})
+
+    def create_batch(self, project, start, end, overwrite, style, length, custom_prompt):
+        """在服务器上创建批量任务（立即排队），没有可生成的章节时抛出 ValueError"""
+        job = self.request("POST", "/api/jobs", {"kind": "batch", "params": {
+            "project": project["id"], "start": start, "end": end, "overwrite": overwrite,
+            "style": style, "length": length, "custom_prompt": custom_prompt}})
+        return RemoteBatch(self, project, job)
+
+    def export_project(self, job, project, path, fmt=None, include_settings=True, incremental=True):
+        """在服务器上导出（写入项目目录下的 exports/，增量导出照常生效），再下载到本机的 path"""
+        name = os.path.basename(path)
+        report = self.run_job(job, "export", {"project": project["id"], "path": name, "format": fmt,
+                                              "include_settings": include_settings, "incremental": incremental})
+        self.download(job, f"/api/projects/{project['id']}/exports/{quote(name)}", path)
+        report["path"] = os.path.abspath(path)
+        return report
+
+    def download(self, job, url_path, path):
+        """把接口返回的文件写入本机的 path，先写临时文件，中途失败或取消时保留原来的文件"""
+        temp_path = f"{path}.tmp"
+        with self.session.get(self.url + url_path, stream=True, timeout=self.timeout) as response:
+            if response.status_code >= 400:
+                raise RemoteError(f"HTTP {response.status_code}: {response.text[:200]}")
+            try:
+                with open(temp_path, "wb") as f:
+                    for block in response.iter_content(65536):
+                        job.check_cancelled()
+                        f.write(block)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        os.replace(temp_path, path)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""多提供商路由
+
+按策略把一次生成请求分配给配置了密钥的提供商：
+
+- single：只使用第一个提供商；
+- failover：按顺序尝试，出错（包括超时）时切换到下一个；
+- hedge：第一个提供商的首字延迟超过其历史分位数时，再向下一个提供商
+  发出同样的请求，谁先返回首个片段就用谁，另一个随即停止。
+
+每个提供商记录首字延迟、总耗时和成功失败次数；连续失败达到阈值后
+暂停使用一段时间，排到候选列表末尾。
+"""
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+from novel_engine import JobCancelled
+from novel_providers import ProviderError
+
+ROUTING_POLICIES = ("single", "failover", "hedge")
+
+
+def percentile(values, p):
+    """简单的最近秩分位数，p 取 0-100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+
+class ProviderHealth:
+    """单个提供商的健康状况和延迟统计"""
+
+    def __init__(self, window=200):
+        self.first_chunk = deque(maxlen=window)
+        self.totals = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.down_until = 0.0
+
+
+class ProviderRouter:
+    """按策略路由生成请求，并统计各提供商的健康状况，线程安全"""
+
+    def __init__(self, failure_threshold=3, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.health = {}
+        self._lock = threading.Lock()
+
+    def _health(self, provider):
+        health = self.health.get(provider)
+        if health is None:
+            health = self.health[provider] = ProviderHealth()
+        return health
+
+    # ---- 统计 ----
+
+    def record_first_chunk(self, provider, latency):
+        with self._lock:
+            self._health(provider).first_chunk.append(latency)
+
+    def record_success(self, provider, total):
+        with self._lock:
+            health = self._health(provider)
+            health.totals.append(total)
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.down_until = 0.0
+
+    def record_failure(self, provider, error):
+        with self._lock:
+            health = self._health(provider)
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_error = str(error)
+            if health.consecutive_failures >= self.failure_threshold:
+                health.down_until = time.monotonic() + self.cooldown
+
+    def available(self, provider):
+        """提供商是否不在暂停期内"""
+        with self._lock:
+            return self._health(provider).down_until <= time.monotonic()
+
+    def hedge_delay(self, provider, p, min_delay, default_delay):
+        """对冲前等待的时间：该提供商首字延迟的 p 分位数，样本不足时用默认值"""
+        with self._lock:
+            samples = list(self._health(provider).first_chunk)
+        if len(samples) < 10:
+            return max(min_delay, default_delay)
+        return max(min_delay, percentile(samples, p))
+
+    def snapshot(self):
+        """各提供商的统计：{提供商: {"p50", "p95", "p99", "successes", "failures", "down", "last_error"}}"""
+        now = time.monotonic()
+        with self._lock:
+            items = [(name, list(h.first_chunk), h.successes, h.failures, h.down_until > now, h.last_error)
+                     for name, h in self.health.items()]
+        return {name: {"p50": percentile(samples, 50), "p95": percentile(samples, 95),
+                       "p99": percentile(samples, 99), "successes": successes, "failures": failures,
+                       "down": down, "last_error": last_error}
+                for name, samples, successes, failures, down, last_error in items}
+
+    def summary(self):
+        """健康状况的简短描述"""
+        parts = []
+        for name, stats in sorted(self.snapshot().items()):
+            if stats["down"]:
+                state = "暂停"
+            elif stats["p50"] is None:
+                state = "无数据"
+            else:
+                state = f"首字 p50 {stats['p50']:.2f}s / p99 {stats['p99']:.2f}s"
+            parts.append(f"{name}：{state}，成功 {stats['successes']}，失败 {stats['failures']}")
+        return "\n".join(parts) or "暂无调用记录"
+
+    # ---- 路由 ----
+
+    def order(self, providers):
+        """可用的提供商在前，暂停中的排到最后（全部暂停时仍会尝试）"""
+        return sorted(providers, key=lambda item: not self.available(item[0]))
+
+    def track(self, provider, chunks):
+        """包装流式生成器，记录首字延迟、总耗时和失败"""
+        started = time.monotonic()
+        first = True
+        try:
+            for chunk in chunks:
+                if first:
+                    self.record_first_chunk(provider, time.monotonic() - started)
+                    first = False
+                yield chunk
+        except (JobCancelled, GeneratorExit):
+            raise
+        except Exception as e:
+            self.record_failure(provider, e)
+            raise
+        finally:
+            chunks.close()
+        self.record_success(provider, time.monotonic() - started)
+
+    def stream(self, job, attempts, policy="failover", hedge_percentile=95, hedge_min_delay=1.0,
+               hedge_default_delay=5.0):
+        """按策略流式生成，产出 (提供商, 片段)
+
+        attempts 为 [(提供商, 打开流的函数)]，按优先顺序排列。切换提供商时
+        如果已经产出过片段，先产出 (新提供商, None)，调用方应丢弃之前的片段。
+        """
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"未知的路由策略: {policy}")
+        attempts = self.order(attempts)
+        if policy == "single":
+            attempts = attempts[:1]
+        if policy == "hedge" and len(attempts) > 1:
+            return self._hedge(job, attempts, hedge_percentile, hedge_min_delay, hedge_default_delay)
+        return self._failover(job, attempts)
+
+    def _failover(self, job, attempts):
+        errors = []
+        emitted = False
+        for provider, open_stream in attempts:
+            job.check_cancelled()
+            restarted = not emitted
+            try:
+                for chunk in self.track(provider, open_stream()):
+                    if not restarted:
+                        yield provider, None
+                        restarted = True
+                    emitted = True
+                    yield provider, chunk
+                return
+            except JobCancelled:
+                raise
+            except Exception as e:
+                errors.append(str(e))
+        raise ProviderError("全部提供商", "；".join(errors) or "没有可用的提供商")
+
+    def _hedge(self, job, attempts, p, min_delay, default_delay):
+        results = queue.Queue()
+        stops = []
+
+        def run(index, provider, open_stream, stop):
+            chunks = None
+            try:
+                chunks = self.track(provider, open_stream())
+                for chunk in chunks:
+                    if stop.is_set() or job.cancelled:
+                        return
+                    results.put((index, "chunk", chunk))
+                results.put((index, "done", None))
+            except Exception as e:
+                results.put((index, "error", e))
+            finally:
+                if chunks is not None:
+                    chunks.close()
+
+        def launch():
+            index = len(stops)
+            provider, open_stream = attempts[index]
+            stop = threading.Event()
+            stops.append(stop)
+            threading.Thread(target=run, args=(index, provider, open_stream, stop),
+                             name=f"novel-hedge-{provider}", daemon=True).start()
+            # 当前这个请求的首字迟迟不到时再发下一个
+            return time.monotonic() + self.hedge_delay(provider, p, min_delay, default_delay)
+
+        winner = None
+        errors = []
+        running = 1
+        deadline = launch()
+        try:
+            while True:
+                job.check_cancelled()
+                try:
+                    index, kind, payload = results.get(timeout=0.05)
+                except queue.Empty:
+                    if winner is None and len(stops) < len(attempts) and time.monotonic() >= deadline:
+                        deadline = launch()
+                        running += 1
+                    continue
+                if winner is not None and index != winner:
+                    continue
+                provider = attempts[index][0]
+                if kind == "error":
+                    running -= 1
+                    errors.append(str(payload))
+                    if winner is not None:
+                        raise payload
+                    if len(stops) < len(attempts):
+                        deadline = launch()
+                        running += 1
+                    elif running == 0:
+                        raise ProviderError("全部提供商", "；".join(errors))
+                    continue
+                if winner is None:
+                    # 先到先得，其余请求停止
+                    winner = index
+                    for i, stop in enumerate(stops):
+                        if i != index:
+                            stop.set()
+                if kind == "done":
+                    return
+                yield provider, payload
+        finally:
+            for stop in stops:
+                stop.set()
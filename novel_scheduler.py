@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""请求调度
+
+所有提供商调用都经过这里：
+
+- 每个提供商两个令牌桶，分别限制每分钟请求数（rpm）和每分钟 token 数
+  （tpm，按提示词加最大输出估算），在提供商配置中设置，不设置则不限；
+- 收到 429 时按 Retry-After（没有时按指数退避）暂停该提供商的所有请求；
+- 429、5xx 和连接错误在收到首个片段之前自动重试，等待时间带随机抖动；
+- 两条优先级通道：同一提供商有交互请求在排队时，批量请求让行。
+"""
+import random
+import threading
+import time
+
+from novel_engine import JobCancelled
+from novel_providers import ProviderError
+
+INTERACTIVE = 0
+BATCH = 1
+
+
+class TokenBucket:
+    """每分钟补充 rate 个令牌的令牌桶，容量为一分钟的量"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """取 amount 个令牌还需等待的秒数；超过容量的请求等桶满即可"""
+        self._refill(now)
+        amount = min(amount, self.rate)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.rate)
+
+
+def is_retryable(error):
+    """限流、服务端错误和连接错误可以重试"""
+    if isinstance(error, ProviderError):
+        return error.status_code is not None and (error.status_code == 429 or error.status_code >= 500)
+    # requests 的连接和超时异常都继承自 OSError
+    return isinstance(error, OSError)
+
+
+class RequestScheduler:
+    """按提供商限流并按优先级排队，线程安全"""
+
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {}
+        self.blocked_until = {}
+        self.waiting = {}
+        self.stats = {"throttled": 0, "retries": 0, "rate_limited": 0}
+        self._cond = threading.Condition()
+
+    def _buckets(self, provider, provider_config):
+        """按配置取得 (rpm 桶, tpm 桶)，限额变化时重建"""
+        limits = (int(provider_config.get("rpm") or 0), int(provider_config.get("tpm") or 0))
+        cached = self.buckets.get(provider)
+        if cached is None or cached[0] != limits:
+            cached = (limits, TokenBucket(limits[0]) if limits[0] else None,
+                      TokenBucket(limits[1]) if limits[1] else None)
+            self.buckets[provider] = cached
+        return cached[1], cached[2]
+
+    def acquire(self, job, provider, provider_config, tokens, priority=INTERACTIVE):
+        """等到该提供商的限额允许发出请求，返回等待的秒数；批量请求排在交互请求之后"""
+        key = (provider, priority)
+        started = time.monotonic()
+        throttled = False
+        with self._cond:
+            self.waiting[key] = self.waiting.get(key, 0) + 1
+            try:
+                while True:
+                    if job.cancelled:
+                        raise JobCancelled()
+                    now = time.monotonic()
+                    wait = self.blocked_until.get(provider, 0) - now
+                    if priority == BATCH and self.waiting.get((provider, INTERACTIVE)):
+                        wait = max(wait, 0.05)
+                    rpm, tpm = self._buckets(provider, provider_config)
+                    if rpm:
+                        wait = max(wait, rpm.wait_time(1, now))
+                    if tpm:
+                        wait = max(wait, tpm.wait_time(tokens, now))
+                    if wait <= 0:
+                        if rpm:
+                            rpm.take(1)
+                        if tpm:
+                            tpm.take(tokens)
+                        return now - started
+                    if not throttled:
+                        throttled = True
+                        self.stats["throttled"] += 1
+                    # 分段等待，以便及时响应取消和优先级变化
+                    self._cond.wait(min(wait, 0.2))
+            finally:
+                self.waiting[key] -= 1
+                self._cond.notify_all()
+
+    def backoff(self, attempt, retry_after=None):
+        """第 attempt 次重试前的等待：优先 Retry-After，否则指数退避加随机抖动"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def rate_limited(self, provider, delay):
+        """收到 429：在 delay 秒内暂停该提供商的所有请求"""
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            self.blocked_until[provider] = max(self.blocked_until.get(provider, 0), time.monotonic() + delay)
+
+    def stream(self, job, provider, provider_config, open_stream, tokens, priority=INTERACTIVE, call=None):
+        """限流后打开流式请求并逐段产出；首个片段之前的可重试错误自动重试
+
+        Retry-After 超过 max_delay 时不再等待，直接抛出，交给路由或批量任务换用其他提供商；
+        429 在抛出之前同样暂停该提供商 Retry-After 秒。
+        call 为 CallRecord 时累加排队时间和重试次数。
+        """
+        attempt = 0
+        while True:
+            waited = self.acquire(job, provider, provider_config, tokens, priority)
+            if call is not None:
+                call.queue_time += waited
+            started = False
+            chunks = open_stream()
+            try:
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+                return
+            except (JobCancelled, GeneratorExit):
+                raise
+            except Exception as e:
+                if started or not is_retryable(e):
+                    raise
+                retry_after = getattr(e, "retry_after", None)
+                delay = self.backoff(attempt, retry_after)
+                if getattr(e, "status_code", None) == 429:
+                    # 不论是否重试都暂停该提供商，其他排队的请求（包括批量任务）不再立即撞上 429
+                    self.rate_limited(provider, retry_after or delay)
+                if attempt >= self.max_retries or (retry_after is not None and retry_after > self.max_delay):
+                    raise
+                with self._cond:
+                    self.stats["retries"] += 1
+                if call is not None:
+                    call.retries += 1
+                attempt += 1
+                job.sleep(delay)
+            finally:
+                chunks.close()
+
+    def summary(self):
+        """调度统计的简短描述"""
+        with self._cond:
+            stats = dict(self.stats)
+        return f"限流等待 {stats['throttled']} 次，429 {stats['rate_limited']} 次，重试 {stats['retries']} 次"
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""全文检索
+
+倒排索引覆盖所有项目的大纲、角色、世界观和章节。中日韩文字按相邻两字
+（bigram）切分，英文和数字按单词切分并转为小写；查询按 BM25 排序。
+项目修改或插入章节时只重新索引变化的那一篇文档。
+"""
+import math
+import operator
+import re
+import threading
+from collections import Counter
+
+TOKEN_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+|[A-Za-z0-9]+")
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """切分为检索词：中文相邻两字一组，单独一个汉字保留单字，英文单词转小写"""
+    tokens = []
+    for run in TOKEN_RUN.findall(text):
+        if run[0] < "\u0080":
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(map(operator.add, run, run[1:]))
+    return tokens
+
+
+def make_snippet(text, query, width=30):
+    """截取命中位置前后的文字，找不到整个查询时退而使用第一个检索词"""
+    lowered = text.lower()
+    position = lowered.find(query.lower())
+    length = len(query)
+    if position < 0:
+        for token in tokenize(query):
+            position = lowered.find(token)
+            if position >= 0:
+                length = len(token)
+                break
+    if position < 0:
+        return text[:width * 2].replace("\n", " ")
+    start = max(0, position - width)
+    end = min(len(text), position + length + width)
+    snippet = text[start:end].replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class SearchIndex:
+    """内存中的倒排索引，线程安全
+
+    文档键为 (项目 id, 字段, 章节编号)，字段为 outline/characters/setting 时
+    章节编号为 None。build() 之前的 update() 会被忽略，构建时读取的就是最新内容。
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_tokens = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.ready = False
+        self._building = False
+        self._touched = set()
+        self._removed_projects = set()
+        self._lock = threading.Lock()
+
+    def _add(self, doc, counts):
+        postings = self.postings
+        for token, tf in counts.items():
+            posting = postings.get(token)
+            if posting is None:
+                postings[token] = {doc: tf}
+            else:
+                posting[doc] = tf
+        self.doc_tokens[doc] = tuple(counts)
+        length = sum(counts.values())
+        self.doc_lengths[doc] = length
+        self.total_length += length
+
+    def _remove(self, doc):
+        for token in self.doc_tokens.pop(doc, ()):
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(doc, None)
+                if not posting:
+                    del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(doc, 0)
+
+    def build(self, docs):
+        """从 [(文档键, 文本)] 构建索引；构建期间的修改优先于构建时读到的内容"""
+        with self._lock:
+            self._building = True
+            self._touched = set()
+            self._removed_projects = set()
+        tokenized = [(doc, Counter(tokenize(text))) for doc, text in docs]
+        with self._lock:
+            for doc, counts in tokenized:
+                if doc in self._touched or doc[0] in self._removed_projects:
+                    continue
+                self._remove(doc)
+                self._add(doc, counts)
+            self._building = False
+            self.ready = True
+
+    def update(self, doc, text):
+        """重新索引一篇文档"""
+        if not self.ready and not self._building:
+            return
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc)
+            if counts:
+                self._add(doc, counts)
+            self._touched.add(doc)
+
+    def remove_project(self, project_id):
+        """删除项目的所有文档"""
+        with self._lock:
+            for doc in [d for d in self.doc_tokens if d[0] == project_id]:
+                self._remove(doc)
+            self._removed_projects.add(project_id)
+
+    def _expand(self, token):
+        # 单个汉字展开为包含它的所有两字词
+        if len(token) == 1 and token >= "\u3040":
+            return [t for t in self.postings if token in t and len(t) <= 2]
+        return [token]
+
+    def search(self, query, limit=20, project_id=None):
+        """返回按 BM25 得分排序的 [(得分, 文档键)]
+
+        优先返回包含全部检索词的文档，没有时返回包含任一检索词的文档。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            doc_count = len(self.doc_lengths)
+            if not doc_count:
+                return []
+            average_length = self.total_length / doc_count
+            # 每个检索词对应的 {文档: 词频}（单字展开后合并）
+            term_postings = []
+            for term in terms:
+                merged = {}
+                for token in self._expand(term):
+                    for doc, tf in self.postings.get(token, {}).items():
+                        merged[doc] = merged.get(doc, 0) + tf
+                term_postings.append(merged)
+
+            ordered = sorted(term_postings, key=len)
+            candidates = set(ordered[0])
+            for posting in ordered[1:]:
+                candidates.intersection_update(posting)
+            if not candidates:
+                candidates = set().union(*term_postings)
+            if project_id is not None:
+                candidates = {doc for doc in candidates if doc[0] == project_id}
+
+            scores = dict.fromkeys(candidates, 0.0)
+            for posting in term_postings:
+                if not posting:
+                    continue
+                idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc in candidates:
+                    tf = posting.get(doc)
+                    if tf:
+                        norm = K1 * (1 - B + B * self.doc_lengths[doc] / average_length)
+                        scores[doc] += idf * tf * (K1 + 1) / (tf + norm)
+        ranked = sorted(((score, doc) for doc, score in scores.items()), key=lambda item: -item[0])
+        return ranked[:limit]
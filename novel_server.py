@@ -0,0 +1,622 @@
+# -*- coding: utf-8 -*-
+"""服务器模式
+
+一个进程持有 NovelCore（项目存储、调度器、缓存、路由和指标），通过本地
+HTTP 接口供多个写作者共用：API 密钥和限流配额只配置一次，相同请求的缓存
+对所有人生效。图形界面用 novel_remote.RemoteCore 连接即成为瘦客户端：
+
+    python novel_cli.py --token 口令 serve --port 8765
+    python novel_cli.py --remote http://127.0.0.1:8765 --token 口令
+
+生成、批量和导出任务写入持久化队列（novel_jobs，项目目录下的 jobs.sqlite），
+由调度线程按 max_jobs 并发取出交给生成引擎执行；服务器重启后排队中和执行
+到一半的任务继续执行，生成和批量任务从断点（novel_checkpoint，id 为
+server-<任务编号>）继续，已完成的章节不会重新生成。任务的事件（chunk、provider、chapter_done 等）以 SSE
+推送，客户端断线后可以用 after（或 Last-Event-ID）从断点继续接收。
+
+接口（JSON，错误返回 {"error"}，400 参数错误，404 不存在）：
+
+    GET    /api/status                       配置（密钥打码）、提供商健康状况、缓存和队列统计
+    PUT    /api/config                       修改提供商配置、当前提供商和路由策略
+    POST   /api/providers/<提供商>/test      测试连接
+    POST   /api/cache/clear                  清空生成缓存
+    GET    /api/metrics[?format=jsonl|prom]  调用指标
+    GET    /api/projects                     项目列表（含设定字段和章节编号）
+    POST   /api/projects                     新建项目
+    PUT    /api/projects/<id>                保存项目字段
+    DELETE /api/projects/<id>                删除项目
+    GET    /api/projects/<id>/chapters/<n>   章节正文
+    POST   /api/projects/<id>/chapters       追加章节 {"content"}
+    GET    /api/projects/<id>/headings?numbers=1,2,3
+    GET    /api/projects/<id>/history?target=outline|3[&revision=&diff=&against=]
+    POST   /api/projects/<id>/history/restore {"target", "revision"}
+    GET    /api/projects/<id>/entities       人物与设定条目的出现情况和矛盾
+    GET    /api/projects/<id>/exports/<文件名> 下载导出任务生成的文件（二进制）
+    GET    /api/search?q=&limit=&project=
+    GET    /api/jobs[?owner=&status=]        最近的任务
+    POST   /api/jobs                         {"kind": prompt|generate|batch|export, "params": {...}}
+                                             导出任务的 path 是文件名，写入项目目录下的 exports/
+    GET    /api/jobs/<id>                    任务状态和结果
+    GET    /api/jobs/<id>/events[?after=N]   任务事件（SSE），以 end 事件结束
+    POST   /api/jobs/<id>/cancel             取消任务
+
+提供商调用受网络延迟限制而不是 CPU，任务在同一进程的线程中执行，这样所有
+任务共用一个调度器和缓存，项目存储也只有一个写入者。
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from novel_jobs import FINISHED, JobQueue, job_priority
+
+MASK = "******"
+# 结束的任务在内存中保留事件的时间（秒），之后只能取得结果
+LIVE_RETENTION = 300
+PROJECT_FIELDS = ("title", "author", "genre", "outline", "characters", "setting")
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LiveJob:
+    """任务的事件列表，SSE 订阅者可以从任意位置开始读取"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.events = []
+        self.end = None
+        self.finished_at = None
+        self.engine_job = None
+        self.runner = None
+        self.cancel_requested = False
+        self._cond = threading.Condition()
+
+    def add(self, name, payload):
+        with self._cond:
+            self.events.append((name, payload))
+            self._cond.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self._cond:
+            self.end = {"status": status, "result": result, "error": error}
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    def wait(self, after, timeout):
+        """等待第 after 个之后的事件，返回 (新事件, 结束信息)"""
+        with self._cond:
+            if len(self.events) <= after and self.end is None:
+                self._cond.wait(timeout)
+            return self.events[after:], self.end
+
+
+class NovelServer:
+    """HTTP 接口、持久化任务队列和调度线程"""
+
+    def __init__(self, core, host="127.0.0.1", port=8765, token=None, max_jobs=4):
+        self.core = core
+        self.token = token
+        self.max_jobs = max_jobs
+        self.queue = JobQueue(os.path.join(core.store.root, "jobs.sqlite"))
+        # 上次退出时执行到一半的任务重新排队
+        self.recovered = self.queue.recover()
+        self.live = {}
+        self.running = set()
+        # 修改项目的接口与界面一样串行执行
+        self.lock = threading.RLock()
+        self._live_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.httpd = ServerHTTP((host, port), ApiHandler)
+        self.httpd.app = self
+        self._threads = []
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        for target, name in ((self.httpd.serve_forever, "novel-server-http"), (self._dispatch, "novel-server-jobs")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """停止接收请求，取消执行中的任务（下次启动时重新执行）"""
+        self._stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for thread in self._threads:
+            thread.join()
+        self.queue.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- 任务 ----
+
+    def live_job(self, job_id):
+        """任务的 LiveJob；已结束且超过保留时间的任务返回 None"""
+        with self._live_lock:
+            live = self.live.get(job_id)
+            if live is None:
+                job = self.queue.get(job_id)
+                if job is None:
+                    raise ApiError(404, f"任务不存在: {job_id}")
+                if job["status"] in FINISHED:
+                    return None
+                live = self.live[job_id] = LiveJob(job_id)
+            return live
+
+    def project(self, project_id):
+        project = self.core.find_project(project_id)
+        if project is None:
+            raise ApiError(404, f"项目不存在: {project_id}")
+        return project
+
+    def export_path(self, project, name, create=True):
+        """导出文件在服务器上的位置：项目目录下 exports/ 中的 name，只接受不含目录的文件名"""
+        if not name or os.path.isabs(name) or name in (".", "..") or "/" in name or "\\" in name:
+            raise ApiError(400, f"导出文件名无效: {name}")
+        directory = os.path.realpath(os.path.join(self.core.store.project_dir(project["id"]), "exports"))
+        path = os.path.realpath(os.path.join(directory, name))
+        if os.path.dirname(path) != directory:
+            raise ApiError(400, f"导出文件名无效: {name}")
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return path
+
+    def prepare(self, kind, params, checkpoint_id=None):
+        """校验参数，返回 (函数, 参数, 关键字参数, BatchRunner 或 None)
+
+        checkpoint_id 为生成和批量任务的断点，断点存在时从断点继续。
+        """
+        core = self.core
+        use_cache = bool(params.get("use_cache", True))
+        try:
+            if kind == "prompt":
+                return core.generate_prompt, (params["theme"], params["prompt_type"]), {"use_cache": use_cache}, None
+            project = self.project(params["project"])
+            options = (params.get("style", "文学性"), params.get("length", "中等"), params.get("custom_prompt", ""))
+            if kind == "generate":
+                return (core.generate_content, (project, params["gen_type"], *options),
+                        {"use_cache": use_cache, "checkpoint_id": checkpoint_id}, None)
+            if kind == "batch":
+                runner = core.create_batch(project, int(params["start"]), int(params["end"]),
+                                           bool(params.get("overwrite")), *options, checkpoint_id=checkpoint_id)
+                return runner.run, (), {}, runner
+            if kind == "export":
+                return (core.export_project, (project, self.export_path(project, params["path"])),
+                        {"fmt": params.get("format"), "include_settings": params.get("include_settings", True),
+                         "incremental": params.get("incremental", True)}, None)
+        except KeyError as e:
+            raise ApiError(400, f"缺少参数: {e.args[0]}") from None
+        raise ApiError(400, f"未知的任务类型: {kind}")
+
+    def submit(self, kind, params, owner=""):
+        """校验后排队，返回任务；批量任务附带将要生成的章节和参与的提供商"""
+        with self.lock:
+            try:
+                _, _, _, runner = self.prepare(kind, params)
+            except ValueError as e:
+                raise ApiError(400, str(e)) from None
+            job = self.queue.submit(kind, params, owner, job_priority(kind))
+        with self._live_lock:
+            # 调度线程可能已经取出了这个任务
+            self.live.setdefault(job["id"], LiveJob(job["id"]))
+        if runner is not None:
+            job["chapters"] = [chapter["number"] for chapter in runner.chapters]
+            job["providers"] = list(runner.providers)
+        return job
+
+    def cancel(self, job_id):
+        status = self.queue.cancel(job_id)
+        if status is None:
+            raise ApiError(404, f"任务不存在: {job_id}")
+        with self._live_lock:
+            live = self.live.get(job_id)
+        if live is not None:
+            live.cancel_requested = True
+            if status == "cancelled" and live.end is None:
+                live.finish("cancelled")
+            elif live.engine_job is not None:
+                live.engine_job.cancel()
+        return status
+
+    def _dispatch(self):
+        """调度线程：分发引擎回调，按并发上限从队列取出任务"""
+        while not self._stopped.is_set():
+            self.core.engine.poll(timeout=0.1)
+            while len(self.running) < self.max_jobs:
+                job = self.queue.claim()
+                if job is None:
+                    break
+                self._start(job)
+            self._prune()
+        for job_id in list(self.running):
+            live = self.live.get(job_id)
+            if live is not None and live.engine_job is not None:
+                live.engine_job.cancel(suspend=True)
+
+    @staticmethod
+    def checkpoint_id(job_id):
+        return f"server-{job_id}"
+
+    def _start(self, job):
+        job_id = job["id"]
+        with self._live_lock:
+            live = self.live.setdefault(job_id, LiveJob(job_id))
+        try:
+            with self.lock:
+                func, args, kwargs, runner = self.prepare(job["kind"], job["params"], self.checkpoint_id(job_id))
+        except (ApiError, ValueError) as e:
+            self._finished(live, "failed", error=str(e))
+            return
+        live.runner = runner
+        if runner is not None:
+            project = self.project(job["params"]["project"])
+
+            def on_event(name, payload):
+                # 与界面一样，完成的章节放入内存中的项目
+                if name == "chapter_done":
+                    number, text, summary = payload
+                    with self.lock:
+                        project["chapters"][number] = text
+                        project["summaries"][number] = summary
+                live.add(name, payload)
+        else:
+            on_event = live.add
+
+        def on_cancel():
+            self._finished(live, "cancelled", runner.snapshot() if runner is not None else None)
+
+        self.running.add(job_id)
+        live.engine_job = self.core.engine.submit(
+            job["kind"], func, *args, on_event=on_event,
+            on_done=lambda result: self._finished(live, "done", result),
+            on_error=lambda error: self._finished(live, "failed", error=str(error)),
+            on_cancel=on_cancel, **kwargs)
+        # 取出任务与提交引擎之间收到的取消请求
+        if live.cancel_requested:
+            live.engine_job.cancel()
+
+    def _finished(self, live, status, result=None, error=None):
+        if self._stopped.is_set() and status == "cancelled":
+            # 服务器停止导致的取消：保持 running，下次启动时重新排队
+            return
+        self.running.discard(live.job_id)
+        self.queue.finish(live.job_id, status, result, error)
+        # 结束的任务不会再执行，失败任务保留的断点也不再需要
+        self.core.checkpoints.remove(self.checkpoint_id(live.job_id))
+        live.finish(status, result, error)
+
+    def _prune(self):
+        now = time.monotonic()
+        with self._live_lock:
+            for job_id in [job_id for job_id, live in self.live.items()
+                           if live.finished_at is not None and now - live.finished_at > LIVE_RETENTION]:
+                del self.live[job_id]
+
+    # ---- 接口 ----
+
+    def public_config(self):
+        """提供商配置，密钥打码"""
+        config = self.core.config
+        providers = {}
+        for name, cfg in config["api_providers"].items():
+            providers[name] = dict(cfg, api_key=MASK if cfg.get("api_key") else "")
+        return {"api_providers": providers, "current_provider": config["current_provider"],
+                "routing": dict(config.get("routing", {}))}
+
+    @staticmethod
+    def project_json(project):
+        data = {field: project.get(field, "") for field in PROJECT_FIELDS}
+        data["id"] = project["id"]
+        data["chapters"] = list(project["chapters"])
+        return data
+
+    @staticmethod
+    def history_target(value):
+        if value is None:
+            raise ApiError(400, "缺少参数: target")
+        return int(value) if value.isdigit() else value
+
+    def api_status(self, query, body):
+        return {"config": self.public_config(), "health": self.core.health_summary(),
+                "cache": self.core.cache.summary(), "jobs": self.queue.counts(), "recovered": self.recovered}
+
+    def api_update_config(self, query, body):
+        with self.lock:
+            config = self.core.config
+            for name, cfg in body.get("api_providers", {}).items():
+                target = config["api_providers"].setdefault(name, {})
+                for key, value in cfg.items():
+                    # 客户端拿到的是打码的密钥，原样送回表示不修改
+                    if key == "api_key" and value == MASK:
+                        continue
+                    target[key] = value
+            if body.get("current_provider") in config["api_providers"]:
+                config["current_provider"] = body["current_provider"]
+            if "routing" in body:
+                config.setdefault("routing", {}).update(body["routing"])
+            self.core.save_config()
+        return self.public_config()
+
+    def api_test_provider(self, query, body, provider):
+        if provider not in self.core.config["api_providers"]:
+            raise ApiError(404, f"提供商不存在: {provider}")
+        provider, provider_config = self.core.provider_config(provider)
+        return list(self.core.test_connection(None, provider, provider_config))
+
+    def api_clear_cache(self, query, body):
+        self.core.cache.clear()
+        return {"cache": self.core.cache.summary()}
+
+    def api_metrics(self, query, body):
+        fmt = query.get("format")
+        if fmt == "jsonl":
+            return {"text": self.core.metrics.to_jsonl()}
+        if fmt == "prom":
+            return {"text": self.core.metrics.to_prometheus()}
+        return self.core.metrics.snapshot()
+
+    def api_list_projects(self, query, body):
+        with self.lock:
+            return [self.project_json(project) for project in self.core.projects]
+
+    def api_create_project(self, query, body):
+        with self.lock:
+            data = {field: body.get(field, "") for field in PROJECT_FIELDS}
+            if not data["title"]:
+                raise ApiError(400, "缺少项目标题")
+            return self.project_json(self.core.save_project(data))
+
+    def api_save_project(self, query, body, project_id):
+        with self.lock:
+            project = self.project(project_id)
+            data = {field: body.get(field, project.get(field, "")) for field in PROJECT_FIELDS}
+            return self.project_json(self.core.save_project(data, project, source=body.get("source", "保存")))
+
+    def api_delete_project(self, query, body, project_id):
+        with self.lock:
+            self.core.delete_project(self.project(project_id))
+        return {}
+
+    def api_chapter(self, query, body, project_id, number):
+        project = self.project(project_id)
+        if int(number) not in project["chapters"]:
+            raise ApiError(404, f"章节不存在: {number}")
+        return {"text": project["chapters"][int(number)]}
+
+    def api_add_chapter(self, query, body, project_id):
+        with self.lock:
+            return {"number": self.core.add_chapter(self.project(project_id), body["content"])}
+
+    def api_headings(self, query, body, project_id):
+        project = self.project(project_id)
+        numbers = [int(n) for n in query.get("numbers", "").split(",") if n.isdigit()]
+        return {str(n): self.core.chapter_heading(project, n) for n in numbers if n in project["chapters"]}
+
+    def api_history(self, query, body, project_id):
+        project = self.project(project_id)
+        target = self.history_target(query.get("target"))
+        try:
+            if query.get("diff"):
+                return {"lines": self.core.history_diff(project, target, query["diff"], query.get("against"))}
+            if query.get("revision"):
+                return {"text": self.core.history_text(project, target, query["revision"])}
+            return self.core.history(project, target)
+        except KeyError as e:
+            raise ApiError(404, f"没有这个修订: {e.args[0]}") from None
+
+    def api_restore(self, query, body, project_id):
+        with self.lock:
+            project = self.project(project_id)
+            target = self.history_target(str(body.get("target")))
+            try:
+                return {"text": self.core.restore_revision(project, target, body["revision"])}
+            except KeyError as e:
+                raise ApiError(404, f"没有这个修订: {e.args[0]}") from None
+
+    def api_entities(self, query, body, project_id):
+        return self.core.entity_report(self.project(project_id))
+
+    def api_search(self, query, body):
+        return self.core.search(query.get("q", ""), int(query.get("limit", 20)), query.get("project") or None)
+
+    def api_list_jobs(self, query, body):
+        return self.queue.list(query.get("owner"), query.get("status"), int(query.get("limit", 50)))
+
+    def api_submit_job(self, query, body, owner=""):
+        return self.submit(body.get("kind"), body.get("params") or {}, owner)
+
+    def api_get_job(self, query, body, job_id):
+        job = self.queue.get(int(job_id))
+        if job is None:
+            raise ApiError(404, f"任务不存在: {job_id}")
+        return job
+
+    def api_cancel_job(self, query, body, job_id):
+        return {"status": self.cancel(int(job_id))}
+
+    def api_export_file(self, query, body, project_id, name):
+        """导出文件的路径，由 ApiHandler 发送文件内容"""
+        path = self.export_path(self.project(project_id), unquote(name), create=False)
+        if not os.path.isfile(path):
+            raise ApiError(404, f"导出文件不存在: {unquote(name)}")
+        return path
+
+
+ROUTES = [
+    ("GET", r"/api/status", "status"),
+    ("PUT", r"/api/config", "update_config"),
+    ("POST", r"/api/providers/([^/]+)/test", "test_provider"),
+    ("POST", r"/api/cache/clear", "clear_cache"),
+    ("GET", r"/api/metrics", "metrics"),
+    ("GET", r"/api/projects", "list_projects"),
+    ("POST", r"/api/projects", "create_project"),
+    ("PUT", r"/api/projects/([^/]+)", "save_project"),
+    ("DELETE", r"/api/projects/([^/]+)", "delete_project"),
+    ("GET", r"/api/projects/([^/]+)/chapters/(\d+)", "chapter"),
+    ("POST", r"/api/projects/([^/]+)/chapters", "add_chapter"),
+    ("GET", r"/api/projects/([^/]+)/headings", "headings"),
+    ("GET", r"/api/projects/([^/]+)/history", "history"),
+    ("POST", r"/api/projects/([^/]+)/history/restore", "restore"),
+    ("GET", r"/api/projects/([^/]+)/entities", "entities"),
+    ("GET", r"/api/projects/([^/]+)/exports/([^/]+)", "export_file"),
+    ("GET", r"/api/search", "search"),
+    ("GET", r"/api/jobs", "list_jobs"),
+    ("POST", r"/api/jobs", "submit_job"),
+    ("GET", r"/api/jobs/(\d+)", "get_job"),
+    ("GET", r"/api/jobs/(\d+)/events", "job_events"),
+    ("POST", r"/api/jobs/(\d+)/cancel", "cancel_job"),
+]
+ROUTES = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+
+
+class ServerHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_api("GET")
+
+    def do_POST(self):
+        self.handle_api("POST")
+
+    def do_PUT(self):
+        self.handle_api("PUT")
+
+    def do_DELETE(self):
+        self.handle_api("DELETE")
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_api(self, method):
+        app = self.server.app
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if app.token and self.headers.get("Authorization") != f"Bearer {app.token}":
+            self.send_json(401, {"error": "口令错误"})
+            return
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                break
+        else:
+            self.send_json(404, {"error": f"没有这个接口: {method} {url.path}"})
+            return
+        try:
+            body = json.loads(raw) if raw else {}
+            if name == "job_events":
+                self.send_events(int(match.group(1)), int(query.get("after") or self.headers.get("Last-Event-ID") or 0))
+                return
+            kwargs = {"owner": self.headers.get("X-Novel-User", "")} if name == "submit_job" else {}
+            result = getattr(app, f"api_{name}")(query, body, *match.groups(), **kwargs)
+        except ApiError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except KeyError as e:
+            self.send_json(400, {"error": f"缺少参数: {e.args[0]}"})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            if name == "export_file":
+                self.send_file(result)
+            else:
+                self.send_json(200, result)
+
+    def send_file(self, path):
+        """分块发送文件内容"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        try:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def send_events(self, job_id, after):
+        """以 SSE 推送任务事件，没有新事件时每 0.5 秒发送一次注释保持连接"""
+        app = self.server.app
+        live = app.live_job(job_id)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            if live is None:
+                job = app.queue.get(job_id)
+                self.write_event(after, "end", {"status": job["status"], "result": job["result"],
+                                                "error": job["error"]})
+                return
+            while True:
+                events, end = live.wait(after, 0.5)
+                for name, payload in events:
+                    after += 1
+                    self.write_event(after, name, payload)
+                if end is not None and not events:
+                    self.write_event(after, "end", end)
+                    return
+                if not events:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开，任务继续执行，之后可以重新订阅
+            pass
+
+    def write_event(self, event_id, name, payload):
+        data = json.dumps(payload, ensure_ascii=False)
+        self.wfile.write(f"id: {event_id}\nevent: {name}\ndata: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def serve(core, host="127.0.0.1", port=8765, token=None, max_jobs=4):
+    """前台运行服务器，Ctrl+C 停止"""
+    server = NovelServer(core, host, port, token, max_jobs).start()
+    print(f"服务器已启动: {server.url}", file=sys.stderr)
+    if server.recovered:
+        print(f"重新执行上次未完成的 {server.recovered} 个任务", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+"""小说项目存储
+
+每个项目一个目录，API 设置仍保存在 novel_creator_config.json 中：
+
+    novel_projects/
+        manifest.json           项目列表（id 与标题，决定显示顺序）
+        <id>/meta.json          标题、作者、类型
+        <id>/outline.txt        大纲
+        <id>/characters.txt     角色
+        <id>/setting.txt        世界观
+        <id>/chapters/000001.txt  每章一个文件
+        <id>/summaries/000001.txt 每章的摘要（插入章节时计算）
+        <id>/templates.txt      项目自己的提示词模板（可选，见 novel_templates）
+        <id>/history/           设定字段和章节的修改历史（见 novel_history）
+
+保存时只写入发生变化的文件，追加章节只新建一个文件。所有文件都先写入
+临时文件再原子替换。界面的修改经由 StoreWriter 先追加到 journal.log，
+再由后台线程合并写入，启动时重放日志中尚未落盘的修改。
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from novel_history import VersionHistory
+
+META_FIELDS = ("title", "author", "genre")
+TEXT_FIELDS = ("outline", "characters", "setting")
+
+
+def write_text(path, text):
+    """原子写入文本文件：先写同目录下的临时文件，fsync 后再替换
+
+    写到一半崩溃时原文件保持不变。
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_text(path, default=""):
+    """读取文本文件，不存在时返回默认值"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return default
+
+
+class LazyTexts(MutableMapping):
+    """按编号延迟读取的文本集合（章节或摘要），线程安全
+
+    只在打开时读取编号列表，正文在第一次访问时才从磁盘读取，最近读取的
+    cache_size 篇保留在内存中。写入的内容一直保留在内存中，后台写入器
+    落盘之前也能读到。
+    """
+
+    def __init__(self, numbers, load, cache_size=16):
+        self._numbers = set(numbers)
+        self._load = load
+        self._cache = OrderedDict()
+        self._written = {}
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def peek(self, number):
+        """已在内存中的文本，不读取磁盘"""
+        with self._lock:
+            if number in self._written:
+                return self._written[number]
+            return self._cache.get(number)
+
+    def __getitem__(self, number):
+        with self._lock:
+            if number not in self._numbers:
+                raise KeyError(number)
+            if number in self._written:
+                return self._written[number]
+            if number in self._cache:
+                self._cache.move_to_end(number)
+                return self._cache[number]
+        text = self._load(number)
+        if text is None:
+            raise KeyError(number)
+        with self._lock:
+            self._cache[number] = text
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return text
+
+    def __setitem__(self, number, text):
+        with self._lock:
+            self._numbers.add(number)
+            self._written[number] = text
+            self._cache.pop(number, None)
+
+    def __delitem__(self, number):
+        with self._lock:
+            self._numbers.remove(number)
+            self._written.pop(number, None)
+            self._cache.pop(number, None)
+
+    def __contains__(self, number):
+        with self._lock:
+            return number in self._numbers
+
+    def __iter__(self):
+        with self._lock:
+            return iter(sorted(self._numbers))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._numbers)
+
+
+class ProjectStore:
+    """按项目分目录的存储"""
+
+    def __init__(self, root="novel_projects"):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        # 已写入磁盘的内容，用于判断哪些部分需要重写
+        self._written = {}
+        self._next_chapter = {}
+        self._histories = {}
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"version": 1, "projects": []}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        write_text(self.manifest_path, json.dumps(self.manifest, ensure_ascii=False, indent=2))
+
+    def project_dir(self, project_id):
+        return os.path.join(self.root, project_id)
+
+    def chapter_dir(self, project_id):
+        return os.path.join(self.root, project_id, "chapters")
+
+    def chapter_path(self, project_id, number):
+        return os.path.join(self.chapter_dir(project_id), f"{number:06d}.txt")
+
+    def summary_path(self, project_id, number):
+        return os.path.join(self.root, project_id, "summaries", f"{number:06d}.txt")
+
+    def template_path(self, project_id):
+        return os.path.join(self.root, project_id, "templates.txt")
+
+    def history(self, project_id):
+        """项目的版本历史"""
+        with self._lock:
+            history = self._histories.get(project_id)
+            if history is None:
+                history = VersionHistory(os.path.join(self.project_dir(project_id), "history"))
+                self._histories[project_id] = history
+            return history
+
+    @staticmethod
+    def chapter_target(number):
+        """章节在版本历史中的名称"""
+        return f"chapter-{number:06d}"
+
+    # ---- 项目 ----
+
+    def list_projects(self):
+        """返回 [{"id", "title"}]，按显示顺序"""
+        with self._lock:
+            return [dict(entry) for entry in self.manifest["projects"]]
+
+    def load_project(self, project_id):
+        """读取项目字段；chapters 和 summaries 为按编号延迟读取的 LazyTexts"""
+        with self._lock:
+            project_dir = self.project_dir(project_id)
+            with open(os.path.join(project_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            project = {"id": project_id}
+            for field in META_FIELDS:
+                project[field] = meta.get(field, "")
+            for field in TEXT_FIELDS:
+                project[field] = read_text(os.path.join(project_dir, f"{field}.txt"))
+            self._written[project_id] = dict(project)
+            project["chapters"], project["summaries"] = self.lazy_texts(project_id)
+            return project
+
+    def lazy_texts(self, project_id):
+        """项目的 (章节, 摘要) 延迟读取集合"""
+        chapters = LazyTexts(self.chapter_numbers(project_id), lambda n: self.load_chapter(project_id, n))
+        summaries = LazyTexts(self._numbers(os.path.join(self.project_dir(project_id), "summaries")),
+                              lambda n: self.load_summary(project_id, n), cache_size=256)
+        return chapters, summaries
+
+    @staticmethod
+    def new_project_id():
+        """分配新的项目 id"""
+        return uuid.uuid4().hex[:12]
+
+    def has_project(self, project_id):
+        with self._lock:
+            return any(entry["id"] == project_id for entry in self.manifest["projects"])
+
+    def create_project(self, data, project_id=None):
+        """新建项目，返回项目 id"""
+        with self._lock:
+            project_id = project_id or self.new_project_id()
+            os.makedirs(self.chapter_dir(project_id), exist_ok=True)
+            self._written[project_id] = {"id": project_id}
+            self.manifest["projects"].append({"id": project_id, "title": data.get("title", "")})
+            self.save_project(project_id, data)
+            self._save_manifest()
+            return project_id
+
+    def save_project(self, project_id, data, source="保存"):
+        """保存项目字段，只重写有变化的文件；返回写入的字段列表
+
+        有变化的大纲、角色和世界观记入版本历史，source 为修改来源。
+        """
+        with self._lock:
+            project_dir = self.project_dir(project_id)
+            written = self._written.setdefault(project_id, {"id": project_id})
+            changed = []
+
+            meta = {field: data.get(field, "") for field in META_FIELDS}
+            if any(written.get(field) != meta[field] for field in META_FIELDS):
+                write_text(os.path.join(project_dir, "meta.json"), json.dumps(meta, ensure_ascii=False, indent=2))
+                changed.append("meta")
+            for field in TEXT_FIELDS:
+                value = data.get(field, "")
+                if written.get(field) != value:
+                    write_text(os.path.join(project_dir, f"{field}.txt"), value)
+                    self.history(project_id).record(field, value, source, written.get(field))
+                    changed.append(field)
+            written.update(meta)
+            written.update({field: data.get(field, "") for field in TEXT_FIELDS})
+
+            # 标题变化时才更新清单
+            for entry in self.manifest["projects"]:
+                if entry["id"] == project_id and entry["title"] != meta["title"]:
+                    entry["title"] = meta["title"]
+                    self._save_manifest()
+            return changed
+
+    def delete_project(self, project_id):
+        """删除项目目录"""
+        with self._lock:
+            self.manifest["projects"] = [p for p in self.manifest["projects"] if p["id"] != project_id]
+            self._save_manifest()
+            self._written.pop(project_id, None)
+            self._next_chapter.pop(project_id, None)
+            self._histories.pop(project_id, None)
+            shutil.rmtree(self.project_dir(project_id), ignore_errors=True)
+
+    # ---- 章节 ----
+
+    @staticmethod
+    def _numbers(directory):
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-4]) for name in names if name.endswith(".txt") and name[:-4].isdigit())
+
+    def chapter_numbers(self, project_id):
+        """已有章节的编号（升序）"""
+        return self._numbers(self.chapter_dir(project_id))
+
+    def load_chapter(self, project_id, number):
+        """读取单个章节"""
+        return read_text(self.chapter_path(project_id, number))
+
+    def chapter_heading(self, project_id, number, limit=200):
+        """章节第一行（通常是标题），只读取文件开头"""
+        try:
+            with open(self.chapter_path(project_id, number), "r", encoding="utf-8") as f:
+                return f.readline(limit).strip()
+        except FileNotFoundError:
+            return ""
+
+    def load_summary(self, project_id, number):
+        """读取章节摘要，没有摘要时返回 None"""
+        return read_text(self.summary_path(project_id, number), None)
+
+    def put_summary(self, project_id, number, summary):
+        """写入章节摘要"""
+        path = self.summary_path(project_id, number)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_text(path, summary)
+
+    def put_chapter(self, project_id, number, content, summary=None, source="写入"):
+        """写入（或覆盖）指定编号的章节并记入版本历史，summary 为 None 时删除旧摘要"""
+        with self._lock:
+            os.makedirs(self.chapter_dir(project_id), exist_ok=True)
+            path = self.chapter_path(project_id, number)
+            history = self.history(project_id)
+            target = self.chapter_target(number)
+            # 没有历史的旧章节先把覆盖前的内容记为第一个修订
+            previous = read_text(path, None) if not history.revisions(target) else None
+            write_text(path, content)
+            history.record(target, content, source, previous)
+            if summary is not None:
+                self.put_summary(project_id, number, summary)
+            else:
+                try:
+                    os.remove(self.summary_path(project_id, number))
+                except FileNotFoundError:
+                    pass
+            if project_id in self._next_chapter and number >= self._next_chapter[project_id]:
+                self._next_chapter[project_id] = number + 1
+
+    def _ensure_next_chapter(self, project_id):
+        if project_id not in self._next_chapter:
+            numbers = self.chapter_numbers(project_id)
+            self._next_chapter[project_id] = numbers[-1] + 1 if numbers else 1
+
+    def reserve_chapter(self, project_id):
+        """分配下一个章节编号（不写文件）"""
+        with self._lock:
+            self._ensure_next_chapter(project_id)
+            number = self._next_chapter[project_id]
+            self._next_chapter[project_id] = number + 1
+            return number
+
+    def claim_chapter(self, project_id, number):
+        """登记即将写入的章节编号，之后 reserve_chapter 只会分配更大的编号"""
+        with self._lock:
+            self._ensure_next_chapter(project_id)
+            if number >= self._next_chapter[project_id]:
+                self._next_chapter[project_id] = number + 1
+
+    def append_chapter(self, project_id, content):
+        """在末尾追加章节，只新建一个文件；返回章节编号"""
+        with self._lock:
+            number = self.reserve_chapter(project_id)
+            self.put_chapter(project_id, number, content)
+            return number
+
+    # ---- 日志操作 ----
+
+    def apply(self, op):
+        """执行一条日志操作，重复执行结果相同"""
+        kind = op["op"]
+        with self._lock:
+            if kind == "save_project":
+                if self.has_project(op["id"]):
+                    self.save_project(op["id"], op["data"], op.get("source", "保存"))
+                else:
+                    self.create_project(op["data"], op["id"])
+            elif kind == "put_chapter":
+                self.put_chapter(op["id"], op["number"], op["content"], op.get("summary"), op.get("source", "写入"))
+            elif kind == "put_summary":
+                self.put_summary(op["id"], op["number"], op["summary"])
+            elif kind == "delete_project":
+                self.delete_project(op["id"])
+            else:
+                raise ValueError(f"未知的日志操作: {kind}")
+
+    # ---- 迁移 ----
+
+    def import_legacy(self, projects):
+        """导入旧版配置文件中的 projects 列表"""
+        with self._lock:
+            for project in projects:
+                project_id = self.create_project(project)
+                for content in project.get("chapters", []):
+                    self.append_chapter(project_id, content)
+
+
+class StoreWriter:
+    """带预写日志的后台写入器
+
+    submit() 把操作追加到 journal.log 并 fsync 后立即返回，后台线程在
+    一段时间没有新修改后（最长 max_delay 秒）合并同一目标的多次修改再写入。
+    全部写入完成后清空日志；异常退出后，下次启动时重放日志。
+    """
+
+    def __init__(self, store, delay=0.5, max_delay=2.0):
+        self.store = store
+        self.journal_path = os.path.join(store.root, "journal.log")
+        self.delay = delay
+        self.max_delay = max_delay
+        self.pending = {}
+        self.last_error = None
+        self._first_pending = None
+        self._last_submit = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # 保证取出与写入的顺序一致，后台线程和 flush() 不会交错
+        self._apply_lock = threading.Lock()
+
+        self.replayed = self.replay()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="novel-store-writer", daemon=True)
+        self._thread.start()
+
+    def replay(self):
+        """重放日志中的操作，返回重放的条数"""
+        ops = []
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        ops.append(json.loads(line))
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半
+                        break
+        except FileNotFoundError:
+            return 0
+        for op in ops:
+            self.store.apply(op)
+        open(self.journal_path, "w").close()
+        return len(ops)
+
+    @staticmethod
+    def op_key(op):
+        """同一个 key 的多次修改只需写入最后一次"""
+        if op["op"] == "put_chapter":
+            return ("chapter", op["id"], op["number"])
+        if op["op"] == "put_summary":
+            return ("summary", op["id"], op["number"])
+        return ("project", op["id"])
+
+    def submit(self, op):
+        """记录一次修改，写入日志后立即返回"""
+        line = json.dumps(op, ensure_ascii=False)
+        with self._lock:
+            self._journal.write(line + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            if op["op"] == "delete_project":
+                for key in [k for k in self.pending if k[1] == op["id"]]:
+                    del self.pending[key]
+            # 保存副本，调用方之后修改原字典不会影响待写内容
+            self.pending[self.op_key(op)] = json.loads(line)
+            now = time.monotonic()
+            self._last_submit = now
+            if self._first_pending is None:
+                self._first_pending = now
+            self._wakeup.notify()
+
+    def _take(self):
+        ops = list(self.pending.values())
+        self.pending = {}
+        self._first_pending = None
+        return ops
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self.pending and not self._closed:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                # 防抖：等到 delay 秒内没有新修改，或距第一次修改已超过 max_delay
+                while self.pending and not self._closed:
+                    deadline = min(self._last_submit + self.delay, self._first_pending + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+            with self._apply_lock:
+                with self._lock:
+                    ops = self._take()
+                if ops:
+                    self._apply(ops)
+
+    def _apply(self, ops):
+        try:
+            for op in ops:
+                self.store.apply(op)
+        except Exception as e:
+            # 写入失败：操作放回队列稍后重试，日志保持不变
+            self.last_error = e
+            with self._lock:
+                for op in ops:
+                    self.pending.setdefault(self.op_key(op), op)
+                now = time.monotonic()
+                self._last_submit = now
+                self._first_pending = now
+            return False
+        self.last_error = None
+        with self._lock:
+            if not self.pending:
+                # 所有修改都已落盘，清空日志
+                self._journal.seek(0)
+                self._journal.truncate()
+        return True
+
+    def flush(self):
+        """立即写入所有待写修改"""
+        with self._apply_lock:
+            with self._lock:
+                ops = self._take()
+            if ops:
+                return self._apply(ops)
+        return True
+
+    def close(self):
+        """写入剩余修改并停止后台线程"""
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+        self._journal.close()
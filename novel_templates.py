@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""提示词模板
+
+模板保存在文本文件中，启动后第一次使用时解析编译，文件修改后自动重新编译。
+内置模板在 novel_templates.txt，项目目录下的 templates.txt 可以按名称覆盖其中
+任意一段。文件格式：
+
+    # 注释
+    [模板名]
+    第一段，{{变量}} 替换为对应的值
+
+    第二段……
+    #end-prefix
+    之后的段落随每次请求变化
+
+- 段落之间以空行分隔；引用了变量但这些变量都为空的段落整段省略；
+- #end-prefix 之前的部分是稳定前缀：同一项目、同一提供商的请求前缀相同，
+  可以命中提供商的提示词缓存（Claude 的 cache_control、OpenAI/Gemini 的
+  自动前缀缓存）。渲染结果为 PromptText，记录前缀长度。
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+BUILTIN_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "novel_templates.txt")
+
+VARIABLE = re.compile(r"\{\{\s*([^{}\s]+)\s*\}\}")
+SECTION = re.compile(r"^\[([^\[\]]+)\]\s*$")
+PREFIX_END = "#end-prefix"
+
+
+class TemplateError(Exception):
+    """模板文件格式错误或渲染时缺少变量"""
+
+
+class PromptText(str):
+    """渲染好的提示词，prefix_length 为稳定前缀的字符数"""
+
+    prefix_length = 0
+
+    @property
+    def prefix(self):
+        return self[:self.prefix_length]
+
+
+class CompiledTemplate:
+    """编译后的模板：段落为 (片段列表, 引用的变量)，片段为字面文本或 (变量名,)"""
+
+    def __init__(self, name, source):
+        self.name = name
+        self.prefix = []
+        self.suffix = []
+        target = self.prefix
+        has_prefix = False
+        paragraph = []
+        for line in source.split("\n") + [""]:
+            if line.strip() == PREFIX_END:
+                self._add(target, paragraph)
+                paragraph = []
+                target = self.suffix
+                has_prefix = True
+            elif line.startswith("#"):
+                continue
+            elif line.strip():
+                paragraph.append(line)
+            else:
+                self._add(target, paragraph)
+                paragraph = []
+        if not has_prefix:
+            # 没有标记时整个模板都是可变部分
+            self.prefix, self.suffix = [], self.prefix
+        self.prefix_variables = tuple(dict.fromkeys(v for _, names in self.prefix for v in names))
+        self._prefix_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _add(target, lines):
+        if not lines:
+            return
+        text = "\n".join(lines)
+        pieces = []
+        position = 0
+        for match in VARIABLE.finditer(text):
+            if match.start() > position:
+                pieces.append(text[position:match.start()])
+            pieces.append((match.group(1),))
+            position = match.end()
+        if position < len(text):
+            pieces.append(text[position:])
+        names = tuple(p[0] for p in pieces if isinstance(p, tuple))
+        target.append((pieces, names))
+
+    def _render(self, paragraphs, values):
+        parts = []
+        for pieces, names in paragraphs:
+            try:
+                if names and not any(values[name] for name in names):
+                    continue
+                parts.append("".join(p if isinstance(p, str) else str(values[p[0]]).strip() for p in pieces))
+            except KeyError as e:
+                raise TemplateError(f"模板 {self.name} 使用了未知变量 {e.args[0]}") from None
+        return "\n\n".join(parts)
+
+    def render(self, values):
+        """按 values 渲染，返回 PromptText；相同前缀变量的前缀只渲染一次"""
+        key = tuple(values.get(name) for name in self.prefix_variables)
+        with self._lock:
+            prefix = self._prefix_cache.get(key)
+            if prefix is not None:
+                self._prefix_cache.move_to_end(key)
+        if prefix is None:
+            prefix = self._render(self.prefix, values)
+            with self._lock:
+                self._prefix_cache[key] = prefix
+                while len(self._prefix_cache) > 32:
+                    self._prefix_cache.popitem(last=False)
+        suffix = self._render(self.suffix, values)
+        if prefix and suffix:
+            prefix += "\n\n"
+        text = PromptText(prefix + suffix)
+        text.prefix_length = len(prefix)
+        return text
+
+
+def parse_templates(source, path="<string>"):
+    """把模板文件解析为 {名称: CompiledTemplate}"""
+    sections = {}
+    name = None
+    lines = []
+    for line in source.splitlines():
+        match = SECTION.match(line)
+        if match:
+            if name is not None:
+                sections[name] = "\n".join(lines)
+            name = match.group(1).strip()
+            lines = []
+        elif name is not None:
+            lines.append(line)
+        elif line.strip() and not line.startswith("#"):
+            raise TemplateError(f"{path}: 第一个 [模板名] 之前不能有内容")
+    if name is not None:
+        sections[name] = "\n".join(lines)
+    return {name: CompiledTemplate(name, text.strip("\n")) for name, text in sections.items()}
+
+
+class TemplateLibrary:
+    """按文件缓存编译好的模板，文件修改后重新编译，线程安全"""
+
+    def __init__(self, builtin_path=BUILTIN_TEMPLATES):
+        self.builtin_path = builtin_path
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _load(self, path):
+        """编译 path 中的模板，不存在时返回 {}"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            templates = parse_templates(f.read(), path)
+        with self._lock:
+            self._files[path] = (mtime, templates)
+        return templates
+
+    def find(self, name, override_path=None):
+        """取得模板，override_path（项目的 templates.txt）中的同名模板优先；没有时返回 None"""
+        if override_path:
+            template = self._load(override_path).get(name)
+            if template is not None:
+                return template
+        return self._load(self.builtin_path).get(name)
+
+    def render(self, name, values, override_path=None):
+        template = self.find(name, override_path)
+        if template is None:
+            raise TemplateError(f"没有名为 {name} 的模板")
+        return template.render(values)